@@ -1,359 +1,274 @@
-import pandas as pd
-import yfinance as yf
+import os
 import numpy as np
-from scipy import stats
 import warnings
-warnings.filterwarnings('ignore')
-
-print("REGIME EXHAUSTION SYSTEM WITH TRANSITION DATES")
-print("=" * 70)
-
-# 1. Get data
-print("Getting SPY data...")
-spy = yf.download('SPY', period='5y', interval='1d')[['Close']]
-
-# 2. Calculate the 4 KS-validated features (20-day window)
-print("\nCalculating KS-validated features...")
-window = 20
-features = []
-
-for i in range(window, len(spy)):
-    returns = np.log(spy['Close'].iloc[i-window:i] / spy['Close'].iloc[i-window:i].shift(1)).dropna()
-    if len(returns) < 10:
-        continue
-    
-    features.append({
-        'Date': spy.index[i],
-        'Close': float(spy['Close'].iloc[i]),
-        'Return': float(returns.sum()),
-        'Skewness': float(returns.skew()),
-        'Kurtosis': float(returns.kurtosis()),
-        'Range': float(returns.max() - returns.min())
-    })
-
-df = pd.DataFrame(features)
-df.set_index('Date', inplace=True)
-
-# 3. Calculate KS-optimized signal
-print("\nCalculating KS-optimized exhaustion signal...")
-
-# KS weights from your validation
-ks_weights = {
-    'Return': 0.2337,
-    'Skewness': 0.2126,
-    'Kurtosis': 0.2122,
-    'Range': 0.2542
-}
-
-# Normalize weights
-total_weight = sum(ks_weights.values())
-for key in ks_weights:
-    ks_weights[key] /= total_weight
-
-# Z-score normalize each feature
-for feature in ['Return', 'Skewness', 'Kurtosis', 'Range']:
-    mean_val = df[feature].mean()
-    std_val = df[feature].std()
-    df[f'{feature}_Z'] = (df[feature] - mean_val) / std_val if std_val > 0 else 0
-
-# Create KS-weighted score
-df['KS_Score'] = 0
-for feature, weight in ks_weights.items():
-    df['KS_Score'] += df[f'{feature}_Z'] * weight * 100
-
-# 4. Better regime detection using 50-day trend
-df['MA_50'] = df['Close'].rolling(50).mean()
-df['MA_20'] = df['Close'].rolling(20).mean()
-df['Trend'] = np.where(df['MA_20'] > df['MA_50'], 1, -1)  # 1 = uptrend, -1 = downtrend
-
-# Find regime change dates
-df['Trend_Change'] = df['Trend'].diff().fillna(0)
-regime_change_dates = df[df['Trend_Change'] != 0].index
-
-# Calculate regime age (FIXED VERSION)
-df['Regime_Age'] = 0
-current_age = 0
-current_trend = df.iloc[0]['Trend']
-
-for i in range(len(df)):
-    if df.iloc[i]['Trend'] != current_trend:
-        current_age = 0
-        current_trend = df.iloc[i]['Trend']
-    else:
-        current_age += 1
-    df.iloc[i, df.columns.get_loc('Regime_Age')] = current_age
-
-# 5. Apply fatigue multiplier
-max_age = df['Regime_Age'].max()
-df['Fatigue_Multiplier'] = 1 + (df['Regime_Age'] / max(1, max_age * 0.5))  # More conservative scaling
-
-# 6. Final exhaustion signal
-df['Exhaustion_Signal'] = df['KS_Score'] * df['Fatigue_Multiplier']
-
-# Normalize signal to 0-100 range
-min_sig = df['Exhaustion_Signal'].min()
-max_sig = df['Exhaustion_Signal'].max()
-df['Signal_0_100'] = 100 * (df['Exhaustion_Signal'] - min_sig) / (max_sig - min_sig)
-
-# 7. Identify exhaustion zones
-print("\nIdentifying exhaustion zones...")
-
-# Dynamic thresholds
-high_exhaustion = df['Signal_0_100'].quantile(0.75)
-very_high_exhaustion = df['Signal_0_100'].quantile(0.90)
-
-df['Exhaustion_Level'] = 'Normal'
-df.loc[df['Signal_0_100'] >= high_exhaustion, 'Exhaustion_Level'] = 'High'
-df.loc[df['Signal_0_100'] >= very_high_exhaustion, 'Exhaustion_Level'] = 'Very High'
-
-# 8. Analyze regime transitions
-print("\n" + "=" * 70)
-print("REGIME TRANSITION HISTORY")
-print("=" * 70)
-
-regime_history = []
-if len(regime_change_dates) > 0:
-    # Start from first date in dataframe
-    start_date = df.index[0]
-    start_trend = df.iloc[0]['Trend']
-    
-    for change_date in regime_change_dates:
-        # Calculate regime from start_date to change_date
-        regime_mask = (df.index >= start_date) & (df.index < change_date)
-        regime_data = df[regime_mask]
-        
-        if len(regime_data) > 0:
-            duration = (change_date - start_date).days
-            avg_exhaustion = regime_data['Signal_0_100'].mean()
-            high_exhaustion_count = len(regime_data[regime_data['Exhaustion_Level'] != 'Normal'])
-            
-            regime_history.append({
-                'start_date': start_date,
-                'end_date': change_date,
-                'duration_days': duration,
-                'trend': 'Uptrend' if start_trend > 0 else 'Downtrend',
-                'avg_exhaustion': avg_exhaustion,
-                'high_exhaustion_periods': high_exhaustion_count,
-                'regime_change_date': change_date
-            })
-        
-        # Update for next regime
-        start_date = change_date
-        start_trend = df.loc[change_date]['Trend']
-    
-    # Last regime (from last change to end)
-    regime_mask = (df.index >= start_date)
-    regime_data = df[regime_mask]
-    if len(regime_data) > 0:
-        duration = (df.index[-1] - start_date).days
-        avg_exhaustion = regime_data['Signal_0_100'].mean()
-        high_exhaustion_count = len(regime_data[regime_data['Exhaustion_Level'] != 'Normal'])
-        
-        regime_history.append({
-            'start_date': start_date,
-            'end_date': df.index[-1],
-            'duration_days': duration,
-            'trend': 'Uptrend' if start_trend > 0 else 'Downtrend',
-            'avg_exhaustion': avg_exhaustion,
-            'high_exhaustion_periods': high_exhaustion_count,
-            'regime_change_date': 'Current'
-        })
-
-print(f"\nFound {len(regime_history)} regime periods:")
-
-for i, regime in enumerate(regime_history):
-    change_info = f"Changed on {regime['regime_change_date'].strftime('%Y-%m-%d')}" if regime['regime_change_date'] != 'Current' else "Still ongoing"
-    
-    print(f"\n{i+1}. {regime['trend']} Regime:")
-    print(f"   • Period: {regime['start_date'].strftime('%Y-%m-%d')} to {regime['end_date'].strftime('%Y-%m-%d')}")
-    print(f"   • Duration: {regime['duration_days']} days")
-    print(f"   • {change_info}")
-    print(f"   • Avg exhaustion score: {regime['avg_exhaustion']:.1f}")
-    print(f"   • High exhaustion periods: {regime['high_exhaustion_periods']}")
-    
-    # Look for exhaustion before regime change
-    if regime['regime_change_date'] != 'Current':
-        # Check last 30 days of regime
-        lookback_start = regime['end_date'] - pd.Timedelta(days=30)
-        if lookback_start < regime['start_date']:
-            lookback_start = regime['start_date']
-        
-        final_period = df.loc[lookback_start:regime['end_date']]
-        high_exhaustion_final = final_period[final_period['Exhaustion_Level'] != 'Normal']
-        
-        if len(high_exhaustion_final) > 0:
-            last_exhaustion = high_exhaustion_final.index[-1]
-            days_before_change = (regime['end_date'] - last_exhaustion).days
-            max_exhaustion = high_exhaustion_final['Signal_0_100'].max()
-            print(f"   • Final exhaustion: {days_before_change} days before change (max: {max_exhaustion:.1f})")
-
-# 9. Find the most exhausted periods WITH REGIME CONTEXT
-print(f"\n" + "=" * 70)
-print("TOP EXHAUSTED PERIODS WITH REGIME CONTEXT")
-print("=" * 70)
-
-top_exhausted = df.nlargest(15, 'Signal_0_100')
-print(f"\n📊 Showing top 15 most exhausted periods:")
-
-for i, (date, row) in enumerate(top_exhausted.iterrows(), 1):
-    # Find which regime this belongs to
-    current_regime = None
-    for regime in regime_history:
-        if regime['start_date'] <= date <= regime['end_date']:
-            current_regime = regime
-            break
-    
-    print(f"\n{i}. {date.date()}")
-    print(f"   • Exhaustion Score: {row['Signal_0_100']:.1f}/100")
-    print(f"   • Regime Age: {row['Regime_Age']} days")
-    print(f"   • Fatigue Multiplier: {row['Fatigue_Multiplier']:.2f}x")
-    print(f"   • KS Score: {row['KS_Score']:.1f}")
-    print(f"   • SPY Price: ${row['Close']:.2f}")
-    
-    if current_regime:
-        print(f"   • Regime: {current_regime['trend']} ({current_regime['start_date'].date()} to {current_regime['end_date'].date()})")
-        
-        # Days until regime change
-        if current_regime['regime_change_date'] != 'Current':
-            days_to_change = (current_regime['end_date'] - date).days
-            if days_to_change > 0:
-                print(f"   • Days until regime change: {days_to_change}")
-    
-    # What happened next?
-    if i < len(df) - 1:
-        next_idx = df.index.get_loc(date) + 1
-        if next_idx < len(df):
-            next_date = df.index[next_idx]
-            next_30d_idx = min(len(df) - 1, next_idx + 30)
-            price_now = row['Close']
-            price_30d = df.iloc[next_30d_idx]['Close']
-            return_30d = (price_30d / price_now - 1) * 100
-            
-            # Check if regime changed within next 60 days
-            lookahead_end = min(len(df) - 1, next_idx + 60)
-            current_regime_trend = row['Trend']
-            regime_changed = False
-            for j in range(next_idx, lookahead_end + 1):
-                if df.iloc[j]['Trend'] != current_regime_trend:
-                    regime_changed = True
-                    change_date = df.index[j]
+from FeatureEngine import compute_features
+from Exhaustion import KS_WEIGHTS, ks_score, add_trend, exhaustion_signal, exhaustion_levels
+from RegimeSegments import regime_age, segment_table, RegimeIndex
+from PriceStore import recent_closes
+from Instrument import Recorder
+from Rules import RuleSet, SETUPS
+from ColumnarExport import ColumnarStore
+
+
+def report(ticker='SPY', years=5, store_dir=None, offline_dir=None, recorder=None,
+           stage_log='stage_timings.jsonl', causal=False, level_window=None,
+           export='csv', export_dir='exports'):
+    """Print the regime exhaustion report for one ticker and export the CSVs.
+
+    Returns (df, regime_table). Prices come from PriceStore.recent_closes.
+    causal=True makes every bar point in time: z-scores, fatigue and the
+    0-100 scaling from expanding statistics, and level thresholds from the
+    earlier bars (expanding, or the last level_window bars) instead of
+    full-sample ones.
+    export='parquet' / 'arrow' appends the new bars and regimes to a
+    columnar dataset in export_dir (ColumnarExport.py) instead of
+    rewriting the CSVs. Only a causal run appends: full-sample scores
+    shift with every new bar, so without causal=True the ticker's
+    dataset is rewritten instead (mode='overwrite').
+    """
+    warnings.filterwarnings('ignore')
+
+    print("REGIME EXHAUSTION SYSTEM WITH TRANSITION DATES")
+    print("=" * 70)
+
+    # Every stage is timed (time, rows, RSS, allocations) and logged as JSON lines
+    if recorder is None:
+        recorder = Recorder(ticker=ticker)
+
+    # 1. Get data
+    print(f"Getting {ticker} data...")
+    # Bars live in a local store and only the new ones get fetched.
+    # Set CHRONOS_OFFLINE_DIR to a folder of <TICKER>.csv files to run with no network.
+    with recorder.stage('fetch') as s:
+        spy = recent_closes(ticker, years=years, root=store_dir, offline_dir=offline_dir)
+        s['rows'] = len(spy)
+
+    # 2. Calculate the 4 KS-validated features (20-day window)
+    print("\nCalculating KS-validated features...")
+    window = 20
+    with recorder.stage('features', rows=len(spy)):
+        df = compute_features(spy['Close'], window=window)
+
+    # 3. Calculate KS-optimized signal
+    print("\nCalculating KS-optimized exhaustion signal...")
+    with recorder.stage('ks_score', rows=len(df)):
+        df = ks_score(df, KS_WEIGHTS, causal=causal)
+
+    # 4. Better regime detection using 50-day trend
+    with recorder.stage('ma_trend', rows=len(df)):
+        df = add_trend(df, fast=20, slow=50)  # 1 = uptrend, -1 = downtrend
+
+    # Calculate regime age (bars since the trend last flipped)
+    with recorder.stage('regime_age', rows=len(df)):
+        df['Regime_Age'] = regime_age(df['Trend'])
+
+    # 5-6. Fatigue multiplier and final exhaustion signal (normalized to 0-100)
+    with recorder.stage('signal', rows=len(df)):
+        df = exhaustion_signal(df, causal=causal)
+
+    # 7. Identify exhaustion zones
+    print("\nIdentifying exhaustion zones...")
+
+    # Dynamic thresholds (75th / 90th percentile)
+    with recorder.stage('levels', rows=len(df)):
+        high_exhaustion, very_high_exhaustion = exhaustion_levels(df, 0.75, 0.90, causal=causal,
+                                                                  window=level_window)
+
+    # 8. Analyze regime transitions
+    print("\n" + "=" * 70)
+    print("REGIME TRANSITION HISTORY")
+    print("=" * 70)
+
+    # One row per regime, built in a single pass over Trend
+    with recorder.stage('regime_history', rows=len(df)):
+        regime_table = segment_table(df, 'Trend', lookback_days=30)
+        regime_table['trend'] = np.where(regime_table['trend'] > 0, 'Uptrend', 'Downtrend')
+        regime_history = regime_table.to_dict('records')
+
+    print(f"\nFound {len(regime_history)} regime periods:")
+
+    for i, regime in enumerate(regime_history):
+        change_info = f"Changed on {regime['end_date'].strftime('%Y-%m-%d')}" if not regime['ongoing'] else "Still ongoing"
+
+        print(f"\n{i+1}. {regime['trend']} Regime:")
+        print(f"   • Period: {regime['start_date'].strftime('%Y-%m-%d')} to {regime['end_date'].strftime('%Y-%m-%d')}")
+        print(f"   • Duration: {regime['duration_days']} days")
+        print(f"   • {change_info}")
+        print(f"   • Avg exhaustion score: {regime['avg_exhaustion']:.1f}")
+        print(f"   • High exhaustion periods: {regime['high_exhaustion_periods']}")
+
+        # Look for exhaustion in the last 30 days before regime change
+        if not regime['ongoing'] and not np.isnan(regime['final_exhaustion_days']):
+            print(f"   • Final exhaustion: {regime['final_exhaustion_days']:.0f} days before change (max: {regime['final_exhaustion_max']:.1f})")
+
+    # 9. Find the most exhausted periods WITH REGIME CONTEXT
+    print(f"\n" + "=" * 70)
+    print("TOP EXHAUSTED PERIODS WITH REGIME CONTEXT")
+    print("=" * 70)
+
+    # Regime, next Trend flip and forward return of every top bar from binary
+    # searches over the regime table (side='left': a boundary date belongs to
+    # the regime that ends there). The old loop measured 30 bars from the next bar.
+    with recorder.stage('top_exhausted', rows=len(df)):
+        top_exhausted = df.nlargest(15, 'Signal_0_100')
+        context = RegimeIndex(regime_table, df).locate(top_exhausted.index, side='left', horizons=[31])
+    print(f"\n📊 Showing top 15 most exhausted periods:")
+
+    for i, (date, row) in enumerate(top_exhausted.iterrows(), 1):
+        where = context.iloc[i - 1]
+        current_regime = regime_history[where['regime']] if where['regime'] >= 0 else None
+
+        print(f"\n{i}. {date.date()}")
+        print(f"   • Exhaustion Score: {row['Signal_0_100']:.1f}/100")
+        print(f"   • Regime Age: {row['Regime_Age']} bars")
+        print(f"   • Fatigue Multiplier: {row['Fatigue_Multiplier']:.2f}x")
+        print(f"   • KS Score: {row['KS_Score']:.1f}")
+        print(f"   • {ticker} Price: ${row['Close']:.2f}")
+
+        if current_regime:
+            print(f"   • Regime: {current_regime['trend']} ({current_regime['start_date'].date()} to {current_regime['end_date'].date()})")
+
+            # Days until regime change
+            if not current_regime['ongoing']:
+                days_to_change = (current_regime['end_date'] - date).days
+                if days_to_change > 0:
+                    print(f"   • Days until regime change: {days_to_change}")
+
+        # What happened next?
+        if i < len(df) - 1:
+            if where['bar'] + 1 < len(df):
+                return_30d = where['fwd_return_31'] * 100
+
+                # Check if regime changed within next 60 days (the old scan covered 61 bars)
+                regime_changed = where['bars_to_change'] <= 61
+                if regime_changed:
+                    change_date = where['change_date']
                     days_to_change = (change_date - date).days
-                    break
-            
-            print(f"   • 30-day forward return: {return_30d:+.1f}%")
-            if regime_changed:
-                print(f"   • Regime changed: YES ({days_to_change} days later on {change_date.date()})")
-            else:
-                print(f"   • Regime changed within 60 days: NO")
-
-# 10. Long regime analysis (for psychology)
-print(f"\n" + "=" * 70)
-print("⏱PSYCHOLOGY: LONG REGIME ANALYSIS")
-print("=" * 70)
-
-long_regimes = [r for r in regime_history if r['duration_days'] > 100]
-print(f"\nFound {len(long_regimes)} regimes longer than 100 days (psychologically significant):")
-
-for i, regime in enumerate(long_regimes, 1):
-    # Get the regime's exhaustion pattern
-    regime_data = df.loc[regime['start_date']:regime['end_date']]
-    high_exhaustion = regime_data[regime_data['Exhaustion_Level'] != 'Normal']
-    
-    # When did exhaustion peaks occur?
-    if len(high_exhaustion) > 0:
-        first_exhaustion = high_exhaustion.index[0]
-        last_exhaustion = high_exhaustion.index[-1]
-        days_to_first = (first_exhaustion - regime['start_date']).days
-        days_to_last = (last_exhaustion - regime['start_date']).days
-        
-        print(f"\n{i}. {regime['trend']} Regime ({regime['duration_days']} days):")
-        print(f"   • Period: {regime['start_date'].date()} to {regime['end_date'].date()}")
-        print(f"   • Exhaustion periods: {len(high_exhaustion)}")
-        print(f"   • First exhaustion: {days_to_first} days into regime")
-        print(f"   • Last exhaustion: {days_to_last} days into regime")
-        
-        if regime['regime_change_date'] != 'Current':
-            days_before_change = (regime['end_date'] - last_exhaustion).days
-            print(f"   • Final exhaustion signal: {days_before_change} days before regime end")
-            
-            # Was the regime change preceded by exhaustion?
-            if days_before_change <= 30:
-                print(f"   • ✅ Exhaustion signaled change in advance")
-            else:
-                print(f"   • ⚠️  Exhaustion signal too early")
-
-# 11. Current market state with regime context
-print(f"\n" + "=" * 70)
-print("CURRENT MARKET STATE")
-print("=" * 70)
-
-latest = df.iloc[-1]
-current_regime = regime_history[-1] if regime_history else None
-
-print(f"\n• Date: {df.index[-1].date()}")
-print(f"• Exhaustion Score: {latest['Signal_0_100']:.1f}/100")
-print(f"• Regime Age: {latest['Regime_Age']} days")
-print(f"• Trend: {'Uptrend' if latest['Trend'] > 0 else 'Downtrend'}")
-print(f"• Exhaustion Level: {latest['Exhaustion_Level']}")
-print(f"• SPY Price: ${latest['Close']:.2f}")
-
-if current_regime:
-    print(f"\nCurrent Regime:")
-    print(f"• Type: {current_regime['trend']}")
-    print(f"• Started: {current_regime['start_date'].date()}")
-    print(f"• Duration: {current_regime['duration_days']} days")
-    print(f"• Avg exhaustion: {current_regime['avg_exhaustion']:.1f}")
-    print(f"• High exhaustion periods: {current_regime['high_exhaustion_periods']}")
-
-# 12. Trading signals based on regime context
-print(f"\n" + "=" * 70)
-print("TRADING SIGNALS BASED ON REGIME")
-print("=" * 70)
-
-print(f"\nSignal thresholds:")
-print(f"• Normal: < {high_exhaustion:.1f}")
-print(f"• High: {high_exhaustion:.1f} - {very_high_exhaustion:.1f}")
-print(f"• Very High: > {very_high_exhaustion:.1f}")
-
-print(f"\nHigh probability setups:")
-print(f"1. Regime > 100 days + Signal > {high_exhaustion:.1f}")
-print(f"2. Regime > 200 days + Signal > {very_high_exhaustion:.1f}")
-print(f"3. Multiple high signals in aging regime")
-
-# Check current signal
-if current_regime and current_regime['duration_days'] > 100:
-    if latest['Signal_0_100'] >= very_high_exhaustion:
-        print(f"\nCURRENT ALERT: Long regime ({current_regime['duration_days']} days) with VERY HIGH exhaustion!")
-    elif latest['Signal_0_100'] >= high_exhaustion:
-        print(f"\nCURRENT WARNING: Long regime ({current_regime['duration_days']} days) with high exhaustion")
+
+                print(f"   • 30-day forward return: {return_30d:+.1f}%")
+                if regime_changed:
+                    print(f"   • Regime changed: YES ({days_to_change} days later on {change_date.date()})")
+                else:
+                    print(f"   • Regime changed within 60 days: NO")
+
+    # 10. Long regime analysis (for psychology)
+    print(f"\n" + "=" * 70)
+    print("⏱PSYCHOLOGY: LONG REGIME ANALYSIS")
+    print("=" * 70)
+
+    long_regimes = [r for r in regime_history if r['duration_days'] > 100]
+    print(f"\nFound {len(long_regimes)} regimes longer than 100 days (psychologically significant):")
+
+    for i, regime in enumerate(long_regimes, 1):
+        # When did exhaustion peaks occur?
+        if regime['exhaustion_periods'] > 0:
+            days_to_first = regime['first_exhaustion_days']
+            days_to_last = regime['last_exhaustion_days']
+
+            print(f"\n{i}. {regime['trend']} Regime ({regime['duration_days']} days):")
+            print(f"   • Period: {regime['start_date'].date()} to {regime['end_date'].date()}")
+            print(f"   • Exhaustion periods: {regime['exhaustion_periods']}")
+            print(f"   • First exhaustion: {days_to_first:.0f} days into regime")
+            print(f"   • Last exhaustion: {days_to_last:.0f} days into regime")
+
+            if not regime['ongoing']:
+                days_before_change = regime['duration_days'] - days_to_last
+                print(f"   • Final exhaustion signal: {days_before_change:.0f} days before regime end")
+
+                # Was the regime change preceded by exhaustion?
+                if days_before_change <= 30:
+                    print(f"   • ✅ Exhaustion signaled change in advance")
+                else:
+                    print(f"   • ⚠️  Exhaustion signal too early")
+
+    # 11. Current market state with regime context
+    print(f"\n" + "=" * 70)
+    print("CURRENT MARKET STATE")
+    print("=" * 70)
+
+    latest = df.iloc[-1]
+    current_regime = regime_history[-1] if regime_history else None
+
+    print(f"\n• Date: {df.index[-1].date()}")
+    print(f"• Exhaustion Score: {latest['Signal_0_100']:.1f}/100")
+    print(f"• Regime Age: {latest['Regime_Age']} bars")
+    print(f"• Trend: {'Uptrend' if latest['Trend'] > 0 else 'Downtrend'}")
+    print(f"• Exhaustion Level: {latest['Exhaustion_Level']}")
+    print(f"• {ticker} Price: ${latest['Close']:.2f}")
+
+    if current_regime:
+        print(f"\nCurrent Regime:")
+        print(f"• Type: {current_regime['trend']}")
+        print(f"• Started: {current_regime['start_date'].date()}")
+        print(f"• Duration: {current_regime['duration_days']} days")
+        print(f"• Avg exhaustion: {current_regime['avg_exhaustion']:.1f}")
+        print(f"• High exhaustion periods: {current_regime['high_exhaustion_periods']}")
+
+    # 12. Trading signals based on regime context
+    print(f"\n" + "=" * 70)
+    print("TRADING SIGNALS BASED ON REGIME")
+    print("=" * 70)
+
+    print(f"\nSignal thresholds:")
+    print(f"• Normal: < {high_exhaustion:.1f}")
+    print(f"• High: {high_exhaustion:.1f} - {very_high_exhaustion:.1f}")
+    print(f"• Very High: > {very_high_exhaustion:.1f}")
+
+    print(f"\nHigh probability setups:")
+    # the setups are rules (Rules.SETUPS); causal runs compare against each bar's own thresholds
+    if causal:
+        levels = {'high': df['High_Threshold'].to_numpy(), 'very_high': df['Very_High_Threshold'].to_numpy()}
+    else:
+        levels = {'high': high_exhaustion, 'very_high': very_high_exhaustion}
+    setups = RuleSet(SETUPS).evaluate(df, params=levels)
+    # Regime_Age is in bars; the alert below goes by the regime's calendar days
+    descriptions = [f"Regime > 100 bars + Signal > {high_exhaustion:.1f}",
+                    f"Regime > 200 bars + Signal > {very_high_exhaustion:.1f}",
+                    f"Regime > 100 bars + Signal > {high_exhaustion:.1f} on 3+ of the last 20 bars"]
+    for i, (name, text) in enumerate(zip(SETUPS, descriptions), 1):
+        fired = setups[name]
+        print(f"{i}. {text} ({fired.sum()} bars{', ACTIVE NOW' if fired.iloc[-1] else ''})")
+
+    # Check current signal
+    if current_regime and current_regime['duration_days'] > 100:
+        if latest['Signal_0_100'] >= very_high_exhaustion:
+            print(f"\nCURRENT ALERT: Long regime ({current_regime['duration_days']} days) with VERY HIGH exhaustion!")
+        elif latest['Signal_0_100'] >= high_exhaustion:
+            print(f"\nCURRENT WARNING: Long regime ({current_regime['duration_days']} days) with high exhaustion")
+        else:
+            print(f"\nCurrent: Long regime but normal exhaustion levels")
     else:
-        print(f"\nCurrent: Long regime but normal exhaustion levels")
-else:
-    print(f"\nCurrent: Normal regime conditions")
-
-# 13. Export for charting
-print(f"\nData exported to CSV...")
-output_df = df[['Close', 'Return', 'KS_Score', 'Regime_Age', 'Fatigue_Multiplier', 
-                'Exhaustion_Signal', 'Signal_0_100', 'Exhaustion_Level', 'Trend']]
-output_df.to_csv('regime_exhaustion_with_transitions.csv')
-
-# Add regime info to export
-regime_info = []
-for regime in regime_history:
-    regime_info.append({
-        'Regime_Start': regime['start_date'],
-        'Regime_End': regime['end_date'],
-        'Regime_Type': regime['trend'],
-        'Duration_Days': regime['duration_days'],
-        'Avg_Exhaustion': regime['avg_exhaustion']
-    })
-
-regime_df = pd.DataFrame(regime_info)
-regime_df.to_csv('regime_history.csv')
-
-print("Analysis complete!")
-print("Files saved: 'regime_exhaustion_with_transitions.csv' and 'regime_history.csv'")
+        print(f"\nCurrent: Normal regime conditions")
+
+    # 13. Export for charting
+    if export != 'csv':
+        # stored rows are never rescaled, so only point in time values can be appended
+        mode = 'append' if causal else 'overwrite'
+        print(f"\nData {'appended to' if causal else 'rewritten in'} the {export} dataset...")
+        with recorder.stage('export', rows=len(df)):
+            added = ColumnarStore(export_dir, fmt=export).export(ticker, df, regime_table, mode=mode)
+        print("Analysis complete!")
+        print(f"{'Appended' if causal else 'Wrote'} {added['bars']} bars and {added['regimes']} "
+              f"closed regimes to '{export_dir}'")
+    else:
+        print(f"\nData exported to CSV...")
+        with recorder.stage('export', rows=len(df)):
+            output_df = df[['Close', 'Return', 'KS_Score', 'Regime_Age', 'Fatigue_Multiplier', 
+                            'Exhaustion_Signal', 'Signal_0_100', 'Exhaustion_Level', 'Trend']]
+            output_df.to_csv('regime_exhaustion_with_transitions.csv')
+
+            # Add regime info to export
+            regime_df = regime_table[['start_date', 'end_date', 'trend', 'duration_days', 'avg_exhaustion']]
+            regime_df.columns = ['Regime_Start', 'Regime_End', 'Regime_Type', 'Duration_Days', 'Avg_Exhaustion']
+            regime_df.to_csv('regime_history.csv')
+
+        print("Analysis complete!")
+        print("Files saved: 'regime_exhaustion_with_transitions.csv' and 'regime_history.csv'")
 
+    if stage_log:
+        recorder.dump(stage_log)
+        print(f"Stage timings appended to '{stage_log}'")
+    return df, regime_table
 
 """
 Now basically this code is trying to print out regime transitions using
@@ -379,4 +294,16 @@ such as geopolitical events or sudden economic shifts. Instead,
 it predicts that the market will suffer a market regime change
 in case of any sudden news due to an accumulation of exhaustion
 in the system
-"""
\ No newline at end of file
+"""
+
+
+if __name__ == '__main__':
+    # CHRONOS_PROFILE / CHRONOS_SAMPLE = comma separated stages to cProfile / sample ('*' = all)
+    report(recorder=Recorder(
+        ticker='SPY',
+        profile=[s for s in os.environ.get('CHRONOS_PROFILE', '').split(',') if s],
+        sample=[s for s in os.environ.get('CHRONOS_SAMPLE', '').split(',') if s],
+        profile_dir=os.environ.get('CHRONOS_PROFILE_DIR')),
+        stage_log=os.environ.get('CHRONOS_STAGE_LOG', 'stage_timings.jsonl'),
+        export=os.environ.get('CHRONOS_EXPORT', 'csv'),
+        export_dir=os.environ.get('CHRONOS_EXPORT_DIR', 'exports'))
@@ -0,0 +1,433 @@
+"""
+Concurrent bar downloads for many tickers, streamed into the PriceStore.
+
+YahooSource fetches one symbol per blocking yf.download call, so a few
+thousand symbols take most of the pre-market window. This does the same
+over plain HTTP with asyncio (standard library only):
+
+* at most `concurrency` requests in flight,
+* a token bucket caps the request rate (with bursts),
+* 429 / 5xx / dropped connections are retried with exponential backoff
+  and jitter (Retry-After is honoured),
+* keep-alive HTTP/1.1 connections are pooled and reused per host,
+* every ticker is topped up in the store as soon as its bars land
+  (PriceStore.top_up: the last bar replaced, a re-adjusted history rewritten).
+
+Two response formats are understood: CSV with a date column first (what
+MockPriceServer serves) and Yahoo's v8 chart JSON. MockPriceServer is a
+local stand-in that serves canned bars, optionally slow or flaky, so the
+whole thing can be exercised offline.
+
+    with MockPriceServer('data/') as server:
+        fetcher = AsyncFetcher(server.url, concurrency=16, rate=50)
+        report = refresh(PriceStore('price_store'), ['SPY', 'QQQ'], fetcher)
+"""
+
+import asyncio
+import io
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote
+
+import pandas as pd
+
+from PriceStore import COLUMNS, _clean_bars
+
+CSV_PATH = '/bars/{ticker}.csv?start={start}'
+YAHOO_URL = 'https://query1.finance.yahoo.com'
+YAHOO_PATH = '/v8/finance/chart/{ticker}?interval=1d&period1={period1}&period2={period2}'
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved up. take() waits for one."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.stamp = None
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.stamp is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# HTTP/1.1 over asyncio streams
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        parts = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # trailers up to the blank line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(parts)
+            parts.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections to one host, reused across requests."""
+
+    def __init__(self, base_url, size=8, timeout=30.0, user_agent='chronos-fetch/1.0'):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.idle = []
+        self.opened = 0
+
+    async def _connect(self):
+        context = ssl.create_default_context() if self.tls else None
+        self.opened += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context), self.timeout)
+
+    async def get(self, path):
+        """(status, headers, body) of one GET; a stale pooled connection is retried once fresh."""
+        for attempt in range(2):
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await self._connect()
+            try:
+                return await asyncio.wait_for(self._request(reader, writer, path), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                # the server may have dropped an idle connection, try one new one
+                if not reused or attempt:
+                    raise FetchError(f'connection failed: {e!r}') from e
+            except BaseException:
+                writer.close()
+                raise
+
+    async def _request(self, reader, writer, path):
+        request = (f'GET {self.prefix}{path} HTTP/1.1\r\n'
+                   f'Host: {self.host}\r\n'
+                   f'User-Agent: {self.user_agent}\r\n'
+                   'Accept-Encoding: identity\r\n'
+                   'Connection: keep-alive\r\n\r\n')
+        writer.write(request.encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('empty response')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        body = await _read_body(reader, headers)
+
+        if headers.get('connection', '').lower() == 'close' or len(self.idle) >= self.size:
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, headers, body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+def parse_csv(body):
+    if not body.strip():
+        return pd.DataFrame(columns=COLUMNS, dtype='float64')
+    return _clean_bars(pd.read_csv(io.BytesIO(body), index_col=0, parse_dates=True))
+
+
+def parse_yahoo_chart(body):
+    result = json.loads(body)['chart']['result']
+    if not result or not result[0].get('timestamp'):
+        return pd.DataFrame(columns=COLUMNS, dtype='float64')
+    result = result[0]
+    quote_ = result['indicators']['quote'][0]
+    index = pd.to_datetime(result['timestamp'], unit='s').normalize()
+    bars = pd.DataFrame({c: quote_.get(c.lower()) for c in COLUMNS}, index=index)
+    adjusted = result['indicators'].get('adjclose')
+    if adjusted:
+        # same as yf.download(auto_adjust=True): scale OHLC by adjclose / close
+        factor = pd.Series(adjusted[0]['adjclose'], index=index) / bars['Close']
+        for c in ('Open', 'High', 'Low', 'Close'):
+            bars[c] = bars[c] * factor
+    return _clean_bars(bars)
+
+
+class AsyncFetcher:
+    """Downloads bars for many tickers concurrently.
+
+    `path` is formatted with ticker, start (YYYY-MM-DD or '') and
+    period1/period2 (unix seconds) for APIs that want a range. fmt is
+    'csv' or 'yahoo' (v8 chart JSON).
+    """
+
+    def __init__(self, base_url, path=CSV_PATH, fmt='csv', concurrency=8, rate=10.0,
+                 burst=None, retries=4, backoff=0.5, timeout=30.0, history_days=5 * 366):
+        self.base_url = base_url
+        self.path = path
+        self.parse = parse_yahoo_chart if fmt == 'yahoo' else parse_csv
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.history_days = history_days
+        self.stats = {'requests': 0, 'retries': 0, 'connections': 0}
+
+    def _path(self, ticker, start):
+        end = pd.Timestamp.now(tz='UTC').normalize() + pd.Timedelta(days=1)
+        first = pd.Timestamp(start, tz='UTC') if start is not None \
+            else end - pd.Timedelta(days=self.history_days)
+        return self.path.format(ticker=quote(ticker), start='' if start is None else str(start),
+                                period1=int(first.timestamp()), period2=int(end.timestamp()))
+
+    async def _fetch(self, pool, bucket, limit, ticker, start):
+        path = self._path(ticker, start)
+        async with limit:
+            for attempt in range(self.retries + 1):
+                await bucket.take()
+                self.stats['requests'] += 1
+                try:
+                    status, headers, body = await pool.get(path)
+                    if status == 200:
+                        return self.parse(body)
+                    if status == 404:
+                        # unknown ticker: an error, not "nothing new"
+                        raise FetchError(f'HTTP 404: {ticker} not found', status)
+                    retry_after = headers.get('retry-after')
+                    error = FetchError(f'HTTP {status}', status,
+                                       float(retry_after) if retry_after else None)
+                    if status not in RETRY_STATUS:
+                        raise error
+                except (FetchError, asyncio.TimeoutError, OSError) as e:
+                    error = e if isinstance(e, FetchError) else FetchError(repr(e))
+                    if error.status is not None and error.status not in RETRY_STATUS:
+                        raise error
+                if attempt == self.retries:
+                    raise error
+                self.stats['retries'] += 1
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                await asyncio.sleep(max(delay, error.retry_after or 0))
+
+    async def stream(self, tickers, starts=None):
+        """Async iterator of (ticker, bars or exception) in completion order."""
+        starts = starts or {}
+        pool = ConnectionPool(self.base_url, size=self.concurrency, timeout=self.timeout)
+        bucket = TokenBucket(self.rate, self.burst)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(ticker):
+            try:
+                return ticker, await self._fetch(pool, bucket, limit, ticker, starts.get(ticker))
+            except Exception as e:
+                return ticker, e
+
+        tasks = [asyncio.ensure_future(one(t)) for t in tickers]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.stats['connections'] += pool.opened
+            pool.close()
+
+    def fetch_all(self, tickers, starts=None):
+        """{ticker: bars or exception}, blocking."""
+        async def collect():
+            return {t: bars async for t, bars in self.stream(tickers, starts)}
+        return asyncio.run(collect())
+
+
+async def refresh_async(store, tickers, fetcher, on_result=None):
+    # from a few bars before the last stored one, see PriceStore.top_up
+    starts = {}
+    for ticker in tickers:
+        start = store.refetch_start(ticker)
+        if start is not None:
+            starts[ticker] = start
+    report = {}
+    readjusted = {}
+    async for ticker, bars in fetcher.stream(tickers, starts):
+        if isinstance(bars, Exception):
+            report[ticker] = {'added': 0, 'error': str(bars)}
+        else:
+            # appends are small and local, so they run right here between downloads
+            added = store.top_up(ticker, bars)
+            if added is None:
+                # history re-adjusted at the source, fetched again in full below
+                readjusted[ticker] = store.read(ticker).index[0].date()
+                continue
+            report[ticker] = {'added': added, 'error': None}
+        if on_result is not None:
+            on_result(ticker, report[ticker])
+    if readjusted:
+        async for ticker, bars in fetcher.stream(list(readjusted), readjusted):
+            if isinstance(bars, Exception):
+                report[ticker] = {'added': 0, 'error': str(bars)}
+            else:
+                before = store.rows(ticker)
+                store.rewrite(ticker, bars)
+                report[ticker] = {'added': store.rows(ticker) - before, 'error': None,
+                                  'rewritten': True}
+            if on_result is not None:
+                on_result(ticker, report[ticker])
+    return report
+
+
+def refresh(store, tickers, fetcher, on_result=None):
+    """Top up every ticker in the store, writing each one as it lands.
+
+    The last stored bar is replaced, and a ticker whose history the source
+    has re-adjusted is fetched again in full and rewritten ('rewritten':
+    True). Returns {ticker: {'added': rows, 'error': message or None}}.
+    """
+    return asyncio.run(refresh_async(store, tickers, fetcher, on_result))
+
+
+class MockPriceServer:
+    """Local HTTP server with canned bars, for tests and offline runs.
+
+    `bars` is a folder of <TICKER>.csv files or a {ticker: DataFrame} dict.
+    Serves /bars/<TICKER>.csv?start=YYYY-MM-DD (CSV) and
+    /v8/finance/chart/<TICKER>?period1=..&period2=.. (Yahoo style JSON).
+    fail_first=n answers the first n requests of every ticker with 503,
+    latency adds a delay per request. Keep-alive like a real API.
+    """
+
+    def __init__(self, bars, host='127.0.0.1', port=0, latency=0.0, fail_first=0):
+        self.bars = bars
+        self.latency = latency
+        self.fail_first = fail_first
+        self.hits = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _frame(self, ticker):
+        if isinstance(self.bars, dict):
+            frame = self.bars.get(ticker)
+            return None if frame is None else _clean_bars(frame)
+        path = os.path.join(self.bars, f'{ticker}.csv')
+        if not os.path.exists(path):
+            return None
+        return _clean_bars(pd.read_csv(path, index_col=0, parse_dates=True))
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with mock.lock:
+                    mock.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, kind='text/plain'):
+                self.send_response(status)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                if status == 503:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                if parts.path.startswith('/bars/') and parts.path.endswith('.csv'):
+                    ticker, kind = parts.path[len('/bars/'):-len('.csv')], 'csv'
+                elif parts.path.startswith('/v8/finance/chart/'):
+                    ticker, kind = parts.path[len('/v8/finance/chart/'):], 'yahoo'
+                else:
+                    return self._send(404, b'not found')
+
+                with mock.lock:
+                    seen = mock.hits[ticker] = mock.hits.get(ticker, 0) + 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if seen <= mock.fail_first:
+                    return self._send(503, b'busy')
+                frame = mock._frame(ticker)
+                if frame is None:
+                    return self._send(404, b'unknown ticker')
+
+                if kind == 'csv':
+                    start = query.get('start', [''])[0]
+                    if start:
+                        frame = frame[frame.index >= pd.Timestamp(start)]
+                    return self._send(200, frame.rename_axis('Date').to_csv().encode(), 'text/csv')
+
+                lo = pd.to_datetime(int(query.get('period1', ['0'])[0]), unit='s')
+                hi = pd.to_datetime(int(query.get('period2', [str(2 ** 40)])[0]), unit='s')
+                frame = frame[(frame.index >= lo) & (frame.index < hi)]
+                quote_ = {c.lower(): frame[c].tolist() for c in frame.columns}
+                body = {'chart': {'result': [{
+                    'timestamp': (frame.index.asi8 // 10 ** 9).tolist(),
+                    'indicators': {'quote': [quote_]},
+                }], 'error': None}}
+                return self._send(200, json.dumps(body).encode(), 'application/json')
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
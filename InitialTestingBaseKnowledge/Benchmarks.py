@@ -0,0 +1,205 @@
+"""
+Benchmarks for every stage of the exhaustion pipeline in
+2ClassificationOfRegimes.py, on synthetic series from 1k to 10M bars.
+
+Each stage runs on the same fixed-seed regime-switching GBM (Synthetic.py),
+so numbers are comparable across commits and machines. For every size and
+stage it records the best wall time over a few repeats, the peak traced
+memory of one extra run and the throughput in bars/s, and appends them as
+JSON lines (tagged with the git commit) to a results file. Fully offline.
+
+    python Benchmarks.py                           # default sizes
+    python Benchmarks.py --sizes 1000 100000 --repeat 5
+    python Benchmarks.py --compare 3bfca4c 131766d   # two commits in --results
+    python Benchmarks.py --compare old.jsonl new.jsonl
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from Exhaustion import KS_WEIGHTS, ks_score, add_trend, exhaustion_signal, exhaustion_levels
+from FeatureEngine import compute_features
+from RegimeSegments import regime_age, segment_table, RegimeIndex
+from Synthetic import regime_switching_gbm
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+RESULTS = 'bench_results.jsonl'
+
+
+# each stage takes the state dict, does its work and stores what later stages need
+
+def stage_features(state):
+    state['df'] = compute_features(state['prices']['Close'], window=20)
+
+
+def stage_zscore(state):
+    state['df'] = ks_score(state['df'], KS_WEIGHTS)
+
+
+def stage_trend(state):
+    state['df'] = add_trend(state['df'], fast=20, slow=50)
+
+
+def stage_regime_age(state):
+    state['df']['Regime_Age'] = regime_age(state['df']['Trend'])
+
+
+def stage_signal(state):
+    df = exhaustion_signal(state['df'])
+    state['thresholds'] = exhaustion_levels(df, 0.75, 0.90)
+    state['df'] = df
+
+
+def stage_regime_history(state):
+    state['regimes'] = segment_table(state['df'], 'Trend', lookback_days=30)
+
+
+def stage_top_exhausted(state):
+    # the data side of step 9: top 15 bars, their regime and what happened next
+    df = state['df']
+    signal = df['Signal_0_100'].to_numpy()
+    top = np.argpartition(-signal, min(15, len(df) - 1))[:15]
+    top = top[np.argsort(-signal[top], kind='stable')]
+    index = RegimeIndex(state['regimes'], df)
+    state['top'] = index.locate(df.index[top], side='left', horizons=[31])
+
+
+def stage_export(state):
+    out = state['tmpdir']
+    columns = ['Close', 'Return', 'KS_Score', 'Regime_Age', 'Fatigue_Multiplier',
+               'Exhaustion_Signal', 'Signal_0_100', 'Exhaustion_Level', 'Trend']
+    state['df'][columns].to_csv(os.path.join(out, 'regime_exhaustion_with_transitions.csv'))
+    state['regimes'].to_csv(os.path.join(out, 'regime_history.csv'))
+
+
+STAGES = [
+    ('features', stage_features),
+    ('zscore', stage_zscore),
+    ('ma_trend', stage_trend),
+    ('regime_age', stage_regime_age),
+    ('signal', stage_signal),
+    ('regime_history', stage_regime_history),
+    ('top_exhausted', stage_top_exhausted),
+    ('csv_export', stage_export),
+]
+
+
+def _fresh(state):
+    # stages write into df, so every timed run gets its own copy
+    copy = dict(state)
+    if 'df' in copy:
+        copy['df'] = copy['df'].copy()
+    return copy
+
+
+def _commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes=SIZES, repeat=3, seed=0, stages=None, results=RESULTS, export_max=100_000):
+    commit = _commit()
+    meta = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    wanted = set(stages) if stages else None
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in sizes:
+            state = {'prices': regime_switching_gbm(n, seed=seed, freq='min'), 'tmpdir': tmpdir}
+            for name, func in STAGES:
+                skip = (wanted is not None and name not in wanted) or \
+                    (name == 'csv_export' and n > export_max)
+                if not skip:
+                    best = float('inf')
+                    for _ in range(repeat):
+                        trial = _fresh(state)
+                        start = time.perf_counter()
+                        func(trial)
+                        best = min(best, time.perf_counter() - start)
+
+                    trial = _fresh(state)
+                    tracemalloc.start()
+                    func(trial)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+                    row = dict(meta, size=n, stage=name, seconds=best, peak_bytes=peak,
+                               bars_per_s=n / best if best > 0 else float('inf'))
+                    rows.append(row)
+                    print(f"{n:>10,} bars  {name:<15} {best * 1000:10.2f} ms  "
+                          f"{peak / 2**20:9.1f} MiB  {row['bars_per_s']:14,.0f} bars/s")
+                # later stages need this one's output whether or not it was timed
+                func(state)
+
+    if results:
+        with open(results, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+    return pd.DataFrame(rows)
+
+
+def compare(old, new, results=RESULTS):
+    """Side by side seconds per (size, stage) for two runs.
+
+    Each side is a results file (all of it) or a commit, matched by prefix
+    against the 'commit' column of `results`.
+    """
+    def load(key):
+        if os.path.isfile(key):
+            df = pd.read_json(key, lines=True)
+        else:
+            # hashes like 0123456 must not come back as numbers
+            df = pd.read_json(results, lines=True, dtype={'commit': str})
+            df = df[df['commit'].str.startswith(key)]
+            if df.empty:
+                raise ValueError(f'no rows for commit {key} in {results}')
+        return df.groupby(['size', 'stage'])['seconds'].min()
+
+    a, b = load(old), load(new)
+    table = pd.DataFrame({'old_s': a, 'new_s': b}).dropna()
+    table['speedup'] = table['old_s'] / table['new_s']
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=[s for s, _ in STAGES])
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--export-max', type=int, default=100_000,
+                        help='skip the CSV export stage above this many bars')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='two commits in --results, or two results files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print(compare(*args.compare, results=args.results).to_string())
+        return
+    run(args.sizes, repeat=args.repeat, seed=args.seed, stages=args.stages, results=args.results,
+        export_max=args.export_max)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
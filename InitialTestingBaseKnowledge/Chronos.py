@@ -0,0 +1,194 @@
+"""
+Command line entry point for the regime / exhaustion tools.
+
+    python Chronos.py report SPY --offline data/
+    python Chronos.py state SPY QQQ IWM
+    python Chronos.py screen SPY QQQ IWM --workers 4 --stage-log stages.jsonl
+    python Chronos.py refresh SPY QQQ IWM --url http://localhost:8000 --concurrency 16
+    python Chronos.py kurtosis SPY
+    python Chronos.py bench --sizes 1000 100000
+    python Chronos.py simulate --paths 10000 --workers 4
+
+Schedulers call this thousands of times, so only argparse is imported up
+front. Each command imports what it needs when it runs: numpy / pandas
+with the pipeline modules, scipy only for the kurtosis analysis and
+yfinance only when bars actually have to be downloaded.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+
+
+def _stages(text):
+    return [s for s in (text or '').split(',') if s]
+
+
+def cmd_report(args):
+    from Instrument import Recorder
+
+    script = importlib.import_module('2ClassificationOfRegimes')
+    recorder = Recorder(ticker=args.ticker, profile=_stages(args.profile),
+                        sample=_stages(args.sample), profile_dir=args.profile_dir)
+    script.report(args.ticker, years=args.years, store_dir=args.store,
+                  offline_dir=args.offline, recorder=recorder, stage_log=args.stage_log,
+                  causal=args.causal or args.level_window is not None, level_window=args.level_window,
+                  export=args.export, export_dir=args.export_dir)
+
+
+def cmd_kurtosis(args):
+    from FeatureCache import FeatureCache, research_frame
+    from PriceStore import recent_closes
+
+    script = importlib.import_module('3Kurtosis')
+    close = recent_closes(args.ticker, years=args.years, root=args.store, offline_dir=args.offline)
+    cache = False if args.no_cache else FeatureCache(args.cache, args.cache_budget)
+    script.analyze(research_frame(close['Close'], args.ticker, cache=cache))
+
+
+def cmd_state(args):
+    from Pipeline import run_pipeline, latest_state
+    from PriceStore import recent_closes
+
+    for ticker in args.tickers:
+        close = recent_closes(ticker, years=args.years, root=args.store, offline_dir=args.offline)
+        df, regimes, _ = run_pipeline(close['Close'])
+        print(json.dumps(dict(latest_state(df, regimes), Ticker=ticker), default=str))
+
+
+def cmd_screen(args):
+    from Instrument import Recorder
+    from PriceStore import PriceStore, YahooSource, FileSource
+    from Universe import screen
+
+    store = PriceStore(args.store or os.environ.get('CHRONOS_STORE', 'price_store'))
+    offline = args.offline or os.environ.get('CHRONOS_OFFLINE_DIR')
+    source = FileSource(offline) if offline else YahooSource()
+    recorder = None
+    if args.stage_log or args.profile or args.sample:
+        recorder = Recorder(profile=_stages(args.profile), sample=_stages(args.sample),
+                            profile_dir=args.profile_dir)
+    summary = screen(args.tickers, store, source=source, workers=args.workers,
+                     start=args.start, output=args.output, full_output=args.full_output,
+                     recorder=recorder, stage_log=args.stage_log, compact=args.compact)
+    print(summary.to_string())
+
+
+def cmd_refresh(args):
+    from AsyncFetch import AsyncFetcher, CSV_PATH, YAHOO_PATH, YAHOO_URL, refresh
+    from PriceStore import PriceStore
+
+    store = PriceStore(args.store or os.environ.get('CHRONOS_STORE', 'price_store'))
+    yahoo = args.format == 'yahoo'
+    fetcher = AsyncFetcher(args.url or YAHOO_URL, path=YAHOO_PATH if yahoo else CSV_PATH,
+                           fmt=args.format, concurrency=args.concurrency, rate=args.rate,
+                           retries=args.retries)
+
+    def show(ticker, result):
+        print(json.dumps(dict(result, Ticker=ticker)))
+
+    report = refresh(store, args.tickers, fetcher, on_result=show)
+    failed = sum(1 for r in report.values() if r['error'])
+    print(f'{len(report) - failed} updated, {failed} failed, stats {fetcher.stats}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_bench(args):
+    from Benchmarks import main as bench
+
+    bench(args.rest)
+
+
+def cmd_simulate(args):
+    from MonteCarlo import main as simulate
+
+    simulate(args.rest)
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='chronos', description=__doc__.split('\n\n')[0])
+    sub = p.add_subparsers(dest='command', required=True)
+
+    def data_args(q):
+        q.add_argument('--years', type=int, default=5)
+        q.add_argument('--store', help='price store folder (default $CHRONOS_STORE or price_store)')
+        q.add_argument('--offline', help='folder of <TICKER>.csv files, no downloads')
+
+    def profile_args(q):
+        q.add_argument('--profile', help="comma separated stages to cProfile ('*' = all)")
+        q.add_argument('--sample', help='comma separated stages to sample')
+        q.add_argument('--profile-dir', help='write .prof files here')
+
+    q = sub.add_parser('report', help='full exhaustion report for one ticker (old script 2)')
+    q.add_argument('ticker', nargs='?', default='SPY')
+    data_args(q)
+    profile_args(q)
+    q.add_argument('--stage-log', default='stage_timings.jsonl')
+    q.add_argument('--causal', action='store_true', help='point-in-time (expanding) scores and level thresholds')
+    q.add_argument('--level-window', type=int, help='rolling window in bars for causal thresholds')
+    q.add_argument('--export', choices=['csv', 'parquet', 'arrow'], default='csv',
+                   help='parquet / arrow: a columnar dataset instead of the CSVs '
+                        '(appended with --causal, rewritten without)')
+    q.add_argument('--export-dir', default='exports')
+    q.set_defaults(func=cmd_report)
+
+    q = sub.add_parser('kurtosis', help='skew/kurtosis around GMM regime changes (old script 3)')
+    q.add_argument('ticker', nargs='?', default='SPY')
+    data_args(q)
+    q.add_argument('--cache', help='feature / GMM cache folder (default $CHRONOS_CACHE or feature_cache)')
+    q.add_argument('--cache-budget', type=int, help='cache size limit in bytes (default 2 GB)')
+    q.add_argument('--no-cache', action='store_true', help='recompute everything, touch no cache')
+    q.set_defaults(func=cmd_kurtosis)
+
+    q = sub.add_parser('state', help='latest exhaustion state per ticker as JSON lines')
+    q.add_argument('tickers', nargs='+')
+    data_args(q)
+    q.set_defaults(func=cmd_state)
+
+    q = sub.add_parser('screen', help='universe screen into one CSV')
+    q.add_argument('tickers', nargs='+')
+    q.add_argument('--store')
+    q.add_argument('--offline')
+    q.add_argument('--start')
+    q.add_argument('--workers', type=int)
+    q.add_argument('--output', default='universe_exhaustion.csv')
+    q.add_argument('--full-output')
+    q.add_argument('--compact', action='store_true', help='lean float32 / int8 per-bar frames')
+    q.add_argument('--stage-log')
+    profile_args(q)
+    q.set_defaults(func=cmd_screen)
+
+    q = sub.add_parser('refresh', help='download new bars for many tickers concurrently')
+    q.add_argument('tickers', nargs='+')
+    q.add_argument('--store')
+    q.add_argument('--url', help='base URL of the price API (default Yahoo chart API)')
+    q.add_argument('--format', choices=['csv', 'yahoo'], default='yahoo')
+    q.add_argument('--concurrency', type=int, default=8)
+    q.add_argument('--rate', type=float, default=10.0, help='requests per second')
+    q.add_argument('--retries', type=int, default=4)
+    q.set_defaults(func=cmd_refresh)
+
+    q = sub.add_parser('bench', help='stage benchmarks, remaining args go to Benchmarks.py',
+                       add_help=False)
+    q.set_defaults(func=cmd_bench)
+
+    q = sub.add_parser('simulate', help='Monte Carlo detector study, remaining args go to MonteCarlo.py',
+                       add_help=False)
+    q.set_defaults(func=cmd_simulate)
+    return p
+
+
+def main(argv=None):
+    p = parser()
+    args, rest = p.parse_known_args(argv)
+    if args.func in (cmd_bench, cmd_simulate):
+        args.rest = rest
+    elif rest:
+        p.error(f"unrecognized arguments: {' '.join(rest)}")
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Columnar export of the exhaustion frame and the regime table (Parquet or Arrow IPC).
+
+Step 13 of 2ClassificationOfRegimes.py rewrites the whole history as CSV
+text on every run, with Exhaustion_Level spelled out on every row. Here
+the same data goes into a dataset partitioned by ticker and year:
+
+    <root>/bars/Ticker=SPY/year=2024/part-20240102-20241231.parquet
+    <root>/regimes/Ticker=SPY/year=2024/part-....parquet
+    <root>/regimes/Ticker=SPY/current.parquet      (the ongoing regime)
+
+* columns are typed: float64 prices / scores, int8 Trend, int32 ages and
+  Exhaustion_Level as a dictionary column (int8 codes + 3 strings)
+* appends only: each run writes the bars after the last stored one (and
+  the regimes that closed since) as a new part; the ongoing regime is
+  the one file that gets rewritten. A per-ticker _meta.json, written
+  last, says how far the data goes and lists the part files. Parts it
+  doesn't list (from a run that died before saving it) are removed
+  before anything new is written, so the next run's parts, which cover
+  the same bars again, are never read next to them.
+* readers take just the columns / tickers / dates they want; files are
+  memory mapped and whole partitions are skipped on Ticker and year.
+  fmt='arrow' writes uncompressed Arrow IPC, which maps with no decoding.
+
+Rows already stored are not touched again. The full-sample scaling of
+Signal_0_100 moves old values a little with every new bar, so either run
+causal (point-in-time scores and levels) or export with mode='overwrite'
+(2ClassificationOfRegimes.report does the latter for non-causal runs).
+
+pyarrow is only imported when the store is used.
+
+    store = ColumnarStore('exports')
+    store.export('SPY', df, regime_table)
+    recent = store.read_bars(['SPY'], columns=['Close', 'Signal_0_100'], start='2024-01-01')
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+BAR_COLUMNS = ['Close', 'Return', 'KS_Score', 'Regime_Age', 'Fatigue_Multiplier',
+               'Exhaustion_Signal', 'Signal_0_100', 'Exhaustion_Level', 'Trend']
+REGIME_DROP = ['start_pos', 'end_pos']    # positions in one run's frame, meaningless later
+LEVELS = ['Normal', 'High', 'Very High']
+
+# integer columns that fit a narrower type than int64
+NARROW = {'Trend': 'int8', 'trend': 'int8', 'Regime_Age': 'int32', 'bars': 'int32',
+          'duration_days': 'int32', 'high_exhaustion_periods': 'int32',
+          'exhaustion_periods': 'int32'}
+
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError('ColumnarExport needs pyarrow (pip install pyarrow)') from e
+    return pa
+
+
+def _to_arrow(pa, df, index):
+    """Table with explicit, narrow types; the index becomes column `index`."""
+    names = [index]
+    arrays = [pa.array(df.index.to_numpy().astype('datetime64[ns]'), pa.timestamp('ns'))]
+    for col in df.columns:
+        values = df[col]
+        kind = values.dtype.kind
+        if col == 'Exhaustion_Level':
+            codes = pd.Categorical(values, categories=LEVELS).codes.astype('int8')
+            array = pa.DictionaryArray.from_arrays(pa.array(codes, pa.int8(), mask=codes < 0),
+                                                   pa.array(LEVELS, pa.string()))
+        elif kind == 'M':
+            array = pa.array(values.to_numpy().astype('datetime64[ns]'), pa.timestamp('ns'))
+        elif kind == 'b':
+            array = pa.array(values.to_numpy(), pa.bool_())
+        elif kind in 'iu':
+            array = pa.array(values.to_numpy().astype(NARROW.get(col, 'int64')))
+        elif kind == 'f':
+            array = pa.array(values.to_numpy('float64'), pa.float64())
+        else:
+            array = pa.array(values.astype(str).to_numpy(), pa.string())
+        names.append(col)
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+class ColumnarStore:
+    """Ticker / year partitioned Parquet (fmt='parquet') or Arrow IPC (fmt='arrow') dataset."""
+
+    def __init__(self, root, fmt='parquet', compression='zstd'):
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"fmt must be one of {sorted(EXTENSIONS)}, not {fmt!r}")
+        self.root = root
+        self.fmt = fmt
+        self.ext = EXTENSIONS[fmt]
+        self.compression = compression
+
+    def _folder(self, table, ticker):
+        return os.path.join(self.root, table, f'Ticker={ticker.upper()}')
+
+    def _meta(self, table, ticker):
+        path = os.path.join(self._folder(table, ticker), '_meta.json')
+        if not os.path.exists(path):
+            return {'rows': 0, 'last': None, 'parts': 0, 'files': []}
+        with open(path) as f:
+            meta = json.load(f)
+        if 'files' not in meta:
+            # written before the part list was kept, take the parts as they are
+            meta['files'] = self._part_files(table, ticker)
+        return meta
+
+    def _part_files(self, table, ticker):
+        # year=YYYY/part-... paths relative to the ticker folder
+        folder = self._folder(table, ticker)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(d, p) for d in os.listdir(folder) if d.startswith('year=')
+                      for p in os.listdir(os.path.join(folder, d))
+                      if p.startswith('part-') and p.endswith(self.ext))
+
+    def _remove_orphans(self, table, ticker, meta):
+        # parts of a run that died before its _meta.json: it will write them again
+        known = set(meta['files'])
+        folder = self._folder(table, ticker)
+        for part in self._part_files(table, ticker):
+            if part not in known:
+                os.remove(os.path.join(folder, part))
+
+    def _save_meta(self, table, ticker, meta):
+        folder = self._folder(table, ticker)
+        tmp = os.path.join(folder, '_meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(folder, '_meta.json'))
+
+    def _write(self, table, path):
+        pa = _pyarrow()
+        folder, name = os.path.split(path)
+        os.makedirs(folder, exist_ok=True)
+        # dot prefix: dataset discovery skips it until it is complete
+        tmp = os.path.join(folder, f'.{name}.tmp')
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, tmp, compression=self.compression)
+        else:
+            import pyarrow.feather as feather
+            # uncompressed so readers can memory map the buffers as they are
+            feather.write_feather(table, tmp, compression='uncompressed')
+        os.replace(tmp, path)
+        return path
+
+    def _write_parts(self, name, ticker, frame, index):
+        pa = _pyarrow()
+        folder = self._folder(name, ticker)
+        dates = frame.index if index == 'Date' else pd.DatetimeIndex(frame[index])
+        parts = []
+        for year in np.unique(dates.year):
+            piece = frame[dates.year == year]
+            first, last = dates[dates.year == year][[0, -1]]
+            if index != 'Date':
+                piece = piece.set_index(index)
+            part = os.path.join(f'year={year}', f'part-{first:%Y%m%d}-{last:%Y%m%d}{self.ext}')
+            self._write(_to_arrow(pa, piece, index), os.path.join(folder, part))
+            parts.append(part)
+        return parts
+
+    def append_bars(self, ticker, df, mode='append'):
+        """Store the bars after the last stored one, returns how many."""
+        if mode == 'overwrite':
+            self.drop(ticker, 'bars')
+        bars = df[[c for c in BAR_COLUMNS if c in df.columns]]
+        meta = self._meta('bars', ticker)
+        self._remove_orphans('bars', ticker, meta)
+        if meta['last'] is not None:
+            bars = bars[bars.index > pd.Timestamp(meta['last'])]
+        if len(bars) == 0:
+            return 0
+        meta['files'] += self._write_parts('bars', ticker, bars, 'Date')
+        meta['parts'] = len(meta['files'])
+        meta['rows'] += len(bars)
+        meta['last'] = bars.index[-1].isoformat()
+        self._save_meta('bars', ticker, meta)
+        return len(bars)
+
+    def append_regimes(self, ticker, regimes, mode='append'):
+        """Store the regimes that closed since the last run, rewrite the ongoing one."""
+        if mode == 'overwrite':
+            self.drop(ticker, 'regimes')
+        regimes = regimes.drop(columns=[c for c in REGIME_DROP if c in regimes.columns])
+        ongoing = regimes['ongoing'].to_numpy(dtype=bool)
+        closed, current = regimes[~ongoing], regimes[ongoing]
+
+        meta = self._meta('regimes', ticker)
+        self._remove_orphans('regimes', ticker, meta)
+        if meta['last'] is not None:
+            closed = closed[closed['start_date'] > pd.Timestamp(meta['last'])]
+        folder = self._folder('regimes', ticker)
+        if len(closed):
+            meta['files'] += self._write_parts('regimes', ticker, closed, 'start_date')
+            meta['parts'] = len(meta['files'])
+            meta['rows'] += len(closed)
+            meta['last'] = closed['start_date'].iloc[-1].isoformat()
+
+        current_path = os.path.join(folder, f'current{self.ext}')
+        if len(current):
+            self._write(_to_arrow(_pyarrow(), current.set_index('start_date'), 'start_date'),
+                        current_path)
+        elif os.path.exists(current_path):
+            os.remove(current_path)
+        os.makedirs(folder, exist_ok=True)
+        self._save_meta('regimes', ticker, meta)
+        return len(closed)
+
+    def export(self, ticker, df, regimes=None, mode='append'):
+        """append_bars + append_regimes, returns {'bars': n, 'regimes': m}."""
+        out = {'bars': self.append_bars(ticker, df, mode)}
+        if regimes is not None:
+            out['regimes'] = self.append_regimes(ticker, regimes, mode)
+        return out
+
+    def export_frames(self, frames, mode='append'):
+        """Bars of every ticker in the long (Ticker, Date) frame of run_universe."""
+        return {ticker: self.append_bars(ticker, frame.droplevel(0), mode)
+                for ticker, frame in frames.groupby(level=0, sort=False)}
+
+    def drop(self, ticker, table='bars'):
+        shutil.rmtree(self._folder(table, ticker), ignore_errors=True)
+
+    def tickers(self, table='bars'):
+        folder = os.path.join(self.root, table)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(d.split('=', 1)[1] for d in os.listdir(folder) if d.startswith('Ticker='))
+
+    def compact(self, ticker, table='bars'):
+        """Merge each year's parts into one file (daily appends leave many small ones)."""
+        pa = _pyarrow()
+        folder = self._folder(table, ticker)
+        meta = self._meta(table, ticker)
+        self._remove_orphans(table, ticker, meta)
+        merged = 0
+        years = sorted({os.path.dirname(f) for f in meta['files']})
+        for year_dir in years:
+            parts = sorted(f for f in meta['files'] if os.path.dirname(f) == year_dir)
+            if len(parts) < 2:
+                continue
+            combined = pa.concat_tables([self._read_file(os.path.join(folder, p)) for p in parts])
+            first = os.path.basename(parts[0]).split('-')[1]
+            last = os.path.basename(parts[-1]).split('-')[2].split('.')[0]
+            target = os.path.join(year_dir, f'part-{first}-{last}{self.ext}')
+            self._write(combined, os.path.join(folder, target))
+            # the merged file goes into meta before the parts go, so a crash
+            # in between leaves parts meta no longer lists (removed next time)
+            meta['files'] = sorted(set(f for f in meta['files'] if f not in parts) | {target})
+            meta['parts'] = len(meta['files'])
+            self._save_meta(table, ticker, meta)
+            for p in parts:
+                if p != target:
+                    os.remove(os.path.join(folder, p))
+            merged += len(parts)
+        return merged
+
+    def _read_file(self, path):
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.read_table(path, memory_map=True)
+        import pyarrow.feather as feather
+        return feather.read_table(path, memory_map=True)
+
+    def _dataset(self, table):
+        pa = _pyarrow()
+        import pyarrow.dataset as ds
+        from pyarrow.fs import LocalFileSystem
+
+        partitioning = ds.partitioning(pa.schema([('Ticker', pa.string()), ('year', pa.int16())]),
+                                       flavor='hive')
+        return ds.dataset(os.path.abspath(os.path.join(self.root, table)),
+                          format='parquet' if self.fmt == 'parquet' else 'ipc',
+                          partitioning=partitioning, filesystem=LocalFileSystem(use_mmap=True))
+
+    def _read(self, table, index, tickers, columns, start, end):
+        pa = _pyarrow()
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(os.path.join(self.root, table)):
+            return pd.DataFrame()
+        dataset = self._dataset(table)
+        stamp = lambda t: pa.scalar(pd.Timestamp(t).to_datetime64().astype('datetime64[ns]'),
+                                    pa.timestamp('ns'))
+        conditions = []
+        if tickers is not None:
+            conditions.append(ds.field('Ticker').isin([t.upper() for t in tickers]))
+        # the year conditions let whole partitions be skipped (the ongoing regime has no year)
+        if start is not None:
+            conditions.append(ds.field('year').is_null() | (ds.field('year') >= pd.Timestamp(start).year))
+            conditions.append(ds.field(index) >= stamp(start))
+        if end is not None:
+            conditions.append(ds.field('year').is_null() | (ds.field('year') <= pd.Timestamp(end).year))
+            conditions.append(ds.field(index) <= stamp(end))
+        condition = None
+        for c in conditions:
+            condition = c if condition is None else condition & c
+        wanted = None if columns is None else ['Ticker', index] + [c for c in columns if c not in ('Ticker', index)]
+        frame = dataset.to_table(columns=wanted, filter=condition).to_pandas()
+        frame = frame.drop(columns=[c for c in ('year',) if c in frame.columns])
+        return frame.set_index(['Ticker', index]).sort_index()
+
+    def read_bars(self, tickers=None, columns=None, start=None, end=None):
+        """(Ticker, Date) frame of the wanted columns; Exhaustion_Level comes back categorical."""
+        return self._read('bars', 'Date', tickers, columns, start, end)
+
+    def read_regimes(self, tickers=None, columns=None, start=None, end=None):
+        """(Ticker, start_date) frame of the stored regimes, the ongoing one included."""
+        return self._read('regimes', 'start_date', tickers, columns, start, end)
@@ -0,0 +1,227 @@
+"""
+Cross-asset exhaustion synchrony.
+
+A market-wide turn shows up as many tickers getting exhausted together,
+which one ticker's score can't see. This follows N tickers bar by bar:
+
+* a rolling N x N covariance / correlation of a per-ticker column
+  (Signal_0_100 by default), kept up to date with rank-one updates: the
+  new bar's outer product goes in, the outer product of the bar that
+  leaves the window comes out. O(N^2) per bar instead of O(window * N^2)
+  for a fresh np.corrcoef, and the window is never re-read.
+* how strongly everything moves together: mean pairwise correlation and
+  the leading eigenvalue's share of the total (1/N = unrelated, 1 = one
+  single factor). The eigenvector is warm started from the previous bar,
+  so a few power iterations per bar are enough.
+* breadth: the share of the tickers with a score that are in High and in
+  Very High exhaustion.
+
+Missing bars (NaN, e.g. before a ticker listed) are handled pairwise like
+pandas: each pair uses the bars where both have a value.
+
+    summary, frames = run_universe(closes, full=True)
+    sync = synchrony(frames, window=60)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class RollingCorrelation:
+    """Pairwise-complete rolling covariance of N series, updated per bar.
+
+    Sums are kept relative to each series' first value (shift) to avoid
+    cancellation, and rebuilt from the window every `refresh` bars so
+    rounding from the add / remove updates can't pile up.
+    """
+
+    def __init__(self, n, window, min_periods=None, refresh=None):
+        self.n = n
+        self.window = window
+        self.min_periods = min_periods or max(2, window // 2)
+        self.refresh = refresh or 20 * window
+        self.buffer = np.full((window, n), np.nan)
+        self.pos = 0
+        self.bars = 0
+        self.shift = np.full(n, np.nan)
+        self._reset()
+
+    def _reset(self):
+        n = self.n
+        self.rows = 0                         # bars in the window
+        self.C = np.zeros((n, n))             # sum z_i z_j (0 where missing)
+        self.s = np.zeros(n)                  # sum z_i
+        self.q = np.zeros(n)                  # sum z_i^2
+        self.a = np.zeros(n)                  # bars with i missing
+        # only touched in the columns of missing values, so cheap when data is complete
+        self.U = np.zeros((n, n))             # bars with both i and j missing
+        self.Zu = np.zeros((n, n))            # sum z_i over bars with j missing
+        self.Qu = np.zeros((n, n))            # sum z_i^2 over bars with j missing
+
+    def _apply(self, x, sign):
+        z = x - self.shift
+        missing = ~np.isfinite(z)
+        z[missing] = 0.0
+        self.C += sign * np.outer(z, z)
+        self.s += sign * z
+        self.q += sign * z * z
+        self.rows += sign
+        if missing.any():
+            idx = np.flatnonzero(missing)
+            self.a[idx] += sign
+            self.U[np.ix_(idx, idx)] += sign
+            self.Zu[:, idx] += sign * z[:, None]
+            self.Qu[:, idx] += sign * (z * z)[:, None]
+
+    def update(self, x):
+        """Add one bar (length n, NaN = no value), dropping the oldest if the window is full."""
+        x = np.asarray(x, dtype='float64')
+        new = np.isnan(self.shift) & np.isfinite(x)
+        self.shift[new] = x[new]
+
+        old = self.buffer[self.pos].copy()
+        self.buffer[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+        self.bars += 1
+        if self.bars % self.refresh == 0:
+            self._rebuild()
+            return self
+        if self.rows == self.window:
+            self._apply(old, -1)
+        self._apply(x, +1)
+        return self
+
+    def _rebuild(self):
+        self._reset()
+        for x in self.buffer[:min(self.bars, self.window)]:
+            self._apply(x, +1)
+
+    def _pairwise(self):
+        # count, sum of z_i and sum of z_i^2 over the bars where i and j are both there
+        k = self.rows - self.a[:, None] - self.a[None, :] + self.U
+        return k, self.s[:, None] - self.Zu, self.q[:, None] - self.Qu
+
+    def _dense(self):
+        # no missing value in the window: counts and sums are plain vectors
+        return not self.a.any()
+
+    def covariance(self):
+        """N x N sample covariance, NaN for pairs with fewer than min_periods bars."""
+        if self._dense():
+            k = self.rows
+            if k < self.min_periods:
+                return np.full((self.n, self.n), np.nan)
+            cov = self.C - np.outer(self.s, self.s / k)
+            cov /= k - 1
+            return cov
+        k, si, _ = self._pairwise()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = (self.C - si * si.T / k) / (k - 1)
+        cov[k < self.min_periods] = np.nan
+        return cov
+
+    def correlation(self):
+        """N x N correlation, NaN for short pairs and flat series."""
+        if self._dense():
+            k = self.rows
+            if k < self.min_periods:
+                return np.full((self.n, self.n), np.nan)
+            var = self.q - self.s * self.s / k
+            flat = ~(var > 1e-12 * np.maximum(self.q, 1))
+            scale = 1 / np.sqrt(np.where(flat, np.nan, var))
+            corr = self.C - np.outer(self.s, self.s / k)
+            corr *= scale[:, None]
+            corr *= scale[None, :]
+            return np.clip(corr, -1.0, 1.0, out=corr)
+        k, si, qi = self._pairwise()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = self.C - si * si.T / k
+            var = qi - si * si / k
+            corr = cov / np.sqrt(var * var.T)
+            flat = ~(var > 1e-12 * np.maximum(qi, 1))
+        corr[(k < self.min_periods) | flat | flat.T] = np.nan
+        return np.clip(corr, -1.0, 1.0, out=corr)
+
+
+def leading_eigen(corr, start=None, iters=4):
+    """(eigenvalue, share of the trace, eigenvector) of the top eigenpair.
+
+    Power iteration over the tickers with a defined correlation; NaN pairs
+    count as 0. Pass the previous eigenvector as start to warm start.
+    """
+    valid = np.isfinite(np.diagonal(corr))
+    m = int(valid.sum())
+    if m == 0:
+        return np.nan, np.nan, start
+    r = np.where(np.isfinite(corr), corr, 0.0)
+    r[~valid] = 0.0
+    r[:, ~valid] = 0.0
+    v = np.where(valid, 1.0, 0.0) if start is None else np.where(valid, start, 0.0)
+    if not np.any(v):
+        v = valid.astype('float64')
+    v = v / np.linalg.norm(v)
+    lam = np.nan
+    for _ in range(iters):
+        w = r @ v
+        lam = float(v @ w)
+        norm = np.linalg.norm(w)
+        if norm == 0:
+            break
+        v = w / norm
+    return lam, lam / m, v
+
+
+def breadth(levels):
+    """Per bar: tickers with a level, and the share in High / Very High (or above)."""
+    levels = pd.DataFrame(levels)
+    scored = levels.notna().sum(axis=1)
+    very_high = (levels == 'Very High').sum(axis=1)
+    high = (levels == 'High').sum(axis=1) + very_high
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({'Tickers': scored,
+                             'High_Share': high / scored.where(scored > 0),
+                             'Very_High_Share': very_high / scored.where(scored > 0)})
+
+
+def panel(frames, column):
+    """Date x Ticker table of one column from the long (Ticker, Date) frame of run_universe."""
+    return frames[column].unstack('Ticker').sort_index()
+
+
+def synchrony(frames, column='Signal_0_100', window=60, min_periods=None, every=1, iters=4):
+    """Per bar synchrony of the universe.
+
+    frames is the long (Ticker, Date) frame of run_universe(full=True).
+    Columns: Tickers, High_Share, Very_High_Share (from Exhaustion_Level),
+    Mean_Corr (average over the defined pairs of `column`), Eigen_Value and
+    Eigen_Share of its rolling correlation. The matrix moves every bar;
+    the correlation metrics are only worked out every `every` bars (NaN
+    in between) since that part is the expensive one for big universes.
+    """
+    values = panel(frames, column)
+    out = breadth(panel(frames, 'Exhaustion_Level').reindex(values.index)) \
+        if 'Exhaustion_Level' in frames.columns else pd.DataFrame(index=values.index)
+    x = values.to_numpy(dtype='float64')
+    n = x.shape[1]
+
+    rolling = RollingCorrelation(n, window, min_periods)
+    mean_corr = np.full(len(x), np.nan)
+    eigen_value = np.full(len(x), np.nan)
+    eigen_share = np.full(len(x), np.nan)
+    vector = None
+    off_diagonal = ~np.eye(n, dtype=bool)
+    for t in range(len(x)):
+        rolling.update(x[t])
+        if rolling.rows < rolling.min_periods or (t + 1) % every:
+            continue
+        corr = rolling.correlation()
+        pairs = corr[off_diagonal]
+        pairs = pairs[np.isfinite(pairs)]
+        if len(pairs):
+            mean_corr[t] = pairs.mean()
+        eigen_value[t], eigen_share[t], vector = leading_eigen(corr, vector, iters)
+
+    out['Mean_Corr'] = mean_corr
+    out['Eigen_Value'] = eigen_value
+    out['Eigen_Share'] = eigen_share
+    return out
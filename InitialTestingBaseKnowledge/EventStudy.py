@@ -0,0 +1,82 @@
+"""
+Event studies around regime transitions.
+
+The first block of 3Kurtosis.py looked up the 5 bars before each GMM change
+with get_loc and df.loc, one event at a time. Here every window for every
+event and feature comes out of one fancy-indexed gather: an
+(events x offsets) index grid into the (bars x features) array, with bars
+that fall off either end of the series masked as NaN.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+def gather(values, events, lo, hi):
+    """(events x (hi-lo+1) x features) array of values[event + offset].
+
+    Offsets run from lo to hi inclusive, e.g. (-5, -1) is the five bars
+    before the event. Out of range bars are NaN.
+    """
+    values = np.asarray(values, dtype='float64')
+    if values.ndim == 1:
+        values = values[:, None]
+    events = np.asarray(events, dtype=np.int64)
+    idx = events[:, None] + np.arange(lo, hi + 1)[None, :]
+    inside = (idx >= 0) & (idx < len(values))
+    out = values[np.clip(idx, 0, len(values) - 1)]
+    out[~inside] = np.nan
+    return out
+
+
+def _label(lo, hi):
+    return f'{lo:+d}_{hi:+d}'
+
+
+def event_study(df, events, windows=((-20, 0), (-5, 0), (0, 10)),
+                features=('Skewness', 'Kurtosis'), regime='Regime'):
+    """One row per event with mean/min/max/range of each feature per window.
+
+    `events` are bar positions, or a boolean / 0-1 Series aligned with df
+    such as df['Regime_Change']. With a regime column, old_regime,
+    new_regime and transition say which way the event went (old is the bar
+    before, like 3Kurtosis.py).
+    """
+    if isinstance(events, pd.Series) or np.asarray(events).dtype == bool:
+        events = np.flatnonzero(np.asarray(events) == 1)
+    events = np.asarray(events, dtype=np.int64)
+    values = df[list(features)].to_numpy('float64')
+
+    out = {'date': df.index[events], 'position': events}
+    if regime is not None and regime in df.columns:
+        labels = df[regime].to_numpy()
+        out['old_regime'] = labels[np.maximum(events - 1, 0)]
+        out['new_regime'] = labels[events]
+        out['transition'] = [f'{a}->{b}' for a, b in zip(out['old_regime'], out['new_regime'])]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)   # all-NaN windows
+        for lo, hi in windows:
+            block = gather(values, events, lo, hi)
+            tag = _label(lo, hi)
+            out[f'bars_{tag}'] = np.isfinite(block[:, :, 0]).sum(axis=1)
+            mean = np.nanmean(block, axis=1)
+            low = np.nanmin(block, axis=1)
+            high = np.nanmax(block, axis=1)
+            for j, feature in enumerate(features):
+                out[f'{feature}_mean_{tag}'] = mean[:, j]
+                out[f'{feature}_min_{tag}'] = low[:, j]
+                out[f'{feature}_max_{tag}'] = high[:, j]
+                out[f'{feature}_range_{tag}'] = high[:, j] - low[:, j]
+    return pd.DataFrame(out)
+
+
+def transition_summary(study, by='transition'):
+    """Event count and the average of every window statistic per transition type."""
+    stats = study.drop(columns=['date', 'position', 'old_regime', 'new_regime'], errors='ignore')
+    grouped = stats.groupby(by)
+    summary = grouped.mean(numeric_only=True)
+    summary.insert(0, 'count', grouped.size())
+    return summary
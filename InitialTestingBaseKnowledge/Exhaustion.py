@@ -0,0 +1,447 @@
+"""
+KS-weighted exhaustion signal, batch and streaming.
+
+The batch helpers are steps 3-6 of 2ClassificationOfRegimes.py pulled out
+so other code can reuse them. StreamingExhaustion does the same thing bar by
+bar for live feeds: every update is O(1) time and memory, and the
+whole-sample mean/std, max regime age and min/max scaling become running
+(expanding) statistics, so a bar's score never depends on the future.
+Its Exhaustion_Level thresholds come from a quantile sketch of the earlier
+scores (QuantileSketch.py), so they are point in time as well.
+
+ks_score / exhaustion_signal take causal=True for the same point-in-time
+normalisation in batch: expanding (or rolling, window=...) mean/std, max
+age and min/max worked out in one cumulative pass over the columns. A
+bar's values then never change when bars are added after it, so stored
+results stay valid and only new bars need computing (history= the frame
+of the bars before, or a dict of per column summaries, see
+Pipeline.CausalPipeline).
+"""
+
+import math
+import numbers
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from QuantileSketch import KLLSketch, CausalQuantiles
+
+FEATURES = ['Return', 'Skewness', 'Kurtosis', 'Range']
+
+# KS weights from the validation
+KS_WEIGHTS = {
+    'Return': 0.2337,
+    'Skewness': 0.2126,
+    'Kurtosis': 0.2122,
+    'Range': 0.2542
+}
+
+
+def normalized_weights(weights=KS_WEIGHTS):
+    total = sum(weights.values())
+    return {k: v / total for k, v in weights.items()}
+
+
+def _earlier(history, column):
+    # a column of the frame of earlier bars, empty without one; a dict
+    # holds the column (or its summary, see causal_zscore) as it is
+    if history is None or not len(history):
+        return np.empty(0)
+    if isinstance(history, dict):
+        return history[column]
+    return history[column].to_numpy('float64')
+
+
+def causal_zscore(values, window=None, history=None):
+    """z of every value against the mean / std (ddof=1) of the values up to
+    and including it: all of them, or the last `window`. history: the values
+    before these, or when expanding just their (count, mean, m2) with m2 the
+    sum of squared deviations. 0 while the std is 0 (first value), NaN stays
+    NaN. Expanding statistics run along the last axis (paths x bars works)."""
+    values = np.asarray(values, dtype='float64')
+    if isinstance(history, tuple):
+        count, mean, m2 = history
+    else:
+        history = np.empty(0) if history is None else np.asarray(history, dtype='float64')
+        old = history[np.isfinite(history)]
+        count = len(old)
+        mean = old.mean() if count else 0.0
+        m2 = ((old - mean) ** 2).sum()
+    ok = np.isfinite(values)
+    if window is not None:
+        context = history[len(history) - min(len(history), window - 1):]
+        rolling = pd.Series(np.concatenate((context, values))).rolling(window, min_periods=1)
+        mean = rolling.mean().to_numpy()[len(context):]
+        std = rolling.std().to_numpy()[len(context):]
+    else:
+        # sums relative to a shift (the earlier mean, or the first value) so
+        # the cumulative sums don't lose the variance to cancellation
+        if count:
+            shift = mean
+        else:
+            first = np.take_along_axis(values, np.argmax(ok, axis=-1)[..., None], axis=-1)
+            shift = np.where(ok.any(axis=-1, keepdims=True), first, 0.0)
+        d = np.where(ok, values - shift, 0.0)
+        n = count + np.cumsum(ok, axis=-1)
+        s1 = np.cumsum(d, axis=-1)
+        s2 = m2 + np.cumsum(d * d, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = shift + s1 / n
+            std = np.sqrt(np.maximum(s2 - s1 * s1 / n, 0.0) / (n - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(std > 0, (values - mean) / std, 0.0)
+    z[~ok] = np.nan
+    return z
+
+
+def causal_extreme(values, func, window=None, history=None):
+    """Running max (func=np.fmax) or min (np.fmin) up to and including each
+    value, over all of them or the last `window`; NaNs are skipped.
+    Expanding runs along the last axis like causal_zscore."""
+    values = np.asarray(values, dtype='float64')
+    history = np.empty(0) if history is None else np.asarray(history, dtype='float64')
+    if window is not None:
+        context = history[len(history) - min(len(history), window - 1):]
+        rolling = pd.Series(np.concatenate((context, values))).rolling(window, min_periods=1)
+        out = rolling.max() if func is np.fmax else rolling.min()
+        return out.to_numpy()[len(context):]
+    if len(history):
+        values = np.concatenate(([func.reduce(history)], values))
+        return func.accumulate(values)[1:]
+    return func.accumulate(values, axis=-1)
+
+
+def ks_score(df, weights=KS_WEIGHTS, causal=False, window=None, history=None):
+    """Z-score the features and add KS_Score.
+
+    Over the whole sample by default; causal=True z-scores every bar
+    against the bars up to it (see causal_zscore).
+    """
+    weights = normalized_weights(weights)
+    for feature in FEATURES:
+        if causal:
+            df[f'{feature}_Z'] = causal_zscore(df[feature], window, _earlier(history, feature))
+            continue
+        mean_val = df[feature].mean()
+        std_val = df[feature].std()
+        df[f'{feature}_Z'] = (df[feature] - mean_val) / std_val if std_val > 0 else 0
+
+    df['KS_Score'] = 0.0
+    for feature, weight in weights.items():
+        df['KS_Score'] += df[f'{feature}_Z'] * weight * 100
+    return df
+
+
+def add_trend(df, fast=20, slow=50):
+    """MA crossover trend: 1 = uptrend, -1 = downtrend."""
+    df[f'MA_{slow}'] = df['Close'].rolling(slow).mean()
+    df[f'MA_{fast}'] = df['Close'].rolling(fast).mean()
+    df['Trend'] = np.where(df[f'MA_{fast}'] > df[f'MA_{slow}'], 1, -1)
+    df['Trend_Change'] = df['Trend'].diff().fillna(0)
+    return df
+
+
+def exhaustion_signal(df, causal=False, window=None, history=None):
+    """Fatigue multiplier from Regime_Age, then the raw and 0-100 signal.
+
+    causal=True scales every bar by the max age and min / max signal up
+    to that bar (NaN while they are still equal) instead of the whole sample's.
+    """
+    if causal:
+        age = df['Regime_Age'].to_numpy('float64')
+        max_age = causal_extreme(age, np.fmax, window, _earlier(history, 'Regime_Age'))
+        df['Fatigue_Multiplier'] = 1 + age / np.maximum(1, max_age * 0.5)
+        df['Exhaustion_Signal'] = df['KS_Score'] * df['Fatigue_Multiplier']
+        signal = df['Exhaustion_Signal'].to_numpy('float64')
+        earlier = _earlier(history, 'Exhaustion_Signal')
+        low = causal_extreme(signal, np.fmin, window, earlier)
+        spread = causal_extreme(signal, np.fmax, window, earlier) - low
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['Signal_0_100'] = np.where(spread > 0, 100 * (signal - low) / spread, np.nan)
+        return df
+
+    max_age = df['Regime_Age'].max()
+    df['Fatigue_Multiplier'] = 1 + (df['Regime_Age'] / max(1, max_age * 0.5))  # More conservative scaling
+    df['Exhaustion_Signal'] = df['KS_Score'] * df['Fatigue_Multiplier']
+
+    min_sig = df['Exhaustion_Signal'].min()
+    max_sig = df['Exhaustion_Signal'].max()
+    df['Signal_0_100'] = 100 * (df['Exhaustion_Signal'] - min_sig) / (max_sig - min_sig)
+    return df
+
+
+def exhaustion_levels(df, high=0.75, very_high=0.90, causal=False, window=None, block=20,
+                      min_count=50, sketch=None):
+    """Label Normal/High/Very High from quantiles of Signal_0_100.
+
+    Returns the two thresholds so callers can print them. By default they
+    are quantiles of the whole column. causal=True takes them point in time
+    from a quantile sketch of the earlier bars instead (expanding, or the
+    last `window` bars), stores them per bar in High_Threshold and
+    Very_High_Threshold and returns the ones in force at the last bar.
+    sketch: a QuantileSketch.CausalQuantiles to feed (it keeps the state,
+    so the next call can pass just the bars after df).
+    """
+    if not causal:
+        high_exhaustion = df['Signal_0_100'].quantile(high)
+        very_high_exhaustion = df['Signal_0_100'].quantile(very_high)
+    else:
+        if sketch is None:
+            sketch = CausalQuantiles((high, very_high), window=window, block=block,
+                                     min_count=min_count)
+        thresholds = sketch.update(df['Signal_0_100'].to_numpy())
+        df['High_Threshold'] = high_exhaustion = thresholds[:, 0]
+        df['Very_High_Threshold'] = very_high_exhaustion = thresholds[:, 1]
+
+    # NaN thresholds (not enough history yet) compare False and stay Normal
+    df['Exhaustion_Level'] = 'Normal'
+    df.loc[df['Signal_0_100'] >= high_exhaustion, 'Exhaustion_Level'] = 'High'
+    df.loc[df['Signal_0_100'] >= very_high_exhaustion, 'Exhaustion_Level'] = 'Very High'
+    if causal:
+        last = thresholds[-1] if len(thresholds) else (np.nan, np.nan)
+        return float(last[0]), float(last[1])
+    return high_exhaustion, very_high_exhaustion
+
+
+class _Running:
+    # Welford mean/variance, same ddof=1 std as pandas
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class _RollingMean:
+    __slots__ = ('size', 'values', 'total')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.total = 0.0
+
+    def add(self, x):
+        self.values.append(x)
+        self.total += x
+        if len(self.values) > self.size:
+            self.total -= self.values.popleft()
+
+    def value(self):
+        return self.total / self.size if len(self.values) == self.size else math.nan
+
+
+class StreamingExhaustion:
+    """One symbol's exhaustion signal, updated one bar at a time.
+
+    update(bar) takes a close price (or a dict/Series with 'Close' and
+    optionally 'Date') and returns the state for that bar. Features follow
+    FeatureEngine: bar i is scored on the window-1 log returns before it.
+    A NaN / inf close is skipped (not ready, nothing else changes).
+    """
+
+    # rebuild the power sums from the window now and then so the
+    # add/subtract rounding can't pile up over millions of bars
+    RESYNC_EVERY = 4096
+    # re-read the level thresholds from the sketch every this many bars
+    THRESHOLD_EVERY = 16
+
+    def __init__(self, window=20, fast=20, slow=50, weights=KS_WEIGHTS, min_returns=10,
+                 levels=(0.75, 0.90), min_level_count=50):
+        self.window = window
+        self.span = window - 1
+        self.min_returns = min_returns
+        self.fast = fast
+        self.slow = slow
+        self.weights = normalized_weights(weights)
+
+        self.bars = 0
+        self.prev_close = None
+        self.returns = deque()
+        self.shift = None
+        self.sums = [0.0, 0.0, 0.0, 0.0]
+        self.since_resync = 0
+        self.max_q = deque()
+        self.min_q = deque()
+
+        self.ma_fast = _RollingMean(fast)
+        self.ma_slow = _RollingMean(slow)
+        self.trend = None
+        self.regime_age = 0
+        self.max_age = 0
+
+        self.stats = {f: _Running() for f in FEATURES}
+        self.min_sig = math.inf
+        self.max_sig = -math.inf
+
+        self.levels = tuple(levels)
+        self.min_level_count = min_level_count
+        self.sketch = KLLSketch()
+        self.thresholds = (math.nan, math.nan)
+        self.scored = 0
+        self.state = None
+
+    # rolling window of returns
+
+    def _push_return(self, r):
+        if self.shift is None:
+            self.shift = r
+        x = r - self.shift
+        self.returns.append(x)
+        self._add_sums(x, 1.0)
+        i = self.bars
+        while self.max_q and self.max_q[-1][1] <= x:
+            self.max_q.pop()
+        self.max_q.append((i, x))
+        while self.min_q and self.min_q[-1][1] >= x:
+            self.min_q.pop()
+        self.min_q.append((i, x))
+
+        if len(self.returns) > self.span:
+            self._add_sums(self.returns.popleft(), -1.0)
+        oldest = i - self.span
+        while self.max_q[0][0] <= oldest:
+            self.max_q.popleft()
+        while self.min_q[0][0] <= oldest:
+            self.min_q.popleft()
+
+        self.since_resync += 1
+        if self.since_resync >= self.RESYNC_EVERY:
+            self.sums = [sum(v ** p for v in self.returns) for p in (1, 2, 3, 4)]
+            self.since_resync = 0
+
+    def _add_sums(self, x, sign):
+        x2 = x * x
+        self.sums[0] += sign * x
+        self.sums[1] += sign * x2
+        self.sums[2] += sign * x2 * x
+        self.sums[3] += sign * x2 * x2
+
+    def _features(self):
+        n = len(self.returns)
+        s1, s2, s3, s4 = self.sums
+        mean = s1 / n
+        m2 = s2 - s1 * mean
+        m3 = s3 - 3 * mean * s2 + 2 * n * mean ** 3
+        m4 = s4 - 4 * mean * s3 + 6 * mean ** 2 * s2 - 3 * n * mean ** 4
+        if abs(m2) < 1e-14:
+            m2 = 0.0
+        if abs(m3) < 1e-14:
+            m3 = 0.0
+        if m2 == 0:
+            skew = kurt = 0.0
+        else:
+            skew = (n * (n - 1) ** 0.5 / (n - 2)) * (m3 / m2 ** 1.5)
+            kurt = (n * (n + 1) * (n - 1) * m4) / ((n - 2) * (n - 3) * m2 ** 2) \
+                - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        return {
+            'Return': s1 + n * self.shift,
+            'Skewness': skew,
+            'Kurtosis': kurt,
+            'Range': self.max_q[0][1] - self.min_q[0][1],
+        }
+
+    def update(self, bar):
+        # numbers.Real takes numpy scalars (np.float32, np.int64) as well
+        if isinstance(bar, numbers.Real):
+            date, close = None, float(bar)
+        else:
+            date, close = bar.get('Date'), float(bar['Close'])
+        if not math.isfinite(close):
+            # a missing print would poison the running power sums for good
+            return {'Date': date, 'Close': close, 'ready': False}
+
+        feats = None
+        if self.bars >= self.window and len(self.returns) >= self.min_returns:
+            feats = self._features()
+
+        if self.prev_close is not None:
+            self._push_return(math.log(close / self.prev_close))
+        self.prev_close = close
+        self.bars += 1
+
+        if feats is None:
+            self.state = {'Date': date, 'Close': close, 'ready': False}
+            return self.state
+
+        # KS score from running z-scores
+        score = 0.0
+        for feature, weight in self.weights.items():
+            stat = self.stats[feature]
+            stat.add(feats[feature])
+            std = stat.std()
+            z = (feats[feature] - stat.mean) / std if std > 0 else 0.0
+            score += z * weight * 100
+
+        # MA trend and regime age
+        self.ma_fast.add(close)
+        self.ma_slow.add(close)
+        fast, slow = self.ma_fast.value(), self.ma_slow.value()
+        trend = 1 if fast > slow else -1
+        if self.trend is None or trend == self.trend:
+            self.regime_age = 0 if self.trend is None else self.regime_age + 1
+        else:
+            self.regime_age = 0
+        self.trend = trend
+        self.max_age = max(self.max_age, self.regime_age)
+
+        fatigue = 1 + self.regime_age / max(1, self.max_age * 0.5)
+        signal = score * fatigue
+        self.min_sig = min(self.min_sig, signal)
+        self.max_sig = max(self.max_sig, signal)
+        spread = self.max_sig - self.min_sig
+        scaled = 100 * (signal - self.min_sig) / spread if spread > 0 else math.nan
+
+        # levels against the scores before this one, then add this one
+        if self.scored % self.THRESHOLD_EVERY == 0 and self.sketch.count >= self.min_level_count:
+            self.thresholds = tuple(float(v) for v in self.sketch.quantile(self.levels))
+        self.scored += 1
+        high, very_high = self.thresholds
+        level = 'Very High' if scaled >= very_high else 'High' if scaled >= high else 'Normal'
+        self.sketch.update(scaled)
+
+        self.state = {
+            'Date': date,
+            'Close': close,
+            **feats,
+            'KS_Score': score,
+            f'MA_{self.fast}': fast,
+            f'MA_{self.slow}': slow,
+            'Trend': trend,
+            'Regime_Age': self.regime_age,
+            'Fatigue_Multiplier': fatigue,
+            'Exhaustion_Signal': signal,
+            'Signal_0_100': scaled,
+            'High_Threshold': high,
+            'Very_High_Threshold': very_high,
+            'Exhaustion_Level': level,
+            'ready': True,
+        }
+        return self.state
+
+
+class ExhaustionBook:
+    """A StreamingExhaustion per symbol, created on the first bar seen."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.symbols = {}
+
+    def update(self, ticker, bar):
+        calc = self.symbols.get(ticker)
+        if calc is None:
+            calc = self.symbols[ticker] = StreamingExhaustion(**self.kwargs)
+        return calc.update(bar)
+
+    def snapshot(self):
+        return {t: calc.state for t, calc in self.symbols.items()}
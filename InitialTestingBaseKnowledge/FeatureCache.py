@@ -0,0 +1,322 @@
+"""
+On-disk cache of derived data (features, GMM regimes, forward labels).
+
+3Kurtosis.py and friends were written to run on a df left in the session
+by the feature / GMM code; run as scripts they rebuild it every time, and
+the walk-forward GMM is most of the wait. This keeps what was built:
+
+* an entry's key is a hash of what it was made from: kind, ticker, the
+  input data (dates and values, so another date range or a revised bar is
+  another key), the parameters (window, horizons, ...) and the source code
+  of the modules that compute it, so editing FeatureEngine.py or
+  RegimeModel.py quietly retires the old entries.
+* an entry is a folder with one .npy per column (strings as categorical
+  codes) plus meta.json. Reads are np.load(mmap_mode='r'), so a hit costs
+  an open per column, not a copy.
+* least recently used entries go once the cache is over its byte budget.
+  A hit touches the entry's meta.json, so several processes / notebooks
+  can share one cache folder and agree on what was used last.
+* entries are written to a temp folder and renamed into place, so a run
+  that dies half way (or two runs racing for the same key) never leaves
+  a half written entry behind.
+
+root / budget default to $CHRONOS_CACHE ('feature_cache') and
+$CHRONOS_CACHE_BUDGET (bytes, 2 GB).
+
+    cache = FeatureCache()
+    df = research_frame(close, 'SPY', cache=cache)     # features + Regime + labels
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from FeatureEngine import compute_features
+from ForwardLabels import forward_labels
+from RegimeModel import RegimeClassifier
+
+DEFAULT_BUDGET = 2 * 1024 ** 3
+# modules whose source goes into the key of each kind of entry
+CODE = {
+    'features': ['FeatureEngine'],
+    'regimes': ['FeatureEngine', 'RegimeModel'],
+    'labels': ['ForwardLabels'],
+}
+
+_code_versions = {}
+
+
+def code_version(*modules):
+    """Hash of the source files of the given (imported) modules."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in modules:
+        if name not in _code_versions:
+            with open(sys.modules[name].__file__, 'rb') as f:
+                _code_versions[name] = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        digest.update(f'{name}:{_code_versions[name]};'.encode())
+    return digest.hexdigest()
+
+
+def data_hash(data):
+    """Hash of a Series / DataFrame's index, column names and values."""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    index = data.index
+    if getattr(index, 'tz', None) is not None:
+        # tz-aware: the UTC nanoseconds and the zone (to_numpy() would be Timestamps)
+        digest.update(np.ascontiguousarray(index.asi8).view(np.uint8))
+        digest.update(str(index.tz).encode())
+    elif index.dtype.kind in 'iufMmb':
+        digest.update(np.ascontiguousarray(index.to_numpy()).view(np.uint8))
+    else:
+        digest.update(str(list(index)).encode())
+    for col in data.columns:
+        values = data[col].to_numpy()
+        digest.update(str(col).encode())
+        if values.dtype.kind in 'iufMmb':
+            digest.update(np.ascontiguousarray(values).view(np.uint8))
+        else:
+            digest.update(str(list(values)).encode())
+    return digest.hexdigest()
+
+
+def make_key(kind, ticker, data, params=None, code=None):
+    """Cache key of one entry (hex string)."""
+    parts = {
+        'kind': kind,
+        'ticker': ticker,
+        'data': data if isinstance(data, str) else data_hash(data),
+        'params': params or {},
+        'code': code_version(*(CODE.get(kind, []) if code is None else code)),
+    }
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class FeatureCache:
+    """Content-addressed DataFrame cache on disk, LRU evicted to a byte budget."""
+
+    def __init__(self, root=None, budget=None):
+        self.root = root or os.environ.get('CHRONOS_CACHE', 'feature_cache')
+        self.budget = int(budget or os.environ.get('CHRONOS_CACHE_BUDGET', DEFAULT_BUDGET))
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def _folder(self, key):
+        return os.path.join(self.root, key)
+
+    def _meta(self, key):
+        try:
+            with open(os.path.join(self._folder(key), 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key):
+        """The cached frame (columns memory mapped, read only) or None."""
+        df = self._load(key)
+        self.stats['misses' if df is None else 'hits'] += 1
+        return df
+
+    def _load(self, key):
+        # get() without counting a hit or miss
+        meta = self._meta(key)
+        if meta is None:
+            return None
+        folder = self._folder(key)
+        try:
+            columns = {}
+            for i, col in enumerate(meta['columns']):
+                values = np.load(os.path.join(folder, f'{i}.npy'), mmap_mode='r')
+                categories = meta['categories'].get(str(i))
+                if categories is not None:
+                    values = pd.Categorical.from_codes(np.asarray(values), categories=categories)
+                    if str(i) in meta['strings']:
+                        values = np.asarray(values, dtype=object)
+                columns[col] = values
+            index = np.load(os.path.join(folder, 'index.npy'), mmap_mode='r')
+        except OSError:
+            # evicted by another process between meta.json and the columns
+            return None
+        # last used = mtime of meta.json, shared by every process on this cache
+        try:
+            os.utime(os.path.join(folder, 'meta.json'))
+        except OSError:
+            pass
+        index = pd.Index(index, name=meta['index_name'])
+        if meta.get('index_tz'):
+            index = index.tz_localize('UTC').tz_convert(meta['index_tz'])
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def put(self, key, df, **info):
+        """Store a frame under key (a no-op if it is there already), then evict."""
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+        if isinstance(df.index, pd.MultiIndex) or df.index.dtype.kind not in 'iufMmb':
+            raise ValueError('FeatureCache stores frames with a plain date or number index only')
+        index = df.index
+        tz = getattr(index, 'tz', None)
+        if tz is not None:
+            # stored as UTC datetime64, the zone goes in meta.json
+            index = index.tz_convert('UTC').tz_localize(None)
+        os.makedirs(self.root, exist_ok=True)
+        folder = self._folder(key)
+        if os.path.exists(folder):
+            return key
+        tmp = os.path.join(self.root, f'.tmp-{key}-{uuid.uuid4().hex[:8]}')
+        os.makedirs(tmp)
+        try:
+            categories = {}
+            strings = []
+            for i, col in enumerate(df.columns):
+                values = df.iloc[:, i]
+                if isinstance(values.dtype, pd.DatetimeTZDtype):
+                    raise ValueError(f'FeatureCache cannot store tz-aware column {col!r}, '
+                                     f'convert it to UTC first')
+                if values.dtype.kind not in 'iufMmb':
+                    if not isinstance(values.dtype, pd.CategoricalDtype):
+                        strings.append(str(i))
+                    values = pd.Categorical(values)
+                    categories[str(i)] = [str(c) for c in values.categories]
+                    values = values.codes
+                np.save(os.path.join(tmp, f'{i}.npy'), np.ascontiguousarray(np.asarray(values)))
+            np.save(os.path.join(tmp, 'index.npy'), np.asarray(index))
+            size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+            meta = dict(info, columns=[str(c) for c in df.columns], categories=categories,
+                        strings=strings, index_name=df.index.name, index_tz=None if tz is None else str(tz),
+                        rows=len(df), bytes=size, created=time.time())
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f, default=str)
+            try:
+                os.rename(tmp, folder)
+            except OSError:
+                # someone else stored the same key first, theirs is as good as ours
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+        return key
+
+    def cached(self, kind, ticker, data, compute, params=None, code=None):
+        """get() the entry for these inputs, or compute() it and put() it."""
+        key = make_key(kind, ticker, data, params, code)
+        df = self.get(key)
+        if df is None:
+            df = compute()
+            self.put(key, df, kind=kind, ticker=ticker, params=params or {})
+            # hand back the stored (memory mapped) copy so hits and misses look alike
+            stored = self._load(key)
+            df = df if stored is None else stored
+        return df
+
+    def entries(self):
+        """One row per entry: key, kind, ticker, rows, bytes, last_used (oldest first)."""
+        rows = []
+        if os.path.isdir(self.root):
+            for key in os.listdir(self.root):
+                if key.startswith('.'):
+                    continue
+                path = os.path.join(self._folder(key), 'meta.json')
+                meta = self._meta(key)
+                if meta is None:
+                    continue
+                try:
+                    used = os.path.getmtime(path)
+                except OSError:
+                    continue
+                rows.append({'key': key, 'kind': meta.get('kind'), 'ticker': meta.get('ticker'),
+                             'rows': meta['rows'], 'bytes': meta['bytes'],
+                             'last_used': pd.Timestamp(used, unit='s')})
+        out = pd.DataFrame(rows, columns=['key', 'kind', 'ticker', 'rows', 'bytes', 'last_used'])
+        return out.sort_values('last_used', kind='stable').reset_index(drop=True)
+
+    def size(self):
+        return int(self.entries()['bytes'].sum())
+
+    def evict(self, budget=None):
+        """Drop least recently used entries until the cache fits the budget; returns how many."""
+        budget = self.budget if budget is None else budget
+        self._sweep()
+        entries = self.entries()
+        over = entries['bytes'].sum() - budget
+        dropped = 0
+        for row in entries.itertuples():
+            if over <= 0:
+                break
+            self.drop(row.key)
+            over -= row.bytes
+            dropped += 1
+        self.stats['evicted'] += dropped
+        return dropped
+
+    def _sweep(self, age=3600):
+        # temp / trash folders left by runs that died more than `age` seconds ago
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(('.tmp-', '.del-')):
+                try:
+                    stale = time.time() - os.path.getmtime(path) > age
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def drop(self, key):
+        # rename first so readers never see a folder with some columns gone
+        folder = self._folder(key)
+        trash = os.path.join(self.root, f'.del-{key}-{uuid.uuid4().hex[:8]}')
+        try:
+            os.rename(folder, trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def clear(self):
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+
+def research_frame(close, ticker, window=20, horizons=(5,), cache=None, regimes=True,
+                   k=2, refit_every=20, events='Regime_Change'):
+    """Features, walk-forward GMM regimes and forward labels for one close series.
+
+    The df 3Kurtosis.analyze() starts from. Each part is its own cache
+    entry (features keyed on the closes, regimes on the features, labels
+    on the regime changes), so a new horizon only adds labels and a new
+    GMM setting only refits the GMM. Labels need the `events` column, so
+    regimes=False leaves them out unless df has one. cache=None uses
+    FeatureCache() with the default folder, cache=False computes everything.
+    """
+    if cache is None:
+        cache = FeatureCache()
+    if isinstance(close, pd.DataFrame):
+        close = close['Close']
+
+    def get(kind, data, compute, params):
+        if cache is False:
+            return compute()
+        return cache.cached(kind, ticker, data, compute, params)
+
+    df = get('features', close, lambda: compute_features(close, window=window),
+             {'window': window})
+    if regimes:
+        model = {'k': k, 'refit_every': refit_every}
+        gmm = get('regimes', df, lambda: RegimeClassifier(**model).walk_forward(df), model)
+        df = df.join(gmm)
+    horizons = [int(h) for h in np.atleast_1d(horizons)]
+    if horizons and events in df.columns:
+        labels = get('labels', df[['Close', events]],
+                     lambda: forward_labels(df, horizons, events=df[events]),
+                     {'horizons': horizons, 'events': events})
+        df = df.join(labels)
+    return df
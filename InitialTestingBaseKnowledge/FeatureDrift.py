@@ -0,0 +1,186 @@
+"""
+Rolling and online point-biserial correlation of features vs future changes.
+
+The correlation check at the end of 3Kurtosis.py runs one pointbiserialr
+over a fixed 2024+ slice. Point-biserial is just Pearson's r against a 0/1
+label, so it only needs n, sum x, sum x^2, sum y and sum xy. Keeping those
+as rolling sums gives r and its p-value for every bar and several window
+lengths in O(1) per bar, i.e. a time series of how a feature's predictive
+power decays.
+
+Labels like "regime change in the next 5 bars" are only known 5 bars
+later, so by default a bar's statistics only use pairs whose label had
+already resolved (horizon lag), which keeps the series point-in-time.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+def _p_values(r, n):
+    # two sided p-value of Pearson's r with n-2 degrees of freedom
+    from scipy import special
+
+    r = np.asarray(r, dtype='float64')
+    n = np.asarray(n, dtype='float64')
+    dof = n - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t2 = r * r * dof / np.maximum(1 - r * r, 1e-300)
+        p = special.betainc(dof / 2, 0.5, dof / (dof + t2))
+    return np.where(dof > 0, p, np.nan)
+
+
+def _stats_to_r(n, sx, sxx, sy, sxy):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        vx = sxx - sx * sx / n
+        vy = sy - sy * sy / n          # y is 0/1 so sum y^2 == sum y
+        r = cov / np.sqrt(vx * vy)
+    return np.where((vx > 0) & (vy > 0), np.clip(r, -1, 1), np.nan)
+
+
+def rolling_pointbiserial(x, y, window=None, horizon=0):
+    """r and p of x against 0/1 labels y for every bar.
+
+    window=None is expanding. horizon lags the pairs so bar t only sees
+    labels that were known at t (the label of bar t - horizon and older).
+    A window is the last `window` resolved bars; pairs with a NaN in them
+    take their place in it but count for nothing, as in OnlinePointBiserial.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    valid = np.isfinite(x) & np.isfinite(y)
+    # centre x so the running sums don't lose precision
+    shift = x[valid].mean() if valid.any() else 0.0
+    xc = np.where(valid, x - shift, 0.0)
+    yc = np.where(valid, y, 0.0)
+
+    def cum(a):
+        return np.concatenate(([0.0], np.cumsum(a)))
+
+    sums = [cum(valid.astype('float64')), cum(xc), cum(xc * xc), cum(yc), cum(xc * yc)]
+    n_bars = len(x)
+    hi = np.arange(n_bars) + 1 - horizon
+    hi = np.clip(hi, 0, n_bars)
+    lo = np.zeros(n_bars, dtype=np.int64) if window is None else np.clip(hi - window, 0, None)
+    n, sx, sxx, sy, sxy = (c[hi] - c[lo] for c in sums)
+
+    # two pairs always give r = +-1, so like the online version wait for three
+    r = np.where(n > 2, _stats_to_r(n, sx, sxx, sy, sxy), np.nan)
+    return r, _p_values(r, n)
+
+
+def feature_decay(df, label, features=('Skewness', 'Kurtosis'), windows=(60, 120, 250),
+                  horizon=5, expanding=True):
+    """Time series of r and p per feature and window length.
+
+    `label` is a column name or array of 0/1 future-change labels, e.g.
+    Change_Within_5 from ForwardLabels. Columns come out as
+    <feature>_r_<window> / <feature>_p_<window> (window 'all' = expanding).
+    """
+    y = df[label].to_numpy() if isinstance(label, str) else np.asarray(label)
+    lengths = list(windows) + ([None] if expanding else [])
+    out = {}
+    for feature in features:
+        x = df[feature].to_numpy()
+        for w in lengths:
+            r, p = rolling_pointbiserial(x, y, window=w, horizon=horizon)
+            tag = 'all' if w is None else w
+            out[f'{feature}_r_{tag}'] = r
+            out[f'{feature}_p_{tag}'] = p
+    return pd.DataFrame(out, index=df.index)
+
+
+class OnlinePointBiserial:
+    """Live version, O(1) per bar and window.
+
+    update(values, label) takes the features of the new bar t and the 0/1
+    label of bar t - horizon, which has only just resolved (None while the
+    first `horizon` bars are still open). The feature values are buffered
+    here until their label arrives.
+
+    Like rolling_pointbiserial, a window is the last `window` resolved
+    bars: a bar with a NaN feature or no label still takes its place in the
+    window but adds nothing to that feature's sums.
+    """
+
+    # recompute the sums from the windows now and then to stop float drift
+    RESYNC_EVERY = 4096
+
+    def __init__(self, features=('Skewness', 'Kurtosis'), windows=(60, 120, 250), horizon=5):
+        self.features = list(features)
+        self.windows = list(windows)
+        self.horizon = horizon
+        self.pending = deque()
+        self.pairs = {w: deque() for w in self.windows}
+        self.sums = {(f, w): [0.0] * 5 for f in self.features for w in self.windows}
+        self.updates = 0
+
+    @staticmethod
+    def _pair(vals, y, f):
+        # (x, y) if both are there, else None
+        if y is None:
+            return None
+        x = vals[f]
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return None
+        return x, y
+
+    def _add(self, key, xs, y, sign):
+        s = self.sums[key]
+        s[0] += sign
+        s[1] += sign * xs
+        s[2] += sign * xs * xs
+        s[3] += sign * y
+        s[4] += sign * xs * y
+
+    def update(self, values, label=None):
+        """Returns {(feature, window): (r, p)} over the resolved pairs."""
+        self.pending.append(values)
+        if len(self.pending) <= self.horizon:
+            return self.current()
+        old = self.pending.popleft()
+        y = None if label is None else float(label)
+        for w in self.windows:
+            q = self.pairs[w]
+            q.append((old, y))
+            for f in self.features:
+                pair = self._pair(old, y, f)
+                if pair is not None:
+                    self._add((f, w), *pair, 1.0)
+            if len(q) > w:
+                gone, gy = q.popleft()
+                for f in self.features:
+                    pair = self._pair(gone, gy, f)
+                    if pair is not None:
+                        self._add((f, w), *pair, -1.0)
+        self.updates += 1
+        if self.updates % self.RESYNC_EVERY == 0:
+            self._resync()
+        return self.current()
+
+    def _resync(self):
+        for w in self.windows:
+            for f in self.features:
+                s = [0.0] * 5
+                for vals, y in self.pairs[w]:
+                    pair = self._pair(vals, y, f)
+                    if pair is None:
+                        continue
+                    x, y = pair
+                    s[0] += 1
+                    s[1] += x
+                    s[2] += x * x
+                    s[3] += y
+                    s[4] += x * y
+                self.sums[(f, w)] = s
+
+    def current(self):
+        out = {}
+        for key, (n, sx, sxx, sy, sxy) in self.sums.items():
+            r = float(_stats_to_r(n, sx, sxx, sy, sxy)) if n > 2 else math.nan
+            out[key] = (r, float(_p_values(r, n)) if n > 2 else math.nan)
+        return out
@@ -0,0 +1,218 @@
+"""
+Vectorized version of the KS-validated features from 2ClassificationOfRegimes.py
+
+The original loop sliced the last `window` closes for every bar and called
+pandas skew()/kurtosis() on each slice. Here the same numbers come out of
+rolling power sums of the log returns (one cumsum per power) and a block
+prefix/suffix max/min for the Range, so the whole series is one pass.
+"""
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['Return', 'Skewness', 'Kurtosis', 'Range']
+
+
+def _as_series(close):
+    # yfinance sometimes hands back a one column DataFrame for ['Close']
+    if isinstance(close, pd.DataFrame):
+        close = close.iloc[:, 0]
+    return close.astype('float64')
+
+
+def _lagged_window_sums(x, window):
+    # sum of x[i-window:i], i.e. the window that ends on the bar BEFORE i (along the last axis)
+    n = x.shape[-1]
+    c = np.concatenate((np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, axis=-1)), axis=-1)
+    out = np.full(x.shape, np.nan)
+    if window < n + 1:
+        out[..., window:] = c[..., window:n] - c[..., :n - window]
+    return out
+
+
+def rolling_extreme(x, window, op=np.fmax):
+    """Max (or min with op=np.fmin) of x[i:i+window] for every start i.
+
+    van Herk / Gil-Werman: split into blocks of `window`, take a prefix and a
+    suffix accumulate inside each block, and every window is the combination
+    of one suffix and one prefix. O(n) no matter how big the window is.
+    Works along the last axis, so a (paths x bars) array goes in one call.
+    """
+    lead, n = x.shape[:-1], x.shape[-1]
+    if n < window:
+        return np.empty(lead + (0,))
+    fill = -np.inf if op is np.fmax else np.inf
+    blocks = -(-n // window)
+    padded = np.full(lead + (blocks * window,), fill)
+    padded[..., :n] = np.where(np.isnan(x), fill, x)
+    padded = padded.reshape(lead + (blocks, window))
+    prefix = op.accumulate(padded, axis=-1).reshape(lead + (-1,))
+    suffix = op.accumulate(padded[..., ::-1], axis=-1)[..., ::-1].reshape(lead + (-1,))
+    out = op(suffix[..., :n - window + 1], prefix[..., window - 1:n])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def moments_from_sums(count, s1, s2, s3, s4):
+    """Bias-corrected skew and excess kurtosis (same as pandas) from power sums."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1 / count
+        m2 = s2 - s1 * mean
+        m3 = s3 - 3 * mean * s2 + 2 * count * mean ** 3
+        m4 = s4 - 4 * mean * s3 + 6 * mean ** 2 * s2 - 3 * count * mean ** 4
+
+        # pandas treats tiny central moments as exactly zero
+        m2 = np.where(np.abs(m2) < 1e-14, 0.0, m2)
+        m3 = np.where(np.abs(m3) < 1e-14, 0.0, m3)
+
+        n = count
+        skew = (n * (n - 1) ** 0.5 / (n - 2)) * (m3 / m2 ** 1.5)
+        skew = np.where(m2 == 0, 0.0, skew)
+        skew = np.where(n < 3, np.nan, skew)
+
+        adj = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        numer = n * (n + 1) * (n - 1) * m4
+        denom = (n - 2) * (n - 3) * m2 ** 2
+        kurt = numer / denom - adj
+        kurt = np.where(denom == 0, 0.0, kurt)
+        kurt = np.where(n < 4, np.nan, kurt)
+    return skew, kurt
+
+
+def compute_features(close, window=20, min_returns=10):
+    """Return, Skewness, Kurtosis and Range for every bar in one pass.
+
+    Matches the old per-row loop: the features on bar i come from the log
+    returns inside close[i-window:i] (so window-1 returns, not including bar
+    i itself), and bars with fewer than `min_returns` valid returns are
+    dropped.
+    """
+    close = _as_series(close)
+    prices = close.to_numpy()
+    n = len(prices)
+
+    returns = np.full(n, np.nan)
+    if n > 1:
+        returns[1:] = np.log(prices[1:] / prices[:-1])
+    valid = np.isfinite(returns)
+
+    # centre on the overall mean so the power sums don't lose precision
+    shift = returns[valid].mean() if valid.any() else 0.0
+    x = np.where(valid, returns - shift, 0.0)
+
+    # window closes -> window-1 returns, the last one being the bar before i
+    span = window - 1
+    count = _lagged_window_sums(valid.astype('float64'), span)
+    s1 = _lagged_window_sums(x, span)
+    s2 = _lagged_window_sums(x * x, span)
+    s3 = _lagged_window_sums(x ** 3, span)
+    s4 = _lagged_window_sums(x ** 4, span)
+
+    skew, kurt = moments_from_sums(count, s1, s2, s3, s4)
+    total_return = s1 + count * shift
+
+    spread = np.full(n, np.nan)
+    if n > span:
+        hi = rolling_extreme(returns, span, np.fmax)
+        lo = rolling_extreme(returns, span, np.fmin)
+        # window starting at i-span ends on the bar before i
+        spread[span:] = (hi - lo)[:n - span]
+
+    out = pd.DataFrame({
+        'Close': prices,
+        'Return': total_return,
+        'Skewness': skew,
+        'Kurtosis': kurt,
+        'Range': spread,
+    }, index=close.index)
+    out.index.name = 'Date'
+
+    keep = np.zeros(n, dtype=bool)
+    keep[window:] = count[window:] >= min_returns
+    return out[keep]
+
+
+def features_batch(close, window=20):
+    """compute_features for a (paths x bars) array of gap-free closes at once.
+
+    Returns {'Close', 'Return', 'Skewness', 'Kurtosis', 'Range'}, each
+    (paths x bars - window): the bars compute_features keeps for a series
+    with no missing prices (window >= min_returns + 1).
+    """
+    prices = np.atleast_2d(np.asarray(close, dtype='float64'))
+    n = prices.shape[-1]
+    returns = np.full(prices.shape, np.nan)
+    returns[:, 1:] = np.log(prices[:, 1:] / prices[:, :-1])
+
+    shift = np.nanmean(returns[:, 1:], axis=-1, keepdims=True) if n > 1 else np.zeros((len(prices), 1))
+    x = np.where(np.isfinite(returns), returns - shift, 0.0)
+    span = window - 1
+    count = _lagged_window_sums(np.isfinite(returns).astype('float64'), span)
+    s1 = _lagged_window_sums(x, span)
+    skew, kurt = moments_from_sums(count, s1, _lagged_window_sums(x * x, span),
+                                   _lagged_window_sums(x ** 3, span),
+                                   _lagged_window_sums(x ** 4, span))
+    spread = np.full(prices.shape, np.nan)
+    if n > span:
+        spread[:, span:] = (rolling_extreme(returns, span, np.fmax) -
+                            rolling_extreme(returns, span, np.fmin))[:, :n - span]
+    keep = slice(window, None)
+    return {'Close': prices[:, keep], 'Return': (s1 + count * shift)[:, keep],
+            'Skewness': skew[:, keep], 'Kurtosis': kurt[:, keep], 'Range': spread[:, keep]}
+
+
+WINDOWS = (5, 10, 20, 60, 120, 250)
+
+
+def feature_pyramid(close, windows=WINDOWS, min_fraction=0.5, dtype='float64'):
+    """The four features for several windows at once, as a (bars x windows x features) cube.
+
+    The cumulative power sums of the (centred) log returns are built once
+    and every window is just a difference of them, so adding windows costs
+    a few subtractions each instead of a full recompute. Rows line up with
+    `close`; a bar is NaN for a window until it has `window` bars of history
+    and at least min_fraction of its window-1 returns are valid (0.5 gives
+    the min_returns=10 of compute_features at window 20). Returns
+    (cube, index); cube[:, j] for windows[j] == 20 matches compute_features.
+    """
+    close = _as_series(close)
+    prices = close.to_numpy()
+    n = len(prices)
+    windows = [int(w) for w in windows]
+
+    returns = np.full(n, np.nan)
+    if n > 1:
+        returns[1:] = np.log(prices[1:] / prices[:-1])
+    valid = np.isfinite(returns)
+    shift = returns[valid].mean() if valid.any() else 0.0
+    x = np.where(valid, returns - shift, 0.0)
+
+    # one cumsum per power, shared by every window
+    x2 = x * x
+    powers = np.stack([valid.astype('float64'), x, x2, x2 * x, x2 * x2])
+    cums = np.concatenate((np.zeros((5, 1)), np.cumsum(powers, axis=1)), axis=1)
+
+    cube = np.full((n, len(windows), len(FEATURES)), np.nan, dtype=dtype)
+    for j, window in enumerate(windows):
+        span = window - 1
+        if span < 1 or n <= window:
+            continue
+        # sums over returns[i-span:i] for i >= window
+        count, s1, s2, s3, s4 = cums[:, window:n] - cums[:, window - span:n - span]
+        skew, kurt = moments_from_sums(count, s1, s2, s3, s4)
+        hi = rolling_extreme(returns, span, np.fmax)
+        lo = rolling_extreme(returns, span, np.fmin)
+        spread = (hi - lo)[window - span:n - span]
+
+        ready = count >= max(4, np.ceil(min_fraction * span))
+        block = np.column_stack([s1 + count * shift, skew, kurt, spread])
+        cube[window:, j] = np.where(ready[:, None], block, np.nan)
+
+    return cube, close.index.rename('Date')
+
+
+def pyramid_frame(cube, index, windows=WINDOWS, features=FEATURES):
+    """Flatten a feature cube into one column per (feature, window), e.g. Skewness_60."""
+    n, w, f = cube.shape
+    columns = [f'{feature}_{window}' for window in windows for feature in features]
+    return pd.DataFrame(cube.reshape(n, w * f), index=index, columns=columns)
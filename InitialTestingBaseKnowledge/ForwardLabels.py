@@ -0,0 +1,95 @@
+"""
+Forward-looking labels: "does the regime change within N bars" and k-bar
+forward returns.
+
+The scripts used to answer these with a nested lookahead loop per signal
+(step 9 of 2ClassificationOfRegimes.py, the refined signal and the
+Future_Change check in 3Kurtosis.py). Here one reverse scan gives the
+index of the next event for every bar, and each horizon after that is a
+single comparison, so 50 horizons cost about the same as one.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def events_from_labels(labels):
+    """True on every bar where the label differs from the bar before."""
+    labels = np.asarray(labels)
+    events = np.zeros(len(labels), dtype=bool)
+    events[1:] = labels[1:] != labels[:-1]
+    return events
+
+
+def next_event_index(events):
+    """Position of the first event strictly after each bar (len(events) if none).
+
+    Along the last axis, so a (paths x bars) array works as well.
+    """
+    events = np.asarray(events, dtype=bool)
+    n = events.shape[-1]
+    if n == 0:
+        # no bars, no positions (the shift below would add one)
+        return np.zeros(events.shape, dtype=np.int64)
+    positions = np.where(events, np.arange(n), n)
+    # next event at or after i, then shift by one to make it strictly after
+    at_or_after = np.minimum.accumulate(positions[..., ::-1], axis=-1)[..., ::-1]
+    return np.concatenate((at_or_after[..., 1:], np.full(events.shape[:-1] + (1,), n)), axis=-1)
+
+
+def bars_to_next_event(events):
+    """Bars until the next event after each bar, NaN when there isn't one."""
+    n = np.shape(events)[-1]
+    nxt = next_event_index(events)
+    out = (nxt - np.arange(n)).astype('float64')
+    out[nxt == n] = np.nan
+    return out
+
+
+def change_within(events, horizons):
+    """Boolean (bars x horizons) array: an event lands in the next h bars."""
+    bars = bars_to_next_event(events)
+    horizons = np.atleast_1d(horizons)
+    return bars[:, None] <= horizons[None, :]
+
+
+def forward_returns(close, horizons):
+    """(bars x horizons) array of close[i+k] / close[i] - 1, NaN past the end."""
+    close = np.asarray(close, dtype='float64')
+    n = len(close)
+    horizons = np.atleast_1d(horizons)
+    out = np.full((n, len(horizons)), np.nan)
+    for j, k in enumerate(horizons):
+        if 0 < k < n:
+            out[:n - k, j] = close[k:] / close[:-k] - 1
+    return out
+
+
+def forward_labels(df, horizons=(5,), events=None, column='Trend', price='Close'):
+    """Bars_To_Change, Change_Within_<h> and Fwd_Return_<h> for every bar.
+
+    Events default to the bars where `column` changes; pass a 0/1 column
+    such as df['Regime_Change'] to use that instead.
+    """
+    if events is None:
+        events = events_from_labels(df[column].to_numpy())
+    events = np.asarray(events) == 1
+    horizons = [int(h) for h in np.atleast_1d(horizons)]
+
+    labels = {'Bars_To_Change': bars_to_next_event(events)}
+    within = change_within(events, horizons)
+    for j, h in enumerate(horizons):
+        labels[f'Change_Within_{h}'] = within[:, j]
+    if price in df.columns:
+        fwd = forward_returns(df[price].to_numpy(), horizons)
+        for j, h in enumerate(horizons):
+            labels[f'Fwd_Return_{h}'] = fwd[:, j]
+    return pd.DataFrame(labels, index=df.index)
+
+
+def add_forward_labels(df, horizons=(5,), events=None, column='Trend', price='Close'):
+    """Store the labels as columns next to the features so they travel with df."""
+    labels = forward_labels(df, horizons, events=events, column=column, price=price)
+    for col in labels.columns:
+        df[col] = labels[col]
+    return df
@@ -0,0 +1,249 @@
+"""
+Per-stage instrumentation for the exhaustion pipeline.
+
+The scripts print banners ("Calculating KS-validated features...") but
+don't measure anything. A Recorder wraps each named stage and records
+
+* elapsed wall time and the rows it processed,
+* process RSS before/after and the process's peak RSS so far
+  (process_peak_rss: getrusage, the high water mark since the process
+  started, not of the stage),
+* Python allocations (tracemalloc): net delta and peak above the start
+  (nested stages included),
+* optionally a cProfile or a sampling profile of selected stages.
+
+Every stage becomes one JSON-able dict tagged with the run id and ticker,
+so a nightly run that overshoots can be diffed stage by stage against an
+earlier one.
+
+    rec = Recorder(run='nightly', profile=['features'])
+    with rec.stage('features') as s:
+        df = compute_features(close)
+        s['rows'] = len(df)
+    rec.dump('stage_timings.jsonl')
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:      # not on Windows
+    resource = None
+
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# tracemalloc peak of every open stage, outermost first; a nested stage
+# resets tracemalloc's peak, so the outer ones keep theirs here
+_peaks = []
+
+
+def rss_bytes():
+    """Current resident set size, or None where it can't be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """High water mark of the resident set size of this process since it started."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Sampler:
+    """Poor man's sampling profiler: a thread that looks at the stack of the
+    profiled thread every `interval` seconds and counts where it is."""
+
+    def __init__(self, thread_id, interval=0.005, depth=3):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.depth = depth
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        here = os.path.basename(__file__)
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            # a sample that lands in stop() is the sampler watching itself
+            if stack and not any(s.startswith(here) for s in stack):
+                self.counts[' <- '.join(stack)] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, top=10):
+        self._stop.set()
+        self._thread.join()
+        return [{'stack': k, 'samples': v, 'share': v / self.samples}
+                for k, v in self.counts.most_common(top)]
+
+
+def _profile_top(profiler, top=10):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({'function': f'{os.path.basename(filename)}:{line}({func})',
+                     'calls': nc, 'tottime': tt, 'cumtime': ct})
+    rows.sort(key=lambda r: r['cumtime'], reverse=True)
+    return rows[:top]
+
+
+class Recorder:
+    """Collects one record per stage.
+
+    profile / sample: stage names to run under cProfile / the sampling
+    profiler ('*' for all). With profile_dir set the raw cProfile stats are
+    also written there as <run>_<ticker>_<stage>.prof for snakeviz & co.
+    trace=False skips tracemalloc, which slows allocation heavy stages.
+    """
+
+    def __init__(self, run=None, ticker=None, profile=(), sample=(), trace=True,
+                 profile_dir=None, sample_interval=0.005):
+        self.run = run or uuid.uuid4().hex[:8]
+        self.ticker = ticker
+        self.profile = set(profile or ())
+        self.sample = set(sample or ())
+        self.trace = trace
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.records = []
+
+    def options(self):
+        # what a worker process needs to build its own Recorder
+        return {'run': self.run, 'profile': sorted(self.profile), 'sample': sorted(self.sample),
+                'trace': self.trace, 'profile_dir': self.profile_dir,
+                'sample_interval': self.sample_interval}
+
+    def for_ticker(self, ticker):
+        return Recorder(ticker=ticker, **self.options())
+
+    def _wants(self, chosen, name):
+        return '*' in chosen or name in chosen
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Times the with-block; set record['rows'] inside if not known up front."""
+        record = {'run': self.run, 'ticker': self.ticker, 'stage': name, 'rows': rows}
+
+        tracing = self.trace and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace:
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            alloc_start = tracemalloc.get_traced_memory()[0]
+            _peaks.append(alloc_start)
+        rss_start = rss_bytes()
+
+        profiler = sampler = None
+        if self._wants(self.profile, name):
+            profiler = cProfile.Profile()
+        if self._wants(self.sample, name):
+            sampler = _Sampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+
+        record['started'] = time.time()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['seconds'] = time.perf_counter() - start
+            if sampler is not None:
+                record['samples'] = sampler.stop()
+            if profiler is not None:
+                record['profile'] = _profile_top(profiler)
+                if self.profile_dir:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    parts = [self.run, self.ticker, name]
+                    path = os.path.join(self.profile_dir,
+                                        '_'.join(str(p) for p in parts if p) + '.prof')
+                    profiler.dump_stats(path)
+                    record['profile_file'] = path
+            if self.trace:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, _peaks.pop())
+                if _peaks:
+                    _peaks[-1] = max(_peaks[-1], peak)
+                record['alloc_delta'] = current - alloc_start
+                record['alloc_peak'] = peak - alloc_start
+            if tracing:
+                tracemalloc.stop()
+            rss_end = rss_bytes()
+            record['rss_start'] = rss_start
+            record['rss_end'] = rss_end
+            record['rss_delta'] = None if rss_start is None or rss_end is None else rss_end - rss_start
+            # getrusage: the whole process so far, not just this stage
+            record['process_peak_rss'] = peak_rss_bytes()
+            if record['rows'] is not None and record['seconds'] > 0:
+                record['rows_per_s'] = record['rows'] / record['seconds']
+            self.records.append(record)
+
+    def extend(self, records):
+        # records that came back from worker processes
+        self.records.extend(records)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        """Seconds, rows and memory per stage (summed over tickers)."""
+        df = self.to_frame()
+        if df.empty:
+            return df
+        how = {'tickers': ('ticker', 'nunique'), 'seconds': ('seconds', 'sum'),
+               'rows': ('rows', 'sum'), 'alloc_peak': ('alloc_peak', 'max'),
+               'process_peak_rss': ('process_peak_rss', 'max')}
+        how = {k: v for k, v in how.items() if v[0] in df.columns}
+        return df.groupby('stage', sort=False).agg(**how)
+
+    def dump(self, path):
+        """Append the records as JSON lines."""
+        with open(path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
+        return path
+
+
+@contextmanager
+def _nothing(rows=None):
+    yield {'rows': rows}
+
+
+def stage(recorder, name, rows=None):
+    """recorder.stage(name) or a do-nothing block when recorder is None."""
+    if recorder is None:
+        return _nothing(rows)
+    return recorder.stage(name, rows)
@@ -0,0 +1,291 @@
+"""
+Monte Carlo evaluation of the exhaustion signal on simulated regime switching paths.
+
+The evidence for the signal so far is a handful of SPY dates matched to
+news by hand (end of 2ClassificationOfRegimes.py). Here the true regime
+changes are known: thousands of Markov switching GBM paths
+(Synthetic.regime_switching_paths) go through the same stages as the
+pipeline - features, KS score, MA trend, regime age, exhaustion signal,
+levels - as (paths x bars) arrays, every stage one numpy call for all
+paths of a chunk. Chunks of paths can go to a process pool.
+
+Two detectors are scored against the true state changes:
+
+* exhaustion: a bar where Signal_0_100 enters the `level` zone (High or
+  Very High) is an alarm
+* trend: every MA crossover (Trend flip) is an alarm, the reference
+
+Per path: alarms, hits (a true change within the next `horizon` bars,
+as in ForwardLabels), hit rate, baseline min(1, change rate x horizon),
+edge, false alarms per 1000 bars, detection rate (changes followed by an
+alarm within max_delay bars) and the mean detection delay. summarize()
+gives their distribution over the paths plus the pooled delays.
+
+    per_path, delays = monte_carlo(paths=10_000, bars=1500, workers=4)
+    print(summarize(per_path, delays))
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Exhaustion import KS_WEIGHTS, normalized_weights, causal_zscore, causal_extreme
+from FeatureEngine import features_batch
+from ForwardLabels import next_event_index, bars_to_next_event
+from QuantileSketch import causal_quantiles
+from Synthetic import REGIMES, regime_switching_paths
+
+# cap on the cells of one (paths x bars) array, sets the default chunk
+BUDGET = 2 ** 20
+DETECTORS = ['exhaustion', 'trend']
+LEVELS = {'High': 0, 'Very High': 1}
+QUANTILES = (5, 25, 50, 75, 95)
+
+
+def _rolling_mean(x, k):
+    # mean of x[i-k+1:i+1] along the last axis, NaN for the first k-1 bars
+    c = np.concatenate((np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, axis=-1)), axis=-1)
+    out = np.full(x.shape, np.nan)
+    if k <= x.shape[-1]:
+        out[..., k - 1:] = (c[..., k:] - c[..., :-k]) / k
+    return out
+
+
+def batch_exhaustion(close, window=20, fast=20, slow=50, weights=KS_WEIGHTS, causal=False,
+                     levels=(0.75, 0.90)):
+    """run_pipeline for (paths x bars) gap-free closes, as a dict of (paths x bars - window) arrays.
+
+    Close, the features, KS_Score, Trend, Regime_Age, Signal_0_100 and
+    High_Threshold / Very_High_Threshold (one per path, broadcast over the
+    bars, or per bar when causal). causal=True uses the point-in-time
+    statistics of run_pipeline(causal=True); its thresholds come from one
+    quantile sketch per path, by far the slowest part.
+    """
+    out = features_batch(close, window)
+    ks = 0.0
+    for feature, weight in normalized_weights(weights).items():
+        x = out[feature]
+        if causal:
+            z = causal_zscore(x)
+        else:
+            mean = np.nanmean(x, axis=-1, keepdims=True)
+            std = np.nanstd(x, axis=-1, ddof=1, keepdims=True)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                z = np.where(std > 0, (x - mean) / std, 0.0)
+        ks = ks + z * weight * 100
+    out['KS_Score'] = ks
+
+    prices = out['Close']
+    with np.errstate(invalid='ignore'):
+        trend = np.where(_rolling_mean(prices, fast) > _rolling_mean(prices, slow), 1, -1)
+    out['Trend'] = trend.astype(np.int8)
+
+    n = trend.shape[-1]
+    bars = np.arange(n)
+    new = np.ones(trend.shape, dtype=bool)
+    new[:, 1:] = trend[:, 1:] != trend[:, :-1]
+    age = bars - np.maximum.accumulate(np.where(new, bars, 0), axis=-1)
+    out['Regime_Age'] = age
+
+    if causal:
+        max_age = causal_extreme(age.astype('float64'), np.fmax)
+    else:
+        max_age = age.max(axis=-1, keepdims=True)
+    signal = ks * (1 + age / np.maximum(1, max_age * 0.5))
+    if causal:
+        low, high = causal_extreme(signal, np.fmin), causal_extreme(signal, np.fmax)
+    else:
+        low = np.nanmin(signal, axis=-1, keepdims=True)
+        high = np.nanmax(signal, axis=-1, keepdims=True)
+    spread = high - low
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = np.where(spread > 0, 100 * (signal - low) / spread, np.nan)
+    out['Signal_0_100'] = scaled
+
+    if causal:
+        thresholds = np.stack([causal_quantiles(row, levels) for row in scaled])
+        thresholds = np.moveaxis(thresholds, -1, 0)
+    else:
+        thresholds = np.nanquantile(scaled, levels, axis=-1)[..., None]
+    out['High_Threshold'], out['Very_High_Threshold'] = thresholds[0], thresholds[1]
+    return out
+
+
+def _onsets(mask):
+    # first bar of every run of True
+    out = mask.copy()
+    out[:, 1:] &= ~mask[:, :-1]
+    return out
+
+
+def score(alarms, changes, horizon=20, max_delay=60, start=0):
+    """Per path counts for one detector, plus the pooled detection delays.
+
+    Nothing before bar `start` (warm-up) counts. changes / bars give the
+    change rate for the baseline; only alarms with `horizon` bars after
+    them (alarm_bars) are scored as hits or misses, and only changes with
+    `max_delay` bars after them (tracked) count for detection, by any
+    alarm up to max_delay bars later (the last `horizon` bars included).
+    """
+    n = alarms.shape[-1]
+    bars = np.arange(n)
+    live = alarms & (bars >= start)
+    # hit rates only over alarms that have their whole horizon ahead ...
+    alarms = live & (bars < n - horizon)
+    hits = alarms & (bars_to_next_event(changes) <= horizon)
+
+    # ... but a change is detected by any later alarm (first one at or after every bar, n if none)
+    first = np.where(live, bars, next_event_index(live))
+    delay = first - bars
+    tracked = changes & (bars >= start) & (bars < n - max_delay)
+    detected = tracked & (first < n) & (delay <= max_delay)
+    paths = len(alarms)
+    return {
+        'bars': np.full(paths, max(0, n - start)),
+        'changes': (changes & (bars >= start)).sum(axis=-1),
+        'alarm_bars': np.full(paths, max(0, n - horizon - start)),
+        'alarms': alarms.sum(axis=-1),
+        'hits': hits.sum(axis=-1),
+        'tracked': tracked.sum(axis=-1),
+        'detected': detected.sum(axis=-1),
+        'delay_sum': np.where(detected, delay, 0).sum(axis=-1),
+    }, delay[detected]
+
+
+def evaluate_paths(close, state, window=20, fast=20, slow=50, weights=KS_WEIGHTS, causal=False,
+                   level='High', horizon=20, max_delay=60):
+    """(per path DataFrame, {detector: pooled delays}) for one batch of simulated paths."""
+    arrays = batch_exhaustion(close, window, fast, slow, weights, causal)
+    state = np.asarray(state)
+    # a change is the first bar in the new state
+    changes = state[:, window:] != state[:, window - 1:-1]
+
+    threshold = arrays[('High_Threshold', 'Very_High_Threshold')[LEVELS[level]]]
+    with np.errstate(invalid='ignore'):
+        zone = arrays['Signal_0_100'] >= threshold
+    trend = arrays['Trend']
+    flips = np.zeros(trend.shape, dtype=bool)
+    flips[:, 1:] = trend[:, 1:] != trend[:, :-1]
+
+    parts, delays = [], {}
+    for name, alarms in zip(DETECTORS, (_onsets(zone), flips)):
+        counts, delays[name] = score(alarms, changes, horizon, max_delay, start=slow)
+        part = pd.DataFrame(dict(counts, horizon=horizon))
+        part.insert(0, 'detector', name)
+        part.insert(0, 'path', np.arange(len(part)))
+        parts.append(part)
+    return _rates(pd.concat(parts, ignore_index=True)), delays
+
+
+def _rates(df):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['hit_rate'] = df['hits'] / df['alarms']
+        df['baseline'] = np.minimum(1.0, df['changes'] / df['bars'] * df['horizon'])
+        df['edge'] = df['hit_rate'] / df['baseline'].where(df['baseline'] > 0)
+        df['false_alarms_per_1000'] = 1000 * (df['alarms'] - df['hits']) / df['alarm_bars']
+        df['detection_rate'] = df['detected'] / df['tracked']
+        df['mean_delay'] = df['delay_sum'] / df['detected']
+    return df
+
+
+def _run_chunk(job):
+    lo, size, bars, seed, sim, options = job
+    close, state = regime_switching_paths(size, bars, seed=seed, **sim)
+    per_path, delays = evaluate_paths(close, state, **options)
+    per_path['path'] += lo
+    return per_path, delays
+
+
+def monte_carlo(paths=1000, bars=1500, seed=0, switch_prob=0.01, regimes=REGIMES, chunk=None,
+                workers=1, **options):
+    """Simulate `paths` paths of `bars` bars and score both detectors on every one.
+
+    Paths are drawn and evaluated in chunks of `chunk` (default: what fits
+    BUDGET cells), each chunk with its own child of `seed`, so the same
+    seed and chunk give the same paths for any number of workers.
+    Options go to evaluate_paths. Returns (per_path, {detector: delays}).
+    """
+    chunk = chunk or max(1, BUDGET // bars)
+    starts = list(range(0, paths, chunk))
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    sim = {'switch_prob': switch_prob, 'regimes': regimes}
+    jobs = [(lo, min(chunk, paths - lo), bars, s, sim, options) for lo, s in zip(starts, seeds)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        results = [_run_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_run_chunk, jobs))
+    per_path = pd.concat([r[0] for r in results], ignore_index=True)
+    per_path = per_path.sort_values(['detector', 'path'], kind='stable').reset_index(drop=True)
+    delays = {name: np.concatenate([r[1][name] for r in results]) for name in DETECTORS}
+    return per_path, delays
+
+
+def summarize(per_path, delays=None, q=QUANTILES):
+    """Distribution over paths of every rate, one row per (detector, metric).
+
+    Columns: mean, the q percentiles and pooled (all paths' counts added up
+    first). With delays, a 'delay' row gives the distribution of every
+    detection delay of every path.
+    """
+    metrics = ['hit_rate', 'edge', 'false_alarms_per_1000', 'detection_rate', 'mean_delay']
+    rows = {}
+    for name, group in per_path.groupby('detector', sort=False):
+        total = group[['bars', 'changes', 'alarm_bars', 'alarms', 'hits', 'tracked', 'detected',
+                       'delay_sum']].sum()
+        total = _rates(total.to_frame().T.assign(horizon=group['horizon'].iloc[0]))
+        for metric in metrics:
+            values = group[metric].to_numpy('float64')
+            values = values[np.isfinite(values)]
+            row = {'mean': values.mean() if len(values) else np.nan}
+            row.update({f'p{p}': np.percentile(values, p) if len(values) else np.nan for p in q})
+            row['pooled'] = float(total[metric].iloc[0])
+            rows[(name, metric)] = row
+        if delays is not None:
+            d = np.asarray(delays[name], dtype='float64')
+            row = {'mean': d.mean() if len(d) else np.nan}
+            row.update({f'p{p}': np.percentile(d, p) if len(d) else np.nan for p in q})
+            row['pooled'] = row['mean']
+            rows[(name, 'delay')] = row
+    out = pd.DataFrame.from_dict(rows, orient='index')
+    out.index = out.index.set_names(['detector', 'metric'])
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--paths', type=int, default=1000)
+    parser.add_argument('--bars', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--switch-prob', type=float, default=0.01)
+    parser.add_argument('--level', choices=list(LEVELS), default='High')
+    parser.add_argument('--horizon', type=int, default=20)
+    parser.add_argument('--max-delay', type=int, default=60)
+    parser.add_argument('--causal', action='store_true', help='point-in-time statistics (slower)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk', type=int, help='paths per chunk')
+    parser.add_argument('--out', help='write the per path metrics to this CSV')
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    per_path, delays = monte_carlo(args.paths, args.bars, seed=args.seed,
+                                   switch_prob=args.switch_prob, chunk=args.chunk,
+                                   workers=args.workers, level=args.level, horizon=args.horizon,
+                                   max_delay=args.max_delay, causal=args.causal)
+    seconds = time.perf_counter() - t0
+    print(f"{args.paths} paths x {args.bars} bars in {seconds:.1f}s "
+          f"({args.paths * args.bars / seconds:,.0f} bars/s)")
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(summarize(per_path, delays).to_string())
+    if args.out:
+        per_path.to_csv(args.out, index=False)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Parameter sweep for the refined Skew/Kurtosis rule in 3Kurtosis.py.
+
+Instead of hand-tuning SKEW_MIN/SKEW_MAX/KURT_MIN/KURT_MAX, the regime age
+filter and LOOKAHEAD_DAYS one run at a time, the features and the forward
+labels are prepared once, then every candidate is a row in a batch of
+vectorized masks: (candidates x bars) comparisons, summed into signal and
+hit counts. Batches are spread over a process pool, and a ticker universe
+is just the per-ticker arrays laid end to end.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ForwardLabels import change_within
+
+PARAMS = ['skew_min', 'skew_max', 'kurt_min', 'kurt_max', 'min_age', 'lookahead']
+
+# what 3Kurtosis.py runs with today
+DEFAULTS = {
+    'skew_min': -2.0,
+    'skew_max': -0.4,
+    'kurt_min': 1.5,
+    'kurt_max': 7.0,
+    'min_age': 10,
+    'lookahead': 5,
+}
+
+# cap on the number of cells in one (candidates x bars) mask
+MASK_BUDGET = 2 ** 25
+
+
+def grid(**ranges):
+    """Every combination of the given values, other parameters at DEFAULTS."""
+    values = [np.atleast_1d(ranges.get(p, DEFAULTS[p])) for p in PARAMS]
+    return pd.DataFrame(list(itertools.product(*values)), columns=PARAMS)
+
+
+def random_sample(n, bounds, seed=0):
+    """n candidates drawn uniformly inside bounds = {param: (low, high)}."""
+    rng = np.random.default_rng(seed)
+    out = {}
+    for p in PARAMS:
+        if p not in bounds:
+            out[p] = np.full(n, DEFAULTS[p])
+            continue
+        low, high = bounds[p]
+        if p in ('min_age', 'lookahead'):
+            out[p] = rng.integers(low, high + 1, n)
+        else:
+            out[p] = rng.uniform(low, high, n)
+    combos = pd.DataFrame(out)
+    # a min above its max can never fire, no point evaluating it
+    keep = (combos['skew_min'] < combos['skew_max']) & (combos['kurt_min'] < combos['kurt_max'])
+    return combos[keep].reset_index(drop=True)
+
+
+def prepare(frames, lookaheads, regime=1):
+    """Features and forward labels for one df or a {ticker: df} universe.
+
+    Each df needs Skewness, Kurtosis, Regime and Regime_Change (Regime_Age
+    is derived the same way 3Kurtosis.py does if it's missing).
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = {'': frames}
+    lookaheads = np.unique(np.atleast_1d(lookaheads)).astype(int)
+
+    skew, kurt, age, within = [], [], [], []
+    changes = bars = 0
+    for df in frames.values():
+        if 'Regime_Age' in df.columns:
+            regime_age = df['Regime_Age'].to_numpy()
+        else:
+            regime_age = df.groupby('Regime').cumcount().to_numpy()
+        events = df['Regime_Change'].to_numpy() == 1
+        # bars outside the wanted regime can never signal, drop them up front
+        keep = df['Regime'].to_numpy() == regime
+
+        skew.append(df['Skewness'].to_numpy('float64')[keep])
+        kurt.append(df['Kurtosis'].to_numpy('float64')[keep])
+        age.append(regime_age[keep].astype('float64'))
+        within.append(change_within(events, lookaheads)[keep])
+        changes += int(events.sum())
+        bars += len(df)
+
+    return {
+        'skew': np.concatenate(skew),
+        'kurt': np.concatenate(kurt),
+        'age': np.concatenate(age),
+        'within': np.concatenate(within).T.copy(),
+        'lookaheads': lookaheads,
+        'change_rate': changes / bars if bars else 0.0,
+    }
+
+
+def evaluate(prepared, combos):
+    """Signal count, hits, hit rate and edge for every row of combos."""
+    skew, kurt, age = prepared['skew'], prepared['kurt'], prepared['age']
+    lookaheads = prepared['lookaheads']
+    n = len(skew)
+    size = max(1, MASK_BUDGET // max(n, 1))
+
+    params = {p: combos[p].to_numpy() for p in PARAMS}
+    row = np.searchsorted(lookaheads, params['lookahead'])
+    if np.any(lookaheads[np.minimum(row, len(lookaheads) - 1)] != params['lookahead']):
+        raise ValueError('combos use a lookahead that prepare() was not given')
+
+    signals = np.zeros(len(combos), dtype=np.int64)
+    hits = np.zeros(len(combos), dtype=np.int64)
+    for lo in range(0, len(combos), size):
+        sl = slice(lo, lo + size)
+        col = lambda p: params[p][sl, None]
+        mask = ((skew < col('skew_max')) & (skew > col('skew_min')) &
+                (kurt > col('kurt_min')) & (kurt < col('kurt_max')) &
+                (age > col('min_age')))
+        signals[sl] = mask.sum(axis=1)
+        hits[sl] = (mask & prepared['within'][row[sl]]).sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hit_rate = hits / signals
+    # same baseline as 3Kurtosis.py: change rate times the lookahead
+    baseline = np.minimum(1.0, prepared['change_rate'] * params['lookahead'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        edge = np.where(baseline > 0, hit_rate / baseline, 0.0)
+
+    out = combos.reset_index(drop=True).copy()
+    out['signals'] = signals
+    out['hits'] = hits
+    out['hit_rate'] = hit_rate
+    out['baseline'] = baseline
+    out['edge'] = edge
+    return out
+
+
+_worker_data = None
+
+
+def _init_worker(prepared):
+    global _worker_data
+    _worker_data = prepared
+
+
+def _evaluate_chunk(combos):
+    return evaluate(_worker_data, combos)
+
+
+def sweep(frames, combos, workers=None, chunk=4096, regime=1):
+    """Evaluate combos against one df or a {ticker: df} universe.
+
+    The prepared arrays go to each worker once (initializer), after that only
+    the candidate chunks travel. workers=1 runs in this process.
+    """
+    prepared = prepare(frames, combos['lookahead'].unique(), regime=regime)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(combos) <= chunk:
+        return evaluate(prepared, combos)
+
+    chunks = [combos.iloc[i:i + chunk] for i in range(0, len(combos), chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(prepared,)) as pool:
+        results = list(pool.map(_evaluate_chunk, chunks))
+    return pd.concat(results, ignore_index=True)
+
+
+def best(results, min_signals=20, by='edge', top=10):
+    """Top candidates that fired often enough to mean something."""
+    ranked = results[results['signals'] >= min_signals]
+    return ranked.sort_values(by, ascending=False).head(top)
@@ -0,0 +1,254 @@
+"""
+The single-ticker exhaustion pipeline from 2ClassificationOfRegimes.py as
+one call: features -> KS score -> MA trend -> regime age -> exhaustion
+signal -> levels -> regime segment table.
+
+Pass an Instrument.Recorder to get time / rows / memory per stage.
+
+compact=True keeps the frame lean for big universes: the z-scores, moving
+averages and Trend_Change are dropped as soon as the next step has used
+them, features and scores become float32, Trend int8, Regime_Age int32
+and Exhaustion_Level a categorical (int8 codes). Close stays float64.
+About 55 bytes per bar instead of ~215.
+
+causal=True is the point-in-time version: z-scores, fatigue and the 0-100
+scaling from expanding (or norm_window rolling) statistics and causal
+level thresholds, so no bar looks at later ones. Such a frame is append
+only: CausalPipeline keeps the running state of a causal run so the bars
+that come in later are computed on their own and the stored rows stay
+as they are.
+"""
+
+import numpy as np
+import pandas as pd
+
+from Exhaustion import FEATURES, KS_WEIGHTS, ks_score, add_trend, exhaustion_signal, exhaustion_levels
+from FeatureEngine import compute_features
+from Instrument import stage
+from QuantileSketch import CausalQuantiles
+from RegimeSegments import regime_age, segment_table
+
+
+LEVELS = ['Normal', 'High', 'Very High']
+PRICES = ['Close']     # stay float64
+
+
+def intermediates(df):
+    """Columns only the next pipeline step needs: z-scores, moving averages, Trend_Change."""
+    return [c for c in df.columns if c.endswith('_Z') or c.startswith('MA_') or c == 'Trend_Change']
+
+
+def compact_frame(df, keep=(), floats='float32'):
+    """Lean copy of a pipeline frame (intermediates dropped unless in keep, narrow dtypes)."""
+    df = df.drop(columns=[c for c in intermediates(df) if c not in keep])
+    for col in df.columns:
+        values = df[col]
+        if col == 'Exhaustion_Level':
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[col] = pd.Categorical(values, categories=LEVELS)
+        elif col == 'Trend':
+            df[col] = values.astype(np.int8)
+        elif col == 'Regime_Age':
+            df[col] = values.astype(np.int32)
+        elif col not in PRICES and values.dtype.kind == 'f':
+            df[col] = values.astype(floats)
+    return df
+
+
+def bytes_per_bar(df):
+    return df.memory_usage(deep=True).sum() / max(1, len(df))
+
+
+def run_pipeline(close, window=20, fast=20, slow=50, weights=KS_WEIGHTS, recorder=None,
+                 causal_levels=False, compact=False, causal=False, norm_window=None,
+                 sketch=None):
+    """Returns (df, regimes, thresholds) for one close price series.
+
+    causal_levels=True uses point-in-time level thresholds (see exhaustion_levels).
+    causal=True makes everything point in time (implies causal_levels);
+    norm_window: rolling instead of expanding statistics, in bars.
+    compact=True returns the lean frame (see compact_frame), with its
+    bytes_per_bar in the 'compact' stage record. sketch: the
+    CausalQuantiles for the causal thresholds (see CausalPipeline).
+    """
+    with stage(recorder, 'features', rows=len(close)):
+        df = compute_features(close, window=window)
+    with stage(recorder, 'ks_score', rows=len(df)):
+        df = ks_score(df, weights, causal=causal, window=norm_window)
+        if compact:
+            df = df.drop(columns=intermediates(df))
+    with stage(recorder, 'ma_trend', rows=len(df)):
+        df = add_trend(df, fast=fast, slow=slow)
+        if compact:
+            df = df.drop(columns=intermediates(df))
+            df['Trend'] = df['Trend'].astype(np.int8)
+    with stage(recorder, 'regime_age', rows=len(df)):
+        df['Regime_Age'] = regime_age(df['Trend'])
+    with stage(recorder, 'signal', rows=len(df)):
+        df = exhaustion_signal(df, causal=causal, window=norm_window)
+    with stage(recorder, 'levels', rows=len(df)):
+        thresholds = exhaustion_levels(df, causal=causal_levels or causal,
+                                       window=norm_window if causal else None, sketch=sketch)
+    with stage(recorder, 'regime_history', rows=len(df)):
+        regimes = segment_table(df, 'Trend')
+    if compact:
+        with stage(recorder, 'compact', rows=len(df)) as record:
+            df = compact_frame(df)
+            record['bytes_per_bar'] = bytes_per_bar(df)
+    return df, regimes, thresholds
+
+
+def _moments(values):
+    # (count, mean, m2) of the finite values, what causal_zscore carries on from
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return 0, 0.0, 0.0
+    mean = values.mean()
+    return len(values), mean, float(((values - mean) ** 2).sum())
+
+
+def _merge_moments(a, b):
+    # Chan et al. parallel update of two (count, mean, m2)
+    (na, ma, sa), (nb, mb, sb) = a, b
+    if not nb:
+        return a
+    if not na:
+        return b
+    n = na + nb
+    delta = mb - ma
+    return n, ma + delta * nb / n, sa + sb + delta * delta * na * nb / n
+
+
+class CausalPipeline:
+    """run_pipeline(causal=True) kept open for the bars that come in later.
+
+        live = CausalPipeline(close)                # one full run
+        df, regimes, thresholds = live.extend(close)    # next day, with the new bars
+
+    extend() only pushes the new bars through: features from the last
+    `window` closes before them, moving averages from the last `slow`
+    closes, Trend_Change and regime age from the last stored row. The
+    expanding statistics are carried as running sums (count / mean / m2,
+    max age, min / max signal) or, with norm_window, the last norm_window
+    rows; the level thresholds keep their quantile sketches. Only the last
+    row of the regime table (the regime still going on) is redone. So an
+    extend costs the new bars plus the current regime, not the whole
+    history, and gives the same (df, regimes, thresholds) as a full run
+    over all the bars. The stored rows are never recomputed.
+    """
+
+    def __init__(self, close, window=20, fast=20, slow=50, weights=KS_WEIGHTS, recorder=None,
+                 compact=False, norm_window=None):
+        self.window, self.fast, self.slow = window, fast, slow
+        self.weights = weights
+        self.compact = compact
+        self.norm_window = norm_window
+        self.sketch = CausalQuantiles(window=norm_window)
+        df, self.regimes, self.thresholds = run_pipeline(
+            close, window, fast, slow, weights, recorder, causal=True, norm_window=norm_window,
+            sketch=self.sketch)
+        self._remember(df, first=True)
+        if compact:
+            with stage(recorder, 'compact', rows=len(df)) as record:
+                df = compact_frame(df)
+                record['bytes_per_bar'] = bytes_per_bar(df)
+            # int8 trend in the table, as run_pipeline(compact=True) gives it
+            self.regimes['trend'] = self.regimes['trend'].astype(df['Trend'].dtype)
+        self.df = df
+
+    def _remember(self, rows, first=False):
+        # what the next extend needs from these (float64, before compacting)
+        keep = max(self.slow, self.norm_window or 0) - 1
+        recent = rows[['Close', 'Trend', 'Regime_Age', 'Exhaustion_Signal'] + FEATURES].astype('float64')
+        if not first:
+            recent = pd.concat([self.recent, recent])
+        self.recent = recent.iloc[len(recent) - min(len(recent), keep):]
+        if self.norm_window is not None:
+            return
+        signal = rows['Exhaustion_Signal'].to_numpy('float64')
+        age = rows['Regime_Age'].to_numpy('float64')
+        if first:
+            self.moments = {f: (0, 0.0, 0.0) for f in FEATURES}
+            self.max_age = self.low = self.high = np.nan
+        for feature in FEATURES:
+            self.moments[feature] = _merge_moments(self.moments[feature], _moments(rows[feature]))
+        self.max_age = np.fmax.reduce(np.append(age, self.max_age))
+        self.low = np.fmin.reduce(np.append(signal, self.low))
+        self.high = np.fmax.reduce(np.append(signal, self.high))
+
+    def _history(self):
+        # the earlier bars as ks_score / exhaustion_signal take them
+        if self.norm_window is not None:
+            return {c: self.recent[c].to_numpy() for c in self.recent.columns}
+        history = dict(self.moments)
+        history['Regime_Age'] = np.array([self.max_age])
+        history['Exhaustion_Signal'] = np.array([self.low, self.high])
+        return history
+
+    def extend(self, close, recorder=None):
+        """Append the bars of close after the last stored one; returns (df, regimes, thresholds)."""
+        df = self.df
+        new = close.index > df.index[-1]
+        if not new.any():
+            return df, self.regimes, self.thresholds
+        first = int(np.argmax(new))
+
+        with stage(recorder, 'features', rows=int(new.sum())):
+            tail = compute_features(close.iloc[max(0, first - self.window):], window=self.window)
+            tail = tail[tail.index > df.index[-1]]
+        history = self._history()
+        with stage(recorder, 'ks_score', rows=len(tail)):
+            tail = ks_score(tail, self.weights, causal=True, window=self.norm_window, history=history)
+        last_trend = self.recent['Trend'].iloc[-1]
+        with stage(recorder, 'ma_trend', rows=len(tail)):
+            context = self.recent[['Close']].iloc[-(self.slow - 1):]
+            tail = add_trend(pd.concat([context, tail]), fast=self.fast,
+                             slow=self.slow).iloc[len(context):].copy()
+            # the context rows have no slow average (Trend -1), diff against the stored Trend
+            tail['Trend_Change'] = np.diff(tail['Trend'].to_numpy(), prepend=last_trend).astype('float64')
+        with stage(recorder, 'regime_age', rows=len(tail)):
+            trend = np.concatenate(([last_trend], tail['Trend'].to_numpy()))
+            age = regime_age(trend)
+            # the run that was going on at df's last bar keeps counting
+            carried = len(trend) if (trend == trend[0]).all() else int(np.argmax(trend != trend[0]))
+            age[:carried] += int(self.recent['Regime_Age'].iloc[-1])
+            tail['Regime_Age'] = age[1:]
+        with stage(recorder, 'signal', rows=len(tail)):
+            tail = exhaustion_signal(tail, causal=True, window=self.norm_window, history=history)
+        with stage(recorder, 'levels', rows=len(tail)):
+            self.thresholds = exhaustion_levels(tail, causal=True, window=self.norm_window,
+                                                sketch=self.sketch)
+        self._remember(tail)
+
+        # same columns and dtypes as df (compact frames stay compact)
+        tail = tail.reindex(columns=df.columns).astype(df.dtypes.to_dict())
+        self.df = df = pd.concat([df, tail])
+        with stage(recorder, 'regime_history', rows=len(df) - int(self.regimes['start_pos'].iloc[-1])):
+            # regimes that ended before df's last bar are done, redo the last one onwards
+            start = int(self.regimes['start_pos'].iloc[-1])
+            current = segment_table(df.iloc[start:], 'Trend')
+            current[['start_pos', 'end_pos']] += start
+            current = current.astype(self.regimes.dtypes.to_dict())
+            self.regimes = pd.concat([self.regimes.iloc[:-1], current], ignore_index=True)
+        return df, self.regimes, self.thresholds
+
+
+def latest_state(df, regimes):
+    """One summary row for the last bar, what a nightly screen looks at."""
+    last = df.iloc[-1]
+    current = regimes.iloc[-1]
+    return {
+        'Date': df.index[-1],
+        'Close': float(last['Close']),
+        'Signal_0_100': float(last['Signal_0_100']),
+        'Exhaustion_Level': last['Exhaustion_Level'],
+        'Trend': 'Uptrend' if last['Trend'] > 0 else 'Downtrend',
+        'Regime_Age': int(last['Regime_Age']),
+        'Regime_Start': current['start_date'],
+        'Regime_Days': int(current['duration_days']),
+        'Regime_Avg_Exhaustion': float(current['avg_exhaustion']),
+        'Regime_High_Periods': int(current['high_exhaustion_periods']),
+        'Regimes': len(regimes),
+        'Bars': len(df),
+    }
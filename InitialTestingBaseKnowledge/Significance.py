@@ -0,0 +1,289 @@
+"""
+Significance of a signal's hit rate and edge (p-values and confidence intervals).
+
+3Kurtosis.py compares the refined signal's hit rate to a baseline of
+change rate x lookahead and calls 2x "excellent", with no idea how much
+of that is luck. Signals come in clusters and the forward labels overlap,
+so a plain binomial test is far too generous. Two resampling schemes that
+keep the time structure:
+
+* circular shift permutation (the null): the signal series is rotated
+  against the labels by a random offset. Signal count, clustering and the
+  label series all stay as they are, only the alignment is broken. The
+  hits for every rotation at once are one circular cross-correlation
+  (FFT), so thousands of shifts cost about as much as one.
+* moving block bootstrap (the intervals): blocks of `block` bars are
+  drawn with replacement, signal / hit / change counts of every block
+  come from prefix sums, so one resample is a sum over ~n/block gathered
+  block totals instead of n bars.
+
+Both run on a (rules x bars) matrix of signals at once, in chunks that
+stay under BUDGET cells. A big significance() call sends its chunks to a
+process pool, and test_rules() spreads tickers over one the way
+ParameterSweep.sweep() does.
+
+    stats = significance(df['Signal_Refined'], labels['Change_Within_5'],
+                         df['Regime_Change'], lookahead=5)
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ForwardLabels import change_within
+from ParameterSweep import PARAMS
+
+# cap on the number of cells in one intermediate array
+BUDGET = 2 ** 24
+
+
+def _as_rules(signals):
+    signals = np.asarray(signals)
+    return np.atleast_2d(signals).astype(bool), signals.ndim == 1
+
+
+def circular_hits(signals, labels, shifts):
+    """Hits of every rule with the signals rotated by each shift, shape (rules, shifts).
+
+    Rotating by k lines the signal on bar t up with the label on bar t + k
+    (wrapping around); shift 0 is the observed hit count.
+    """
+    signals, _ = _as_rules(signals)
+    labels = np.asarray(labels, dtype='float64')
+    n = signals.shape[1]
+    shifts = np.asarray(shifts) % n
+    spectrum = np.fft.rfft(labels)
+    out = np.empty((len(signals), len(shifts)), dtype=np.int64)
+    rows = max(1, BUDGET // (2 * n))
+    for lo in range(0, len(signals), rows):
+        cross = np.fft.irfft(np.conj(np.fft.rfft(signals[lo:lo + rows], axis=1)) * spectrum,
+                             n=n, axis=1)
+        out[lo:lo + rows] = np.rint(cross[:, shifts])
+    return out
+
+
+def _block_sums(x, block):
+    # sum of x[i:i + block] for every start i, wrapping around the end
+    x = np.asarray(x, dtype=np.int64)
+    ext = np.concatenate((x, x[..., :block]), axis=-1)
+    cs = np.concatenate((np.zeros(x.shape[:-1] + (1,), dtype=np.int64), np.cumsum(ext, axis=-1)), axis=-1)
+    n = x.shape[-1]
+    return cs[..., block:block + n] - cs[..., :n]
+
+
+def _boot_starts(n, n_boot, block, seed):
+    # first bar of every block of every resample, shape (n_boot, blocks)
+    blocks = int(math.ceil(n / block))
+    return np.random.default_rng(seed).integers(0, n, (n_boot, blocks))
+
+
+def _boot_baseline(events, starts, block, lookahead):
+    blocks = starts.shape[1]
+    change_rate = _block_sums(np.asarray(events, dtype=bool), block)[starts].sum(axis=1) / (blocks * block)
+    return np.minimum(1.0, change_rate * lookahead)
+
+
+def _bootstrap_counts(signals, labels, starts, block):
+    # signal and hit counts of every rule in every resample, each (rules, resamples)
+    n = signals.shape[1]
+    n_boot, blocks = starts.shape
+    count = np.empty((len(signals), n_boot))
+    hits = np.empty((len(signals), n_boot))
+    rows = max(1, BUDGET // (4 * n))
+    for lo in range(0, len(signals), rows):
+        s = signals[lo:lo + rows]
+        r = len(s)
+        # bars x (signal sums, hit sums): one resample gathers whole rows of it
+        sums = np.empty((n, 2 * r), dtype=np.int32)
+        sums[:, :r] = _block_sums(s, block).T
+        sums[:, r:] = _block_sums(s & labels, block).T
+        size = max(1, BUDGET // (2 * r * blocks))
+        for b in range(0, n_boot, size):
+            total = sums[starts[b:b + size]].sum(axis=1).T
+            count[lo:lo + r, b:b + size] = total[:r]
+            hits[lo:lo + r, b:b + size] = total[r:]
+    return count, hits
+
+
+def block_bootstrap(signals, labels, events, lookahead, n_boot=2000, block=20, seed=0):
+    """Moving block bootstrap of (signals, hits, baseline), each shape (rules, n_boot)."""
+    signals, _ = _as_rules(signals)
+    labels = np.asarray(labels, dtype=bool)
+    starts = _boot_starts(signals.shape[1], n_boot, block, seed)
+    baseline = _boot_baseline(events, starts, block, lookahead)
+    count, hits = _bootstrap_counts(signals, labels, starts, block)
+    return count, hits, np.broadcast_to(baseline, count.shape)
+
+
+def _resample_job(args):
+    kind, signals, labels, draws, block = args
+    if kind == 'perm':
+        return circular_hits(signals, labels, draws)
+    return _bootstrap_counts(signals, labels, draws, block)
+
+
+def _resample(signals, labels, shifts, starts, block, workers):
+    """(rotation hits or None, bootstrap counts, bootstrap hits) of every rule.
+
+    Small jobs stay in this process. Bigger ones are cut into rule chunks
+    (and, with fewer rules than workers, chunks of resamples) that go to a
+    process pool; the shifts and block starts are drawn before, so the
+    result is the same either way.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(signals) * starts.size < BUDGET:
+        perm = None if shifts is None else circular_hits(signals, labels, shifts)
+        return (perm,) + _bootstrap_counts(signals, labels, starts, block)
+
+    rows = np.array_split(np.arange(len(signals)), min(workers, len(signals)))
+    boots = np.array_split(np.arange(len(starts)), min(max(1, workers // len(rows)), len(starts)))
+    jobs = []
+    for r in rows:
+        if shifts is not None:
+            jobs.append(('perm', signals[r], labels, shifts, block))
+        jobs.extend(('boot', signals[r], labels, starts[b], block) for b in boots)
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        results = iter(pool.map(_resample_job, jobs))
+        perm, count, hits = [], [], []
+        for r in rows:
+            if shifts is not None:
+                perm.append(next(results))
+            parts = [next(results) for _ in boots]
+            count.append(np.concatenate([c for c, _ in parts], axis=1))
+            hits.append(np.concatenate([h for _, h in parts], axis=1))
+    return (None if shifts is None else np.concatenate(perm)), np.concatenate(count), np.concatenate(hits)
+
+
+def significance(signals, labels, events, lookahead, n_perm=2000, n_boot=2000, block=None,
+                 min_shift=None, alpha=0.05, seed=0, workers=None):
+    """Hit rate, edge, permutation p-value and bootstrap intervals.
+
+    signals: bool per bar (or a rules x bars matrix), labels: the regime
+    changes within `lookahead` bars (ForwardLabels Change_Within_<h>),
+    events: the regime changes themselves, for the baseline
+    min(1, change rate x lookahead) used everywhere else.
+
+    Shifts closer than min_shift to 0 (default: the block length) are not
+    used, they'd keep most of the real alignment. The signal count and the
+    baseline don't move under a rotation, so p_value is the p-value of the
+    hit rate and of the edge alike: (1 + shifts doing at least as well) /
+    (1 + n_perm). Intervals are bootstrap percentiles at alpha.
+
+    Calls big enough to be worth it spread their rule / resample chunks
+    over `workers` processes (default: all cores; 1 never starts a pool).
+
+    Returns a dict for one signal, a DataFrame (one row per rule) for a matrix.
+    """
+    signals, single = _as_rules(signals)
+    labels = np.asarray(labels, dtype=bool)
+    events = np.asarray(events, dtype=bool)
+    n = signals.shape[1]
+    block = block or max(2 * lookahead, int(round(n ** (1 / 3))))
+    min_shift = min_shift if min_shift is not None else block
+    rng = np.random.default_rng(seed)
+
+    count = signals.sum(axis=1)
+    baseline = min(1.0, events.sum() / n * lookahead) if n else 0.0
+    shifts = None
+    if n > 2 * min_shift:
+        shifts = np.concatenate(([0], rng.integers(min_shift, n - min_shift + 1, n_perm)))
+    starts = _boot_starts(n, n_boot, block, rng)
+    boot_base = _boot_baseline(events, starts, block, lookahead)
+    hits_all, boot_count, boot_hits = _resample(signals, labels, shifts, starts, block, workers)
+    if shifts is not None:
+        hits, null = hits_all[:, 0], hits_all[:, 1:]
+        p_value = (1 + (null >= hits[:, None]).sum(axis=1)) / (1 + null.shape[1])
+    else:
+        hits = (signals & labels).sum(axis=1)
+        null = np.full((len(signals), 1), np.nan)
+        p_value = np.full(len(signals), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hit_rate = hits / count
+        edge = hit_rate / baseline if baseline > 0 else np.zeros(len(signals))
+        boot_rate = boot_hits / boot_count
+        boot_edge = np.where(boot_base > 0, boot_rate / boot_base, np.nan)
+        null_rate = np.nanmean(null, axis=1) / count
+
+    q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    rate_ci = _percentiles(boot_rate, q)
+    edge_ci = _percentiles(boot_edge, q)
+    out = pd.DataFrame({
+        'signals': count,
+        'hits': hits,
+        'hit_rate': hit_rate,
+        'baseline': baseline,
+        'edge': edge,
+        'p_value': p_value,
+        'null_hit_rate': null_rate,
+        'hit_rate_lo': rate_ci[0],
+        'hit_rate_hi': rate_ci[1],
+        'edge_lo': edge_ci[0],
+        'edge_hi': edge_ci[1],
+    })
+    return out.iloc[0].to_dict() if single else out
+
+
+def _percentiles(values, q):
+    # resamples without a single signal have no hit rate, leave them out
+    out = np.full((len(q), len(values)), np.nan)
+    ok = np.isfinite(values).any(axis=1)
+    if ok.any():
+        out[:, ok] = np.nanpercentile(values[ok], q, axis=1)
+    return out
+
+
+def rule_masks(df, combos, regime=1):
+    """(rules x bars) signals of the ParameterSweep rule for every row of combos."""
+    skew = df['Skewness'].to_numpy('float64')
+    kurt = df['Kurtosis'].to_numpy('float64')
+    if 'Regime_Age' in df.columns:
+        age = df['Regime_Age'].to_numpy('float64')
+    else:
+        age = df.groupby('Regime').cumcount().to_numpy('float64')
+    in_regime = df['Regime'].to_numpy() == regime
+    col = lambda p: combos[p].to_numpy()[:, None]
+    return ((skew < col('skew_max')) & (skew > col('skew_min')) &
+            (kurt > col('kurt_min')) & (kurt < col('kurt_max')) &
+            (age > col('min_age')) & in_regime)
+
+
+def _test_ticker(args):
+    ticker, df, combos, regime, options = args
+    events = df['Regime_Change'].to_numpy() == 1
+    parts = []
+    for lookahead, rules in combos.groupby('lookahead', sort=False):
+        lookahead = int(lookahead)
+        labels = change_within(events, [lookahead])[:, 0]
+        stats = significance(rule_masks(df, rules, regime), labels, events, lookahead, **options)
+        stats.index = rules.index
+        parts.append(pd.concat([rules, stats], axis=1))
+    out = pd.concat(parts).sort_index()
+    out.insert(0, 'Ticker', ticker)
+    return out
+
+
+def test_rules(frames, combos, workers=None, regime=1, **options):
+    """significance() for every rule in combos (ParameterSweep grid / random_sample)
+    on one df or each df of a {ticker: df} universe.
+
+    Every ticker is tested on its own series (rotations and blocks never
+    cross tickers); tickers go to a process pool, workers=1 stays in this
+    process. A single ticker hands the workers to significance(), which
+    spreads its chunks instead. Options go to significance().
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = {'': frames}
+    combos = combos[PARAMS].reset_index(drop=True)
+    workers = workers or os.cpu_count() or 1
+    # one pool at a time: over tickers, or inside significance() for just one
+    inner = workers if len(frames) == 1 else 1
+    jobs = [(t, df, combos, regime, dict(options, workers=inner)) for t, df in frames.items()]
+    if workers == 1 or len(jobs) == 1:
+        results = [_test_ticker(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_test_ticker, jobs))
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,53 @@
+"""
+Deterministic synthetic prices for offline runs and benchmarks.
+
+Geometric Brownian motion whose drift and volatility switch between a calm
+uptrend and a volatile downtrend, with the switches drawn from a fixed-seed
+two state Markov chain. Same seed, same series, on any machine.
+regime_switching_paths() draws thousands of such paths at once as a
+(paths x bars) array, for Monte Carlo studies (MonteCarlo.py).
+"""
+
+import numpy as np
+import pandas as pd
+
+# (daily drift, daily vol) per state: 0 = calm uptrend, 1 = volatile downtrend
+REGIMES = ((0.0006, 0.008), (-0.0008, 0.018))
+
+
+def regime_switching_gbm(n, seed=0, switch_prob=0.01, start=100.0, regimes=REGIMES,
+                         start_date='2000-01-03', freq='B'):
+    """Close prices plus the true state of every bar.
+
+    Returns a DataFrame with Close and State, indexed by date (business
+    days by default, pass freq='min' for minute bars).
+    """
+    rng = np.random.default_rng(seed)
+    flips = rng.random(n) < switch_prob
+    flips[0] = False
+    state = np.cumsum(flips) % 2
+    drift = np.array([r[0] for r in regimes])[state]
+    vol = np.array([r[1] for r in regimes])[state]
+    log_ret = drift - 0.5 * vol ** 2 + vol * rng.standard_normal(n)
+    log_ret[0] = 0.0
+    close = start * np.exp(np.cumsum(log_ret))
+    index = pd.date_range(start_date, periods=n, freq=freq, name='Date')
+    return pd.DataFrame({'Close': close, 'State': state}, index=index)
+
+
+def regime_switching_paths(paths, n, seed=0, switch_prob=0.01, start=100.0, regimes=REGIMES):
+    """Many independent regime_switching_gbm paths as (paths x n) arrays.
+
+    Returns (close float64, state int8). Every path starts in state 0 on
+    bar 0; seed can be anything np.random.default_rng takes.
+    """
+    rng = np.random.default_rng(seed)
+    flips = rng.random((paths, n)) < switch_prob
+    flips[:, 0] = False
+    state = (np.cumsum(flips, axis=1) % 2).astype(np.int8)
+    drift = np.array([r[0] for r in regimes])[state]
+    vol = np.array([r[1] for r in regimes])[state]
+    log_ret = drift - 0.5 * vol ** 2 + vol * rng.standard_normal((paths, n))
+    log_ret[:, 0] = 0.0
+    close = start * np.exp(np.cumsum(log_ret, axis=1))
+    return close, state
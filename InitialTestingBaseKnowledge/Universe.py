@@ -0,0 +1,212 @@
+"""
+Universe mode: the exhaustion pipeline over a list of tickers at once.
+
+The closes (and dates) of every ticker are packed end to end into two
+shared memory blocks. Pool workers attach to those blocks once and slice
+their ticker out by offset, so no DataFrame gets pickled on the way in;
+only the small per-ticker result comes back. Everything is collected into
+one consolidated table (and optionally one long per-bar frame).
+
+With a Recorder (Instrument.py) every worker instruments its tickers'
+stages and ships the records back, so the stage timings come out per
+ticker as well as per run.
+
+Every worker also sends back a quantile sketch of its ticker's
+Signal_0_100 (QuantileSketch.py, a few KB). The parent merges those per
+group (sector, or the whole universe) into group-wide exhaustion
+thresholds without ever holding all the histories at once.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from Instrument import Recorder, stage
+from Pipeline import run_pipeline, latest_state
+from QuantileSketch import KLLSketch, merged
+
+OUTPUT_COLUMNS = ['Close', 'Return', 'KS_Score', 'Regime_Age', 'Fatigue_Multiplier',
+                  'Exhaustion_Signal', 'Signal_0_100', 'Exhaustion_Level', 'Trend']
+# one row per ticker: latest_state(), its thresholds, or just the Error
+SUMMARY_COLUMNS = ['Date', 'Close', 'Signal_0_100', 'Exhaustion_Level', 'Trend', 'Regime_Age',
+                   'Regime_Start', 'Regime_Days', 'Regime_Avg_Exhaustion', 'Regime_High_Periods',
+                   'Regimes', 'Bars', 'High_Threshold', 'Very_High_Threshold', 'Error']
+
+
+class SharedPrices:
+    """Close prices and dates for many tickers in shared memory."""
+
+    def __init__(self, closes):
+        self.tickers = list(closes)
+        lengths = [len(closes[t]) for t in self.tickers]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        total = int(self.offsets[-1])
+
+        self._close_shm = shared_memory.SharedMemory(create=True, size=max(8, total * 8))
+        self._date_shm = shared_memory.SharedMemory(create=True, size=max(8, total * 8))
+        self.close = np.ndarray(total, dtype=np.float64, buffer=self._close_shm.buf)
+        self.dates = np.ndarray(total, dtype=np.int64, buffer=self._date_shm.buf)
+        for t, lo, hi in zip(self.tickers, self.offsets[:-1], self.offsets[1:]):
+            series = closes[t]
+            self.close[lo:hi] = series.to_numpy(dtype=np.float64)
+            self.dates[lo:hi] = pd.DatetimeIndex(series.index).as_unit('ns').asi8
+
+    def spec(self):
+        # everything a worker needs to find its data, cheap to pickle
+        return (self._close_shm.name, self._date_shm.name, self.tickers, self.offsets)
+
+    def release(self):
+        # views into the blocks have to go before the blocks can close
+        self.close = self.dates = None
+        for shm in (self._close_shm, self._date_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_shared = {}
+
+
+def _attach(spec):
+    close_name, date_name, tickers, offsets = spec
+    total = int(offsets[-1])
+    # workers share the parent's resource tracker, so attaching here doesn't
+    # change who unlinks the blocks (the parent, in SharedPrices.release)
+    blocks = [shared_memory.SharedMemory(name=name) for name in (close_name, date_name)]
+    _shared['blocks'] = blocks
+    _shared['close'] = np.ndarray(total, dtype=np.float64, buffer=blocks[0].buf)
+    _shared['dates'] = np.ndarray(total, dtype=np.int64, buffer=blocks[1].buf)
+    _shared['tickers'] = tickers
+    _shared['offsets'] = offsets
+
+
+def _run_one(i, window, full, instrument=None, compact=False):
+    ticker = _shared['tickers'][i]
+    recorder = None if instrument is None else Recorder(ticker=ticker, **instrument)
+    records = [] if recorder is None else recorder.records
+    lo, hi = _shared['offsets'][i], _shared['offsets'][i + 1]
+    index = pd.DatetimeIndex(_shared['dates'][lo:hi].view('datetime64[ns]'), name='Date')
+    close = pd.Series(_shared['close'][lo:hi], index=index, name='Close', copy=False)
+    if hi - lo <= window:
+        return ticker, {'Error': f'only {hi - lo} bars, need more than {window}'}, None, records, None
+    try:
+        df, regimes, thresholds = run_pipeline(close, window=window, recorder=recorder,
+                                               compact=compact)
+        summary = latest_state(df, regimes)
+        summary['High_Threshold'], summary['Very_High_Threshold'] = thresholds
+        frame = df[OUTPUT_COLUMNS] if full else None
+        sketch = KLLSketch(seed=i).extend(df['Signal_0_100'].to_numpy())
+        return ticker, summary, frame, records, sketch
+    except Exception as e:
+        return ticker, {'Error': str(e)}, None, records, None
+
+
+def _run_one_star(args):
+    return _run_one(*args)
+
+
+def load_closes(tickers, store, source=None, start=None):
+    """Close series per ticker from a PriceStore, topped up from source if given."""
+    closes = {}
+    for ticker in tickers:
+        if source is not None:
+            store.update(ticker, source)
+        if store.rows(ticker) == 0:
+            continue
+        closes[ticker] = store.read(ticker, ['Close'], start=start)['Close']
+    return closes
+
+
+def run_universe(closes, workers=None, window=20, full=False, recorder=None, groups=None,
+                 levels=(0.75, 0.90), compact=False):
+    """Run the pipeline for every {ticker: close series}.
+
+    Returns (summary, frames): one row per ticker with its latest state, and
+    with full=True a long (Ticker, Date) per-bar frame, else None. Stage
+    records of every ticker are added to `recorder` if one is given.
+
+    groups maps ticker -> group (e.g. sector); tickers not in it, or all of
+    them without it, fall in 'ALL'. Each row gets its group's thresholds
+    from the merged sketches and its latest signal's level against them.
+    """
+    workers = workers or os.cpu_count() or 1
+    instrument = None if recorder is None else recorder.options()
+    jobs = [(i, window, full, instrument, compact) for i in range(len(closes))]
+
+    with SharedPrices(closes) as shared:
+        if workers == 1:
+            _shared.update(close=shared.close, dates=shared.dates,
+                           tickers=shared.tickers, offsets=shared.offsets)
+            # never leave views of the block behind once it is unlinked
+            try:
+                results = [_run_one(*job) for job in jobs]
+            finally:
+                _shared.clear()
+        else:
+            chunk = max(1, len(jobs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(shared.spec(),)) as pool:
+                results = list(pool.map(_run_one_star, jobs, chunksize=chunk))
+
+    if recorder is not None:
+        for _, _, _, records, _ in results:
+            recorder.extend(records)
+    # explicit columns, so no tickers (or only failed ones) still give the full table
+    summary = pd.DataFrame([dict(s, Ticker=t) for t, s, _, _, _ in results],
+                           columns=['Ticker'] + SUMMARY_COLUMNS).set_index('Ticker')
+    _group_levels(summary, {t: sk for t, _, _, _, sk in results if sk is not None},
+                  groups or {}, levels)
+    frames = None
+    if full:
+        parts = {t: f for t, _, f, _, _ in results if f is not None}
+        frames = pd.concat(parts, names=['Ticker', 'Date']) if parts else None
+    return summary, frames
+
+
+def _group_levels(summary, sketches, groups, levels):
+    summary['Group'] = [groups.get(t, 'ALL') for t in summary.index]
+    high, very_high = {}, {}
+    for group, members in summary.groupby('Group').groups.items():
+        parts = [sketches[t] for t in members if t in sketches]
+        if parts:
+            high[group], very_high[group] = merged(parts).quantile(levels)
+    summary['Group_High_Threshold'] = summary['Group'].map(high)
+    summary['Group_Very_High_Threshold'] = summary['Group'].map(very_high)
+    if 'Signal_0_100' in summary.columns:
+        signal = summary['Signal_0_100']
+        summary['Group_Level'] = np.where(
+            signal >= summary['Group_Very_High_Threshold'], 'Very High',
+            np.where(signal >= summary['Group_High_Threshold'], 'High', 'Normal'))
+
+
+def screen(tickers, store, source=None, workers=None, start=None, window=20,
+           output='universe_exhaustion.csv', full_output=None, recorder=None,
+           stage_log=None, groups=None, compact=False):
+    """Nightly screen: load, run, and write one consolidated CSV.
+
+    stage_log appends the recorder's stage records there as JSON lines.
+    """
+    if stage_log and recorder is None:
+        recorder = Recorder()
+    with stage(recorder, 'load', rows=len(tickers)):
+        closes = load_closes(tickers, store, source=source, start=start)
+    summary, frames = run_universe(closes, workers=workers, window=window,
+                                   full=full_output is not None, recorder=recorder, groups=groups,
+                                   compact=compact)
+    summary = summary.sort_values('Signal_0_100', ascending=False)
+    with stage(recorder, 'export', rows=len(summary)):
+        if output:
+            summary.to_csv(output)
+        if full_output and frames is not None:
+            frames.to_csv(full_output)
+    if stage_log:
+        recorder.dump(stage_log)
+    return summary
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules are plain scripts in InitialTestingBaseKnowledge, not a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'InitialTestingBaseKnowledge'))
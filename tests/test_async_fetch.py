@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from AsyncFetch import AsyncFetcher, MockPriceServer, YAHOO_PATH, refresh
+from PriceStore import COLUMNS, PriceStore
+
+
+def make_bars(n, start='2024-01-02'):
+    index = pd.bdate_range(start, periods=n, name='Date')
+    close = 100 + np.arange(n, dtype='float64')
+    return pd.DataFrame({'Open': close - 0.5, 'High': close + 1, 'Low': close - 1,
+                         'Close': close, 'Volume': np.full(n, 1e6)}, index=index)
+
+
+def fetcher(server, **kwargs):
+    return AsyncFetcher(server.url, concurrency=4, rate=1000, backoff=0.01, **kwargs)
+
+
+def test_retries_through_503s(tmp_path):
+    bars = {'SPY': make_bars(30), 'QQQ': make_bars(30)}
+    store = PriceStore(str(tmp_path))
+    with MockPriceServer(bars, fail_first=2) as server:
+        f = fetcher(server, retries=3)
+        report = refresh(store, ['SPY', 'QQQ'], f)
+    assert report == {t: {'added': 30, 'error': None} for t in bars}
+    assert f.stats['retries'] == 4
+    assert server.hits == {'SPY': 3, 'QQQ': 3}
+
+
+def test_gives_up_after_the_retries(tmp_path):
+    with MockPriceServer({'SPY': make_bars(30)}, fail_first=5) as server:
+        report = refresh(PriceStore(str(tmp_path)), ['SPY'], fetcher(server, retries=2))
+    assert report['SPY']['added'] == 0
+    assert '503' in report['SPY']['error']
+
+
+def test_unknown_ticker_is_an_error(tmp_path):
+    with MockPriceServer({'SPY': make_bars(30)}) as server:
+        report = refresh(PriceStore(str(tmp_path)), ['SPY', 'NOPE'], fetcher(server))
+    assert report['SPY'] == {'added': 30, 'error': None}
+    assert report['NOPE']['added'] == 0
+    assert '404' in report['NOPE']['error']
+
+
+def test_top_up_only_adds_the_new_bars(tmp_path):
+    bars = make_bars(40)
+    store = PriceStore(str(tmp_path))
+    served = {'SPY': bars.iloc[:30]}
+    with MockPriceServer(served) as server:
+        refresh(store, ['SPY'], fetcher(server))
+        served['SPY'] = bars
+        first = server.hits['SPY']
+        report = refresh(store, ['SPY'], fetcher(server))
+        # up to date: one more request, nothing added
+        again = refresh(store, ['SPY'], fetcher(server))
+    assert report['SPY'] == {'added': 10, 'error': None}
+    assert again['SPY'] == {'added': 0, 'error': None}
+    assert server.hits['SPY'] == first + 2
+    out = store.read('SPY')
+    assert out.index.equals(bars.index)
+    np.testing.assert_array_equal(out[COLUMNS].to_numpy(), bars[COLUMNS].to_numpy())
+
+
+def test_yahoo_chart_format(tmp_path):
+    today = pd.Timestamp.now().normalize()
+    bars = make_bars(30, start=today - pd.Timedelta(days=60))
+    store = PriceStore(str(tmp_path))
+    with MockPriceServer({'SPY': bars}) as server:
+        report = refresh(store, ['SPY'], fetcher(server, path=YAHOO_PATH, fmt='yahoo'))
+    assert report['SPY'] == {'added': 30, 'error': None}
+    out = store.read('SPY')
+    assert out.index.equals(bars.index)
+    np.testing.assert_allclose(out['Close'].to_numpy(), bars['Close'].to_numpy())
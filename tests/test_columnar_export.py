@@ -0,0 +1,42 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from ColumnarExport import ColumnarStore
+
+
+def make_bars(n):
+    index = pd.bdate_range('2024-12-02', periods=n, name='Date')
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Close': 100 + rng.normal(size=n).cumsum(),
+        'Signal_0_100': rng.uniform(0, 100, n),
+        'Exhaustion_Level': rng.choice(['Normal', 'High', 'Very High'], n),
+        'Trend': rng.choice([-1, 1], n),
+    }, index=index)
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_parts_of_a_dead_run_are_not_read_twice(tmp_path, fmt):
+    store = ColumnarStore(str(tmp_path), fmt=fmt)
+    bars = make_bars(60)
+    store.append_bars('SPY', bars.iloc[:20])
+    meta_path = os.path.join(store._folder('bars', 'SPY'), '_meta.json')
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # a run that wrote its part and died before _meta.json
+    store.append_bars('SPY', bars.iloc[:30])
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    assert store.append_bars('SPY', bars.iloc[:40]) == 20
+    out = store.read_bars(['SPY'])
+    assert out.index.get_level_values('Date').equals(bars.index[:40])
+    assert store.compact('SPY') > 0
+    out = store.read_bars(['SPY'], columns=['Close'])
+    np.testing.assert_array_equal(out['Close'].to_numpy(), bars['Close'].to_numpy()[:40])
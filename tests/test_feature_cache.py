@@ -0,0 +1,121 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import FeatureCache as fc
+from FeatureCache import FeatureCache, data_hash, make_key
+
+
+def make_frame(n=50, tz=None):
+    index = pd.date_range('2021-01-01', periods=n, freq='D', tz=tz, name='Date')
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Close': rng.normal(100, 1, n),
+        'Regime': rng.integers(0, 2, n),
+        'Flag': rng.random(n) > 0.5,
+        'Level': pd.Categorical(rng.choice(['Normal', 'High'], n), categories=['Normal', 'High']),
+        'Name': rng.choice(['a', 'b'], n).astype(object),
+    }, index=index)
+
+
+def assert_same(got, df):
+    assert got.index.equals(df.index)
+    assert got.index.name == df.index.name
+    assert list(got.columns) == list(df.columns)
+    for col in df.columns:
+        assert list(got[col]) == list(df[col]), col
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    df = make_frame()
+    key = make_key('features', 'SPY', df['Close'], {'window': 20})
+    assert cache.get(key) is None
+    cache.put(key, df, kind='features', ticker='SPY')
+    assert_same(cache.get(key), df)
+    assert cache.stats == {'hits': 1, 'misses': 1, 'evicted': 0}
+    assert cache.entries()['key'].tolist() == [key]
+
+
+def test_tz_aware_index(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    df = make_frame(tz='America/New_York')
+    assert data_hash(df) != data_hash(df.tz_convert('UTC'))
+    key = make_key('features', 'SPY', df)
+    cache.put(key, df)
+    got = cache.get(key)
+    assert str(got.index.tz) == 'America/New_York'
+    assert_same(got, df)
+
+
+def test_cached_counts_one_miss_or_hit_per_call(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    df = make_frame()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return df
+
+    for _ in range(3):
+        for kind in ('features', 'regimes', 'labels'):
+            cache.cached(kind, 'SPY', df[['Close']], compute)
+    assert len(calls) == 3
+    assert cache.stats['misses'] == 3
+    assert cache.stats['hits'] == 6
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FeatureCache(str(tmp_path), budget=10 ** 9)
+    keys = []
+    for i in range(3):
+        key = make_key('features', f'T{i}', make_frame(20 + i))
+        cache.put(key, make_frame(20 + i))
+        keys.append(key)
+    # spread the last used times apart, then use the oldest entry again
+    for i, key in enumerate(keys):
+        used = time.time() - 100 + i
+        os.utime(os.path.join(str(tmp_path), key, 'meta.json'), (used, used))
+    cache.get(keys[0])
+    sizes = cache.entries().set_index('key')['bytes']
+    assert cache.evict(budget=sizes[keys[0]] + sizes[keys[2]]) == 1
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats['evicted'] == 1
+
+
+def test_interrupted_put_leaves_nothing(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path))
+    df = make_frame()
+    key = make_key('features', 'SPY', df)
+    save = np.save
+    written = []
+
+    def dying_save(path, values):
+        if written:
+            raise KeyboardInterrupt
+        written.append(path)
+        save(path, values)
+
+    monkeypatch.setattr(fc.np, 'save', dying_save)
+    with pytest.raises(KeyboardInterrupt):
+        cache.put(key, df)
+    monkeypatch.setattr(fc.np, 'save', save)
+    assert os.listdir(str(tmp_path)) == []
+    assert cache.get(key) is None
+    cache.put(key, df)
+    assert_same(cache.get(key), df)
+
+
+def test_stale_temp_folders_are_swept(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    stale = tmp_path / '.tmp-dead-run'
+    stale.mkdir()
+    (stale / '0.npy').write_bytes(b'half')
+    old = time.time() - 7200
+    os.utime(str(stale), (old, old))
+    cache.evict()
+    assert not stale.exists()
@@ -0,0 +1,37 @@
+import math
+
+import numpy as np
+import pytest
+
+from FeatureDrift import OnlinePointBiserial, rolling_pointbiserial
+
+
+def gappy(n=700, seed=1):
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=n)
+    b = rng.normal(size=n)
+    y = (rng.random(n) < 0.3).astype(float)
+    # scattered holes in one feature, a long one in the other, a few open labels
+    a[rng.random(n) < 0.1] = np.nan
+    b[100:160] = np.nan
+    y[rng.random(n) < 0.05] = np.nan
+    return {'a': a, 'b': b}, y
+
+
+@pytest.mark.parametrize('horizon', [0, 5])
+def test_online_matches_rolling_with_missing_data(horizon):
+    x, y = gappy()
+    windows = (60, 250)
+    online = OnlinePointBiserial(list(x), windows, horizon)
+    online.RESYNC_EVERY = 50
+    expected = {(f, w): rolling_pointbiserial(x[f], y, w, horizon) for f in x for w in windows}
+
+    for t in range(len(y)):
+        label = None
+        if t >= horizon and not math.isnan(y[t - horizon]):
+            label = y[t - horizon]
+        got = online.update({f: x[f][t] for f in x}, label)
+        for key, (r, p) in got.items():
+            ref_r, ref_p = expected[key][0][t], expected[key][1][t]
+            np.testing.assert_allclose([r, p], [ref_r, ref_p], rtol=1e-9, atol=1e-12,
+                                       err_msg=f'{key} at bar {t}')
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from FeatureEngine import compute_features, features_batch
+
+
+def make_close(n=600, gaps=True, seed=0):
+    rng = np.random.default_rng(seed)
+    close = pd.Series(100 * np.exp(np.cumsum(rng.standard_t(4, n) * 0.01)),
+                      index=pd.bdate_range('2015-01-01', periods=n))
+    if gaps:
+        # single missing prints and a run long enough to drop whole windows
+        close.iloc[[30, 31, 77, 200]] = np.nan
+        close.iloc[300:318] = np.nan
+    return close
+
+
+def pandas_reference(close, window=20, min_returns=10, per_window=False):
+    # what the old loop did: bar i looks at the returns inside close[i-window:i]
+    returns = np.log(close / close.shift(1))
+    rolling = returns.rolling(window - 1, min_periods=1)
+    if per_window:
+        # Series.skew() / kurt() of every window, as the loop called them
+        skew = rolling.apply(lambda r: pd.Series(r).skew(), raw=True)
+        kurt = rolling.apply(lambda r: pd.Series(r).kurt(), raw=True)
+    else:
+        skew = returns.rolling(window - 1, min_periods=3).skew()
+        kurt = returns.rolling(window - 1, min_periods=4).kurt()
+    out = pd.DataFrame({
+        'Return': rolling.sum(),
+        'Skewness': skew,
+        'Kurtosis': kurt,
+        'Range': rolling.max() - rolling.min(),
+        'count': rolling.count(),
+    }).shift(1)
+    out = out.iloc[window:]
+    return out[out['count'] >= min_returns].drop(columns='count')
+
+
+def assert_close(got, want, nan_ok=False):
+    for col in want.columns:
+        a, b = got[col].to_numpy(), want[col].to_numpy()
+        if nan_ok:
+            a, b = a[np.isfinite(b)], b[np.isfinite(b)]
+        np.testing.assert_allclose(a, b, rtol=1e-7, atol=1e-9, equal_nan=True, err_msg=col)
+
+
+@pytest.mark.parametrize('gaps', [False, True])
+@pytest.mark.parametrize('window', [5, 20, 60])
+def test_matches_pandas_skew_kurt(gaps, window):
+    close = make_close(gaps=gaps)
+    min_returns = min(10, window - 1)
+    got = compute_features(close, window=window, min_returns=min_returns)
+    # same bars kept: warm-up and windows with too few returns dropped
+    want = pandas_reference(close, window, min_returns, per_window=True)
+    assert got.index.equals(want.index)
+    assert_close(got, want)
+    # rolling().skew() / kurt() agree too; after a NaN gap pandas' own rolling
+    # skew can come out NaN where Series.skew() of the window has a value
+    rolling = pandas_reference(close, window, min_returns)
+    assert_close(got, rolling, nan_ok=gaps)
+    if not gaps:
+        assert rolling[['Skewness', 'Kurtosis']].notna().all().all()
+
+
+def test_warm_up_bars_are_dropped():
+    close = make_close(gaps=False)
+    got = compute_features(close, window=20)
+    assert got.index[0] == close.index[20]
+    assert len(got) == len(close) - 20
+    assert got[['Skewness', 'Kurtosis']].notna().all().all()
+
+
+def test_batch_matches_single_series():
+    paths = np.stack([make_close(300, gaps=False, seed=s).to_numpy() for s in range(3)])
+    batch = features_batch(paths, window=20)
+    for i, row in enumerate(paths):
+        single = compute_features(pd.Series(row), window=20)
+        for col in ('Return', 'Skewness', 'Kurtosis', 'Range'):
+            np.testing.assert_allclose(batch[col][i], single[col].to_numpy(), rtol=1e-9, atol=1e-12)
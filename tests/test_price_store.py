@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from PriceStore import COLUMNS, PriceStore, recent_closes
+
+
+def make_bars(n, start='2020-01-01'):
+    index = pd.bdate_range(start, periods=n)
+    return pd.DataFrame({c: np.arange(n, dtype='float64') + i for i, c in enumerate(COLUMNS)},
+                        index=index)
+
+
+def test_append_and_read(tmp_path):
+    store = PriceStore(str(tmp_path))
+    bars = make_bars(10)
+    assert store.append('spy', bars.iloc[:6]) == 6
+    # overlapping bars are skipped, only the newer ones go in
+    assert store.append('SPY', bars) == 4
+    assert store.rows('SPY') == 10
+    assert store.last_timestamp('SPY') == bars.index[-1]
+    out = store.read('SPY')
+    assert out.index.equals(bars.index)
+    np.testing.assert_array_equal(out.to_numpy(), bars.to_numpy())
+
+
+def test_interrupted_append_is_cut_off(tmp_path):
+    store = PriceStore(str(tmp_path))
+    bars = make_bars(10)
+    store.append('SPY', bars.iloc[:5])
+    # an append that died after writing some column bytes but before meta.json
+    folder = os.path.join(str(tmp_path), 'SPY')
+    for name in os.listdir(folder):
+        if name.endswith('.bin'):
+            with open(os.path.join(folder, name), 'ab') as f:
+                f.write(b'\xff' * 24)
+    assert store.rows('SPY') == 5
+    assert store.append('SPY', bars) == 5
+    out = store.read('SPY')
+    assert out.index.equals(bars.index)
+    np.testing.assert_array_equal(out.to_numpy(), bars.to_numpy())
+    assert os.path.getsize(os.path.join(folder, 'Close.bin')) == 10 * 8
+
+
+def test_recent_closes_without_any_bars(tmp_path):
+    with pytest.raises(ValueError):
+        recent_closes('NOPE', root=str(tmp_path / 'store'), offline_dir=str(tmp_path))
+
+
+def test_recent_closes_offline(tmp_path):
+    bars = make_bars(600, start='2018-01-01')
+    bars.to_csv(tmp_path / 'SPY.csv')
+    closes = recent_closes('SPY', years=1, root=str(tmp_path / 'store'), offline_dir=str(tmp_path))
+    assert list(closes.columns) == ['Close']
+    assert closes.index[-1] == bars.index[-1]
+    assert closes.index[0] >= bars.index[-1] - pd.DateOffset(years=1)
+
+
+class ListSource:
+    """Serves whatever bars it currently holds, like FileSource."""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+
+    def fetch(self, ticker, start=None):
+        self.calls.append(start)
+        bars = self.bars
+        return bars if start is None else bars[bars.index >= pd.Timestamp(start)]
+
+
+def test_update_replaces_the_last_bar(tmp_path):
+    store = PriceStore(str(tmp_path))
+    bars = make_bars(30)
+    intraday = bars.iloc[:20].copy()
+    intraday.iloc[-1, intraday.columns.get_loc('Close')] -= 0.5
+    source = ListSource(intraday)
+    store.update('SPY', source)
+    source.bars = bars
+    out = store.update('SPY', source)
+    assert store.rows('SPY') == 30
+    np.testing.assert_array_equal(out.to_numpy(), bars.to_numpy())
+
+
+def test_update_rewrites_a_readjusted_history(tmp_path):
+    store = PriceStore(str(tmp_path))
+    bars = make_bars(30)
+    source = ListSource(bars.iloc[:20])
+    store.update('SPY', source)
+    # a dividend after bar 20 scales every earlier price down
+    adjusted = bars.copy()
+    prices = ['Open', 'High', 'Low', 'Close']
+    adjusted.loc[adjusted.index[:25], prices] *= 0.99
+    source.bars = adjusted
+    out = store.update('SPY', source)
+    np.testing.assert_allclose(out.to_numpy(), adjusted.to_numpy())
+    assert source.calls[-1] == bars.index[0].date()
+
+
+def test_top_up_flags_a_readjusted_history(tmp_path):
+    store = PriceStore(str(tmp_path))
+    bars = make_bars(20)
+    store.append('SPY', bars)
+    start = store.refetch_start('SPY')
+    assert start == bars.index[-6].date()
+    fresh = bars[bars.index >= pd.Timestamp(start)].copy()
+    assert store.top_up('SPY', fresh) == 0
+    fresh['Close'] *= 1.01
+    assert store.top_up('SPY', fresh) is None
+    np.testing.assert_array_equal(store.read('SPY').to_numpy(), bars.to_numpy())